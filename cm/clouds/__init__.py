@@ -1,15 +1,110 @@
+import threading
+import time
+
 from cm.util import misc
 from cm.util import paths
 
 import logging
 log = logging.getLogger('cloudman')
 
+# Number of seconds responses of the cloud API describing resources of the
+# given type are reused for (0 disables caching for the resource type)
+DEFAULT_CACHE_TTLS = {'instances': 10, 'volumes': 10, 'snapshots': 30}
+# Resource ID prefix -> resource type
+RESOURCE_ID_PREFIXES = {'i-': 'instances', 'vol-': 'volumes', 'snap-': 'snapshots'}
+
+
+def _cache_key(value):
+    """
+    Return a hashable (and order-independent for dicts) representation of
+    the arguments of a cloud API request.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _cache_key(v)) for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_cache_key(v) for v in value)
+    return value
+
+
+class ResponseCache(object):
+    """
+    Cache responses of the cloud API for a per-resource-type time to live
+    (``ttls``, a dict mapping the resource type to a number of seconds), and
+    keep hit/miss counts per resource type.
+    """
+    def __init__(self, ttls=None):
+        self.ttls = dict(DEFAULT_CACHE_TTLS)
+        self.ttls.update(ttls or {})
+        self.entries = {}  # (resource type, request key) -> (time fetched, response)
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def get(self, resource_type, key, fetch, max_age=None):
+        """
+        Return the cached response for request ``key`` about resources of
+        ``resource_type`` if it is younger than ``max_age`` seconds (the TTL of
+        the resource type by default); otherwise, call ``fetch`` to get a fresh
+        response and cache it. Expired responses (of any resource type) are
+        dropped along the way so requests that are not repeated do not pile up.
+        """
+        if max_age is None:
+            max_age = self.ttls.get(resource_type, 0)
+        key = (resource_type, _cache_key(key))
+        with self.lock:
+            self._prune()
+            entry = self.entries.get(key)
+            if entry and max_age > 0 and time.time() - entry[0] < max_age:
+                self.hits[resource_type] = self.hits.get(resource_type, 0) + 1
+                return entry[1]
+            self.misses[resource_type] = self.misses.get(resource_type, 0) + 1
+        response = fetch()
+        if self.ttls.get(resource_type, 0) > 0:
+            with self.lock:
+                self.entries[key] = (time.time(), response)
+        return response
+
+    def _prune(self):
+        """
+        Drop the cached responses that are older than the TTL of their
+        resource type. Call with ``self.lock`` held.
+        """
+        now = time.time()
+        for key, (fetched, _) in self.entries.items():
+            if now - fetched >= self.ttls.get(key[0], 0):
+                del self.entries[key]
+
+    def invalidate(self, resource_type=None):
+        """
+        Drop the cached responses about resources of ``resource_type`` (all
+        the cached responses if ``None``).
+        """
+        with self.lock:
+            for key in self.entries.keys():
+                if resource_type is None or key[0] == resource_type:
+                    del self.entries[key]
+
+    def stats(self):
+        """
+        Return a dict mapping each resource type to its number of cache
+        ``hits``, ``misses`` and currently cached ``entries``.
+        """
+        with self.lock:
+            stats = {}
+            for resource_type in set(self.ttls.keys() + self.hits.keys() + self.misses.keys()):
+                stats[resource_type] = {
+                    'hits': self.hits.get(resource_type, 0),
+                    'misses': self.misses.get(resource_type, 0),
+                    'entries': len([k for k in self.entries if k[0] == resource_type])}
+            return stats
+
 
 class CloudInterface(object):
     # Global fields
     ec2_conn = None
     s3_conn = None
     tags_supported = False
+    supports_volume_resize = False  # Whether volumes can be grown while attached
     tags = {}
     # Instance details
     ami = None
@@ -69,8 +164,77 @@ class CloudInterface(object):
         """
         return vars(self)
 
+    def prime_metadata(self):
+        """ Some data about the current instance is slow to obtain because a
+            call to the cloud middleware is required. Load the data that does
+            not change over the lifetime of the instance ahead of it being
+            needed. Override this method if the cloud provides a more efficient
+            way of doing so.
+        """
+        self.get_ami()
+        self.get_zone()
+        self.get_key_pair_name()
+        self.get_security_groups()
+        self.get_private_ip()
+        self.get_public_ip()
+        self.get_local_hostname()
+
+    def get_response_cache(self):
+        """ Return the cache of cloud API responses for this interface. The
+            cache is created on first use (rather than as a class field) so it
+            is not shared between interface objects and picks up the TTLs
+            configured in the user data.
+        """
+        if vars(self).get('response_cache') is None:
+            config = getattr(getattr(self, 'app', None), 'config', None)
+            self.response_cache = ResponseCache(getattr(config, 'cloud_cache_ttls', None))
+        return self.response_cache
+
+    def cached_request(self, resource_type, key, fetch, max_age=None):
+        """ Return the response of a cloud API request describing resources of
+            ``resource_type``, calling ``fetch`` only if there is no cached
+            response for the request (identified by ``key``) younger than
+            ``max_age`` seconds (see ``ResponseCache.get``).
+        """
+        return self.get_response_cache().get(resource_type, key, fetch, max_age)
+
+    def invalidate_cache(self, resource_type=None):
+        """ Drop the cached responses about resources of ``resource_type``
+            ('instances', 'volumes' or 'snapshots'; all if ``None``). Call this
+            after changing resources of the given type.
+        """
+        self.get_response_cache().invalidate(resource_type)
+
+    def invalidate_cache_for(self, resource_id):
+        """ Drop the cached responses about resources of the same type as the
+            resource with ID ``resource_id``.
+        """
+        for prefix, resource_type in RESOURCE_ID_PREFIXES.iteritems():
+            if str(resource_id).startswith(prefix):
+                self.invalidate_cache(resource_type)
+
+    def get_cache_stats(self):
+        return self.get_response_cache().stats()
+
+    def get_all_snapshots(self, snapshot_ids=None, max_age=None, **kwargs):
+        """ Return the snapshots with the given IDs (reusing a recent response
+            for the same request if there is one).
+        """
+        if snapshot_ids and not isinstance(snapshot_ids, list):
+            snapshot_ids = [snapshot_ids]
+        return self.cached_request('snapshots', (snapshot_ids, kwargs),
+            lambda: self.get_ec2_connection().get_all_snapshots(snapshot_ids, **kwargs),
+            max_age)
+
     # Non-implemented methods
 
+    def resize_volume(self, volume_id, new_size):
+        """ Grow volume ``volume_id`` to ``new_size`` GB in place (i.e., while
+            it stays attached). Return ``True`` if the resize was initiated.
+        """
+        log.warning("Unimplemented")
+        return False
+
     def get_local_hostname(self):
         log.warning("Unimplemented")
         pass
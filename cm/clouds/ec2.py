@@ -1,3 +1,5 @@
+import math
+import threading
 import time
 import urllib
 import socket
@@ -10,6 +12,8 @@ from boto.ec2.connection import EC2Connection
 
 
 from cm.clouds import CloudInterface
+from cm.clouds.metadata import InstanceMetadata
+from cm.util import paths
 from cm.util.master import Instance
 from cm.util.decorators import TestFlag
 
@@ -18,11 +22,18 @@ log = logging.getLogger('cloudman')
 
 
 class EC2Interface(CloudInterface):
+    metadata = None  # Instance metadata, loaded on first use
+    metadata_lock = threading.Lock()
+    # ModifyVolume is not available in the (older) EC2 API version boto uses
+    # by default
+    VOLUME_MODIFICATION_API_VERSION = '2016-11-15'
+    volume_modification_conn = None
 
     def __init__(self, app=None):
         super(EC2Interface, self).__init__()
         self.app = app
         self.tags_supported = True
+        self.supports_volume_resize = True
         self.update_frequency = 60
         self.public_hostname_updated = time.time()
         self.set_configuration()
@@ -31,6 +42,23 @@ class EC2Interface(CloudInterface):
         except:
             pass
 
+    def get_metadata(self, key, max_age=None):
+        """
+        Return the instance metadata entry ``key`` (e.g., ``instance-type``).
+        All the metadata entries are loaded at once on first use (see
+        ``cm.clouds.metadata``).
+        """
+        with self.metadata_lock:
+            if self.metadata is None:
+                self.metadata = InstanceMetadata(paths.INSTANCE_METADATA_FILE)
+        return self.metadata.get(key, max_age)
+
+    def prime_metadata(self):
+        if self.app.TESTFLAG is True:
+            log.debug("Attempted to prime instance metadata, but TESTFLAG is set.")
+            return
+        self.get_metadata('instance-id')
+
     def get_ami(self):
         if self.ami is None:
             if self.app.TESTFLAG is True:
@@ -38,33 +66,13 @@ class EC2Interface(CloudInterface):
                     "Attempted to get key pair name, but TESTFLAG is set. Returning 'ami-l0cal1'")
                 self.ami = 'ami-l0cal1'
                 return self.ami
-            for i in range(0, 5):
-                try:
-                    log.debug('Gathering instance ami, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/ami-id')
-                    self.ami = fp.read()
-                    fp.close()
-                    if self.ami:
-                        break
-                except IOError:
-                    pass
+            self.ami = self.get_metadata('ami-id')
         return self.ami
 
     @TestFlag('something.good')
     def get_type(self):
         if self.instance_type is None:
-            for i in range(0, 5):
-                try:
-                    log.debug('Gathering instance type, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/instance-type')
-                    self.instance_type = fp.read()
-                    fp.close()
-                    if self.instance_type:
-                        break
-                except IOError:
-                    pass
+            self.instance_type = self.get_metadata('instance-type')
         return self.instance_type
 
     def get_instance_id(self):
@@ -74,18 +82,8 @@ class EC2Interface(CloudInterface):
                     "Attempted to get instance ID, but TESTFLAG is set. Returning 'id-LOCAL'")
                 self.instance_id = 'id-LOCAL'
                 return self.instance_id
-            for i in range(0, 5):
-                try:
-                    log.debug('Gathering instance id, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/instance-id')
-                    self.instance_id = fp.read()
-                    fp.close()
-                    if self.instance_id:
-                        log.debug("Instance ID is '%s'" % self.instance_id)
-                        break
-                except IOError:
-                    pass
+            self.instance_id = self.get_metadata('instance-id')
+            log.debug("Instance ID is '%s'" % self.instance_id)
         return self.instance_id
 
     def get_instance_object(self):
@@ -114,18 +112,8 @@ class EC2Interface(CloudInterface):
                     "Attempted to get instance zone, but TESTFLAG is set. Returning 'us-east-1a'")
                 self.zone = 'us-east-1a'
                 return self.zone
-            for i in range(0, 5):
-                try:
-                    log.debug('Gathering instance zone, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/placement/availability-zone')
-                    self.zone = fp.read()
-                    fp.close()
-                    if self.zone:
-                        log.debug("Instance zone is '%s'" % self.zone)
-                        break
-                except IOError:
-                    pass
+            self.zone = self.get_metadata('placement/availability-zone')
+            log.debug("Instance zone is '%s'" % self.zone)
         return self.zone
 
     def get_security_groups(self):
@@ -134,21 +122,10 @@ class EC2Interface(CloudInterface):
                 log.debug("Attempted to get security groups, but TESTFLAG is set. Returning 'cloudman_sg'")
                 self.security_groups = ['cloudman_sg']
                 return self.security_groups
-            for i in range(0, 5):
-                try:
-                    log.debug(
-                        'Gathering instance security group, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/security-groups')
-                    self.security_groups = []
-                    for line in fp.readlines():
-                        self.security_groups.append(
-                            urllib.unquote_plus(line.strip()))
-                    fp.close()
-                    if self.security_groups:
-                        break
-                except IOError:
-                    pass
+            security_groups = self.get_metadata('security-groups')
+            if security_groups:
+                self.security_groups = [urllib.unquote_plus(line.strip())
+                                        for line in security_groups.splitlines() if line.strip()]
         return self.security_groups
 
     def get_key_pair_name(self):
@@ -158,20 +135,11 @@ class EC2Interface(CloudInterface):
                     "Attempted to get key pair name, but TESTFLAG is set. Returning 'local_keypair'")
                 self.key_pair_name = 'local_keypair'
                 return self.key_pair_name
-            for i in range(0, 5):
-                try:
-                    log.debug(
-                        'Gathering instance public keys (i.e., key pairs), attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/public-keys')
-                    public_keys = fp.read()
-                    self.key_pair_name = public_keys.split('=')[1]
-                    fp.close()
-                    if self.key_pair_name:
-                        log.debug("Got key pair: '%s'" % self.key_pair_name)
-                        break
-                except IOError:
-                    pass
+            # The public keys are listed as '<index>=<key pair name>'
+            public_keys = self.get_metadata('public-keys')
+            if public_keys and '=' in public_keys:
+                self.key_pair_name = public_keys.splitlines()[0].split('=', 1)[1]
+                log.debug("Got key pair: '%s'" % self.key_pair_name)
         return self.key_pair_name
 
     def get_private_ip(self):
@@ -181,19 +149,7 @@ class EC2Interface(CloudInterface):
                     "Attempted to get private ip, but TESTFLAG is set. Returning '127.0.0.1'")
                 self.self_private_ip = '127.0.0.1'
                 return self.self_private_ip
-            for i in range(0, 5):
-                try:
-                    log.debug('Gathering instance private IP, attempt %s' % i)
-                    # fp = urllib.urlopen('http://169.254.169.254/latest/meta-
-                    # data/local-hostname')
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/local-ipv4')
-                    self.self_private_ip = fp.read()
-                    fp.close()
-                    if self.self_private_ip:
-                        break
-                except IOError:
-                    pass
+            self.self_private_ip = self.get_metadata('local-ipv4')
         return self.self_private_ip
 
     def get_local_hostname(self):
@@ -203,18 +159,7 @@ class EC2Interface(CloudInterface):
                     "Attempted to get local hostname, but TESTFLAG is set. Returning 'localhost'")
                 self.local_hostname = 'localhost'
                 return self.local_hostname
-            for i in range(0, 5):
-                try:
-                    log.debug(
-                        'Gathering instance local hostname, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/local-hostname')
-                    self.local_hostname = fp.read()
-                    fp.close()
-                    if self.local_hostname:
-                        break
-                except IOError:
-                    pass
+            self.local_hostname = self.get_metadata('local-hostname')
         return self.local_hostname
 
     def get_public_hostname(self):
@@ -229,19 +174,10 @@ class EC2Interface(CloudInterface):
             self.public_hostname_updated = time.time()
             return self.public_hostname
         if self.public_hostname is None or (time.time() - self.public_hostname_updated > self.update_frequency):
-            for i in range(0, 5):
-                try:
-                    log.debug(
-                        'Gathering instance public hostname, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/public-hostname')
-                    self.public_hostname = fp.read()
-                    fp.close()
-                    if self.public_hostname:
-                        self.public_hostname_updated = time.time()
-                        break
-                except Exception, e:
-                    log.error("Error retrieving FQDN: %s" % e)
+            public_hostname = self.get_metadata('public-hostname', max_age=self.update_frequency)
+            if public_hostname:
+                self.public_hostname = public_hostname
+                self.public_hostname_updated = time.time()
         return self.public_hostname
 
     def get_public_ip(self):
@@ -250,19 +186,7 @@ class EC2Interface(CloudInterface):
                 log.debug("Attempted to get public IP, but TESTFLAG is set. Returning '127.0.0.1'")
                 self.self_public_ip = '127.0.0.1'
                 return self.self_public_ip
-            for i in range(0, 5):
-                try:
-                    log.debug(
-                        'Gathering instance public hostname, attempt %s' % i)
-                    fp = urllib.urlopen(
-                        'http://169.254.169.254/latest/meta-data/public-ipv4')
-                    self.self_public_ip = fp.read()
-                    fp.close()
-                    if self.self_public_ip:
-                        break
-                except Exception, e:
-                    log.error("Error retrieving FQDN: %s" % e)
-
+            self.self_public_ip = self.get_metadata('public-ipv4')
         return self.self_public_ip
 
     def get_fqdn(self):
@@ -365,6 +289,8 @@ class EC2Interface(CloudInterface):
         resource_tags = self.tags.get(resource.id, {})
         resource_tags[key] = value
         self.tags[resource.id] = resource_tags
+        # Cached descriptions of the resource carry the old tags
+        self.invalidate_cache_for(resource.id)
 
     def get_tag(self, resource, key):
         """ Get tag on `resource` cloud object. Return None if tag does not exist.
@@ -385,6 +311,11 @@ class EC2Interface(CloudInterface):
         return value
 
     def run_instances(self, num, instance_type, spot_price=None, **kwargs):
+        """
+        Start ``num`` worker instances of ``instance_type`` (as spot instances
+        if ``spot_price`` is provided) and return the list of started boto
+        instances (or spot requests).
+        """
         use_spot = False
         if spot_price is not None:
             use_spot = True
@@ -392,18 +323,98 @@ class EC2Interface(CloudInterface):
             num, 'spot' if use_spot else 'on-demand'))
         if self.app.TESTFLAG is True:
             log.debug("Attempted to start instance(s), but TESTFLAG is set.")
-            return
+            return []
         worker_ud = self._compose_worker_user_data()
         # log.debug( "Worker user data: %s " % worker_ud )
         if instance_type == '':
             instance_type = self.get_type()
+        self.invalidate_cache('instances')
         if use_spot:
-            self._make_spot_request(num, instance_type, spot_price, worker_ud)
+            return self._make_spot_request(num, instance_type, spot_price, worker_ud)
         else:
-            self._run_ondemand_instances(
+            return self._run_ondemand_instances(
                 num, instance_type, spot_price, worker_ud)
 
-    def _run_ondemand_instances(self, num, instance_type, spot_price, worker_ud, min_num=1):
+    def run_fleet(self, target_slots, instance_types, spot_price=None, zones=None,
+                  max_waves=None):
+        """
+        Start enough worker instances to provide ``target_slots`` job slots,
+        using any of the acceptable ``instance_types``: a list of
+        ``(instance_type, slots)`` tuples in order of preference, where
+        ``slots`` is the weight (i.e., number of job slots) of the given
+        type. Launches for the different types and ``zones`` (the master's
+        zone by default) are issued in parallel; after each wave of launches,
+        the number of slots actually started is reconciled with the target and
+        the shortfall is requested again from the types and zones that did
+        not run out of capacity. Return the number of slots started.
+        """
+        log.info("Adding worker instance(s) providing {0} slot(s) using instance type(s) {1}"
+                 .format(target_slots, ', '.join('{0} ({1} slots)'.format(t, w)
+                                                 for t, w in instance_types)))
+        if self.app.TESTFLAG is True:
+            log.debug("Attempted to start instance(s), but TESTFLAG is set.")
+            return 0
+        worker_ud = self._compose_worker_user_data()
+        zones = zones or [self.get_zone()]
+        self.invalidate_cache('instances')
+        # Each (instance type, zone) combination is a launch pool
+        pools = [(t or self.get_type(), max(1, int(w)), z)
+                 for t, w in instance_types for z in zones]
+        # Unless a wave reaches the target, at least one pool is exhausted in it
+        max_waves = max_waves or len(pools)
+        started_slots = 0
+        waves = 0
+        while started_slots < target_slots and pools and waves < max_waves:
+            waves += 1
+            remaining = target_slots - started_slots
+            # Spread the remaining slots over as many pools as there are
+            # instances needed, in order of preference
+            wave = pools[:int(math.ceil(float(remaining) / max(w for _, w, _ in pools)))] or pools[:1]
+            share = float(remaining) / len(wave)
+            launches = []
+            for instance_type, weight, zone in wave:
+                num = int(math.ceil(share / weight))
+                result = {'num': num, 'started': 0}
+                t = threading.Thread(target=self._launch_into_pool, args=(
+                    result, num, instance_type, zone, spot_price, worker_ud))
+                t.start()
+                launches.append(((instance_type, weight, zone), result, t))
+            for pool, result, t in launches:
+                t.join()
+                started_slots += result['started'] * pool[1]
+                if result['started'] < result['num']:
+                    # The pool ran out of capacity (or failed); don't retry it
+                    log.debug("Instance type {0} in zone {1}: started {2} of {3} requested "
+                              "instance(s)".format(pool[0], pool[2], result['started'], result['num']))
+                    pools.remove(pool)
+            log.debug("Fleet launch wave {0}: {1} of {2} slot(s) started".format(
+                waves, started_slots, target_slots))
+        if started_slots < target_slots:
+            log.warning("Could only start {0} of the requested {1} slot(s)".format(
+                started_slots, target_slots))
+        return started_slots
+
+    def _launch_into_pool(self, result, num, instance_type, zone, spot_price, worker_ud):
+        """
+        Request ``num`` instances of ``instance_type`` in ``zone`` and record
+        the number of instances (or spot requests) started in ``result``.
+        """
+        if spot_price is not None:
+            started = self._make_spot_request(num, instance_type, spot_price, worker_ud,
+                                              zone=zone)
+        else:
+            started = self._run_ondemand_instances(num, instance_type, spot_price,
+                                                   worker_ud, zone=zone)
+        result['started'] = len(started or [])
+
+    def _run_ondemand_instances(self, num, instance_type, spot_price, worker_ud, min_num=1,
+                                zone=None):
+        """
+        Start between ``min_num`` and ``num`` instances of ``instance_type``
+        in ``zone`` (the master's zone by default) and return the list of
+        boto instance objects that were started (empty if none were started).
+        """
+        zone = zone or self.get_zone()
         worker_ud_str = "\n".join(
             ['%s: %s' % (key, value) for key, value in worker_ud.iteritems()])
         log.debug("Starting instance(s) with the following command : ec2_conn.run_instances( "
@@ -412,7 +423,7 @@ class EC2Interface(CloudInterface):
                   .format(iid=self.get_ami(), min_num=min_num, num=num,
                     key=self.get_key_pair_name(), sgs=", ".join(self.get_security_groups()),
                     ud="\n".join(['%s: %s' % (key, value) for key, value in worker_ud.iteritems() if key not in['password', 'secret_key']]),
-                    type=instance_type, zone=self.get_zone()))
+                    type=instance_type, zone=zone))
         try:
             # log.debug( "Would be starting worker instance(s)..." )
             reservation = None
@@ -424,7 +435,7 @@ class EC2Interface(CloudInterface):
                                                  security_groups=self.get_security_groups(),
                                                  user_data=worker_ud_str,
                                                  instance_type=instance_type,
-                                                 placement=self.get_zone())
+                                                 placement=zone)
             time.sleep(3)  # Rarely, instances take a bit to register,
                            # so wait a few seconds (although this is a very poor
                            # 'solution')
@@ -442,18 +453,24 @@ class EC2Interface(CloudInterface):
         except BotoServerError, e:
             log.error(
                 "boto server error when starting an instance: %s" % str(e))
-            return False
+            return []
         except EC2ResponseError, e:
             err = "EC2 response error when starting worker nodes: %s" % str(e)
             log.error(err)
-            return False
+            return []
         except Exception, ex:
             err = "Error when starting worker nodes: %s" % str(ex)
             log.error(err)
-            return False
-        log.debug("Started %s instance(s)" % num)
+            return []
+        log.debug("Started %s instance(s)" % len(reservation.instances if reservation else []))
+        return reservation.instances if reservation else []
 
-    def _make_spot_request(self, num, instance_type, price, worker_ud):
+    def _make_spot_request(self, num, instance_type, price, worker_ud, zone=None):
+        """
+        Request ``num`` spot instances of ``instance_type`` in ``zone`` (the
+        master's zone by default) and return the list of spot requests made.
+        """
+        zone = zone or self.get_zone()
         worker_ud_str = "\n".join(
             ['%s: %s' % (key, value) for key, value in worker_ud.iteritems()])
         log.debug("Making a Spot request with the following command: "
@@ -462,7 +479,7 @@ class EC2Interface(CloudInterface):
                   "instance_type='{type}', placement='{zone}', user_data='{ud}')"
                   .format(price=price, iid=self.get_ami(), num=num, key=self.get_key_pair_name(),
                     sgs=", ".join(self.get_security_groups()), type=instance_type,
-                    zone=self.get_zone(), ud=worker_ud_str))
+                    zone=zone, ud=worker_ud_str))
         reqs = None
         try:
             ec2_conn = self.get_ec2_connection()
@@ -472,7 +489,7 @@ class EC2Interface(CloudInterface):
                                                    key_name=self.get_key_pair_name(),
                                                    security_groups=self.get_security_groups(),
                                                    instance_type=instance_type,
-                                                   placement=self.get_zone(),
+                                                   placement=zone,
                                                    user_data=worker_ud_str)
             if reqs is not None:
                 for req in reqs:
@@ -481,12 +498,14 @@ class EC2Interface(CloudInterface):
                     self.app.manager.worker_instances.append(i)
         except EC2ResponseError, e:
             log.error("Trouble issuing a spot instance request: {0}".format(e))
-            return False
+            return []
         except Exception, e:
             log.error("An error when making a spot request: {0}".format(e))
-            return False
+            return []
+        return reqs or []
 
     def terminate_instance(self, instance_id, spot_request_id=None):
+        self.invalidate_cache('instances')
         inst_terminated = request_canceled = True
         if instance_id is not None:
             inst_terminated = self._terminate_instance(instance_id)
@@ -520,6 +539,54 @@ class EC2Interface(CloudInterface):
                 "Exception terminating instance %s: %s" % (instance_id, ex))
         return False
 
+    def terminate_instances_batch(self, instances):
+        """
+        Terminate multiple instances with a single cloud request. ``instances``
+        is a list of ``(instance_id, spot_request_id)`` tuples (with
+        ``spot_request_id`` set to ``None`` for on-demand instances). Return a
+        dict mapping each ``instance_id`` to ``True`` if the instance was
+        terminated (and its spot request canceled), ``False`` otherwise.
+        """
+        instance_ids = [i for i, _ in instances if i is not None]
+        request_ids = [r for _, r in instances if r is not None]
+        terminated = dict((i, False) for i in instance_ids)
+        self.invalidate_cache('instances')
+        ec2_conn = self.get_ec2_connection()
+        if instance_ids:
+            try:
+                log.info("Terminating instances {0}".format(', '.join(instance_ids)))
+                ec2_conn.terminate_instances(instance_ids)
+                # First give the middleware a chance to register the termination
+                time.sleep(3)
+                found = set()
+                for r in ec2_conn.get_all_instances(instance_ids):
+                    for inst in r.instances:
+                        found.add(inst.id)
+                        terminated[inst.id] = inst.state in ('shutting-down', 'terminated')
+                for i in instance_ids:
+                    if i not in found:
+                        terminated[i] = True
+            except EC2ResponseError, e:
+                if e.errors and e.errors[0][0] == 'InstanceNotFound' and len(instance_ids) == 1:
+                    terminated[instance_ids[0]] = True
+                else:
+                    log.error("EC2 exception terminating instances {0}: {1}"
+                              .format(', '.join(instance_ids), e))
+            except Exception, ex:
+                log.error("Exception terminating instances {0}: {1}"
+                          .format(', '.join(instance_ids), ex))
+        if request_ids:
+            try:
+                log.debug("Canceling spot requests {0}".format(', '.join(request_ids)))
+                ec2_conn.cancel_spot_instance_requests(request_ids)
+            except EC2ResponseError, e:
+                log.error("Trouble canceling spot requests {0}: {1}".format(
+                    ', '.join(request_ids), e))
+                for instance_id, request_id in instances:
+                    if request_id is not None:
+                        terminated[instance_id] = False
+        return terminated
+
     def _cancel_spot_request(self, request_id):
         ec2_conn = self.get_ec2_connection()
         try:
@@ -545,9 +612,36 @@ class EC2Interface(CloudInterface):
         worker_ud = dict(self.app.ud.items() + worker_ud.items())
         return worker_ud
 
-    def get_all_volumes(self, volume_ids=None, filters=None):
+    def resize_volume(self, volume_id, new_size):
+        """
+        Grow volume ``volume_id`` to ``new_size`` GB in place (i.e., while it
+        stays attached) via the ModifyVolume API call. The resize happens
+        asynchronously; the new size becomes visible to the instance shortly
+        after the modification is accepted. Return ``True`` if the
+        modification was accepted.
+        """
+        if self.app.TESTFLAG is True:
+            log.debug("Attempted to resize volume {0}, but TESTFLAG is set.".format(volume_id))
+            return False
+        try:
+            if not self.volume_modification_conn:
+                self.volume_modification_conn = EC2Connection(
+                    self.aws_access_key, self.aws_secret_key, region=self.get_region(),
+                    api_version=self.VOLUME_MODIFICATION_API_VERSION)
+            self.volume_modification_conn.get_status(
+                'ModifyVolume', {'VolumeId': volume_id, 'Size': new_size}, verb='POST')
+            self.invalidate_cache('volumes')
+            log.debug("Initiated resize of volume {0} to {1}GB".format(volume_id, new_size))
+            return True
+        except EC2ResponseError, e:
+            log.error("Error resizing volume {0} to {1}GB: {2}".format(volume_id, new_size, e))
+            return False
+
+    def get_all_volumes(self, volume_ids=None, filters=None, max_age=None):
         """
-        Get all Volumes associated with the current credentials.
+        Get all Volumes associated with the current credentials. A response
+        to the same request that is younger than ``max_age`` seconds (the
+        volumes cache TTL by default; 0 forces a new request) is reused.
 
         :type volume_ids: list
         :param volume_ids: Optional list of volume IDs.  If this list
@@ -569,12 +663,16 @@ class EC2Interface(CloudInterface):
         """
         if volume_ids and not isinstance(volume_ids, list):
             volume_ids = [volume_ids]
-        return self.get_ec2_connection().get_all_volumes(volume_ids=volume_ids,
-            filters=filters)
+        return self.cached_request('volumes', (volume_ids, filters),
+            lambda: self.get_ec2_connection().get_all_volumes(volume_ids=volume_ids,
+                                                             filters=filters),
+            max_age)
 
-    def get_all_instances(self, instance_ids=None, filters=None):
+    def get_all_instances(self, instance_ids=None, filters=None, max_age=None):
         """
-        Retrieve all the instances associated with current credentials.
+        Retrieve all the instances associated with current credentials. A
+        response to the same request that is younger than ``max_age`` seconds
+        (the instances cache TTL by default; 0 forces a new request) is reused.
 
         :type instance_ids: list
         :param instance_ids: Optional list of strings of instance IDs.
@@ -594,4 +692,7 @@ class EC2Interface(CloudInterface):
         """
         if instance_ids and not isinstance(instance_ids, list):
             instance_ids = [instance_ids]
-        return self.get_ec2_connection().get_all_instances(instance_ids=instance_ids, filters=filters)
+        return self.cached_request('instances', (instance_ids, filters),
+            lambda: self.get_ec2_connection().get_all_instances(instance_ids=instance_ids,
+                                                               filters=filters),
+            max_age)
@@ -56,6 +56,7 @@ class EucaInterface(EC2Interface):
         super(EucaInterface, self).__init__()
         self.app = app
         self.tags_supported = False
+        self.supports_volume_resize = False
         self.local_hostname = None
         self.public_hostname = None
         self._min_boto_delay = 2
@@ -198,15 +199,35 @@ class EucaInterface(EC2Interface):
         log.info("Adding {0} instance(s)".format(num))
         if self.app.TESTFLAG is True:
             log.debug("Attempted to start instance(s), but TESTFLAG is set.")
-            return
+            return []
         worker_ud = self._compose_worker_user_data()
         # log.debug( "Worker user data: %s " % worker_ud )
         if instance_type == '':
             instance_type = self.get_type()
-        self._run_ondemand_instances(num, instance_type, spot_price, worker_ud,
-                                     min_num=num)  # eucalyptus only starts min_num instances
+        return self._run_ondemand_instances(num, instance_type, spot_price, worker_ud,
+                                            min_num=num)  # eucalyptus only starts min_num instances
 
-    def get_all_instances(self, instance_ids=None, filters=None):
+    def run_fleet(self, target_slots, instance_types, spot_price=None, **kwargs):
+        if spot_price is not None:
+            log.warning(
+                'Eucalyptus does not support spot instances -- submitting normal request')
+        return super(EucaInterface, self).run_fleet(target_slots, instance_types, **kwargs)
+
+    def _launch_into_pool(self, result, num, instance_type, zone, spot_price, worker_ud):
+        started = self._run_ondemand_instances(num, instance_type, spot_price, worker_ud,
+                                               min_num=num,  # eucalyptus only starts min_num instances
+                                               zone=zone)
+        result['started'] = len(started or [])
+
+    def invalidate_cache(self, resource_type=None):
+        super(EucaInterface, self).invalidate_cache(resource_type)
+        # Also drop the responses cached to avoid overloading eucalyptus
+        if resource_type in (None, 'instances'):
+            self._instances = {}
+        if resource_type in (None, 'volumes'):
+            self._volumes = {}
+
+    def get_all_instances(self, instance_ids=None, filters=None, max_age=None):
 
         if isinstance(instance_ids, basestring):
             instance_ids = (instance_ids,)
@@ -217,7 +238,7 @@ class EucaInterface(EC2Interface):
             cache_key = ''
 
         # eucalyptus stops responding if you check the same thing too often
-        if self._last_instance_check and cache_key in self._instances and time.time() <= self._last_instance_check + self._min_boto_delay:
+        if max_age != 0 and self._last_instance_check and cache_key in self._instances and time.time() <= self._last_instance_check + self._min_boto_delay:
             log.debug('Using cached instance information for {0}'.format(
                 str(instance_ids)))
             reservations = self._instances[cache_key]
@@ -250,7 +271,7 @@ class EucaInterface(EC2Interface):
 
         return res
 
-    def get_all_volumes(self, volume_ids=None, filters=None):
+    def get_all_volumes(self, volume_ids=None, filters=None, max_age=None):
         # eucalyptus does not allow filters in get_all_volumes
         if isinstance(volume_ids, basestring):
             volume_ids = (volume_ids,)
@@ -261,7 +282,7 @@ class EucaInterface(EC2Interface):
             cache_key = ''
 
         # eucalyptus stops responding if you check too often
-        if self._last_volume_check and cache_key in self._volumes and time.time() <= self._last_volume_check + self._min_boto_delay:
+        if max_age != 0 and self._last_volume_check and cache_key in self._volumes and time.time() <= self._last_volume_check + self._min_boto_delay:
             volumes = self._volumes[cache_key]
         else:
             # need to go this roundabout way to get the volume because euca does not filter the get_all_volumes request by the volume ID,
@@ -0,0 +1,167 @@
+"""
+Access to the instance metadata service (http://169.254.169.254).
+
+All the metadata entries CloudMan uses are fetched concurrently, in a single
+pass, the first time any of them is needed and are then served from memory.
+Entries that do not change over the lifetime of an instance are also stored
+in a local file, keyed by the instance ID, so a restarted CloudMan does not
+need to fetch them again.
+"""
+import json
+import os
+import threading
+import time
+import urllib
+
+import logging
+log = logging.getLogger('cloudman')
+
+METADATA_URL = 'http://169.254.169.254/latest/meta-data/'
+# Metadata entries that do not change over the lifetime of an instance
+IMMUTABLE_KEYS = ['ami-id', 'instance-id', 'instance-type',
+                  'placement/availability-zone', 'security-groups',
+                  'public-keys']
+# Metadata entries that can change (e.g., when an Elastic IP is associated or,
+# for the private address and hostname, when the instance is stopped and
+# started again)
+MUTABLE_KEYS = ['public-hostname', 'public-ipv4', 'local-ipv4', 'local-hostname']
+
+
+class InstanceMetadata(object):
+    """
+    In-memory copy of the instance metadata, backed by ``cache_file`` (if
+    provided) for the immutable entries.
+    """
+    def __init__(self, cache_file=None, url=METADATA_URL, attempts=5):
+        self.cache_file = cache_file
+        self.url = url
+        self.attempts = attempts
+        self.values = {}
+        self.fetched = {}  # key -> time the value was fetched
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    def _fetch(self, key):
+        """
+        Fetch metadata entry ``key`` from the metadata service, retrying a
+        few times. Return ``None`` if the entry could not be fetched.
+        """
+        for i in range(self.attempts):
+            try:
+                fp = urllib.urlopen(self.url + key)
+                try:
+                    code = fp.getcode()
+                    value = fp.read()
+                finally:
+                    fp.close()
+                if value and code in (None, 200):
+                    return value
+                if code == 404:
+                    # Not available on this instance (e.g., no public IP)
+                    return None
+            except IOError, e:
+                log.debug("Trouble fetching instance metadata {0} (attempt {1}): {2}"
+                          .format(key, i, e))
+        return None
+
+    def _fetch_all(self, keys):
+        """
+        Fetch all the metadata entries in ``keys`` concurrently and return a
+        dict with the ones that could be fetched.
+        """
+        results = {}
+
+        def fetch(key):
+            results[key] = self._fetch(key)
+        threads = [threading.Thread(target=fetch, args=(key,)) for key in keys]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        now = time.time()
+        for key in keys:
+            if results.get(key):
+                self.fetched[key] = now
+        return dict((k, v) for k, v in results.iteritems() if v)
+
+    def _read_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+            if not isinstance(cached, dict):
+                return {}
+            # Keep only well-formed immutable entries
+            return dict((k, v) for k, v in cached.iteritems()
+                        if k in IMMUTABLE_KEYS and v and isinstance(v, basestring))
+        except (IOError, ValueError), e:
+            log.debug("Ignoring instance metadata cache file {0}: {1}".format(
+                      self.cache_file, e))
+            return {}
+
+    def _write_cache(self):
+        if not self.cache_file:
+            return
+        immutable = dict((k, v) for k, v in self.values.iteritems() if k in IMMUTABLE_KEYS)
+        try:
+            cache_dir = os.path.dirname(self.cache_file)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(immutable, f)
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError), e:
+            log.debug("Could not save instance metadata to {0}: {1}".format(
+                      self.cache_file, e))
+
+    def load(self):
+        """
+        Load the metadata: immutable entries come from the cache file if it
+        belongs to the current instance; everything else is fetched
+        concurrently from the metadata service.
+        """
+        with self.lock:
+            if self.loaded:
+                return
+            cached = self._read_cache()
+            values = {}
+            if cached:
+                # The cache file may have been left behind by another instance
+                # (e.g., one started from an image made of this one)
+                instance_id = self._fetch('instance-id')
+                if instance_id is None or cached.get('instance-id') == instance_id:
+                    values = cached
+                else:
+                    log.debug("Instance metadata cache is for instance {0}, not {1}; "
+                              "ignoring it".format(cached.get('instance-id'), instance_id))
+            missing = [k for k in IMMUTABLE_KEYS + MUTABLE_KEYS if k not in values]
+            values.update(self._fetch_all(missing))
+            self.values = values
+            self.loaded = True
+            if [k for k in missing if k in IMMUTABLE_KEYS and k in values]:
+                self._write_cache()
+            log.debug("Loaded instance metadata ({0} entries from the cache file, "
+                      "{1} fetched)".format(len(IMMUTABLE_KEYS + MUTABLE_KEYS) - len(missing),
+                                            len(missing)))
+
+    def get(self, key, max_age=None):
+        """
+        Return metadata entry ``key`` (``None`` if it is not available). A
+        mutable entry fetched more than ``max_age`` seconds ago is fetched anew.
+        """
+        self.load()
+        with self.lock:
+            value = self.values.get(key)
+            stale = (max_age is not None and key not in IMMUTABLE_KEYS and
+                     time.time() - self.fetched.get(key, 0) > max_age)
+        if value is None or stale:
+            fresh = self._fetch(key)
+            with self.lock:
+                if fresh:
+                    self.values[key] = value = fresh
+                    self.fetched[key] = time.time()
+                    if key in IMMUTABLE_KEYS:
+                        self._write_cache()
+        return value
@@ -17,6 +17,7 @@ class OSInterface(EC2Interface):
         super(OSInterface, self).__init__()
         self.app = app
         self.tags_supported = False  # Not used here, see _tags_supported method instead
+        self.supports_volume_resize = False
         self.set_configuration()
 
     def _tags_supported(self, resource):
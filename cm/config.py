@@ -16,6 +16,19 @@ DEFAULT_INSTANCE_COMM_TIMEOUT = 180
 DEFAULT_INSTANCE_STATE_CHANGE_WAIT = 400
 DEFAULT_INSTANCE_REBOOT_ATTEMPTS = 4
 DEFAULT_INSTANCE_TERMINATE_ATTEMPTS = 4
+DEFAULT_SERVICE_STATUS_TIMEOUT = 30
+DEFAULT_SERVICE_STATUS_WORKERS = 4
+DEFAULT_STORAGE_WORKERS = 4
+DEFAULT_AUTOSCALE_POLICY = 'threshold'
+DEFAULT_AUTOSCALE_MAX_STEP = 5
+DEFAULT_AUTOSCALE_UNITS = 'nodes'  # or 'slots'
+DEFAULT_BILLING_MODE = 'hourly'  # or 'per_second'
+DEFAULT_BILLING_PERIOD = 3600
+DEFAULT_SCALE_DOWN_WINDOW = 180
+DEFAULT_IDLE_COOLDOWN = 300
+DEFAULT_FLEET_INSTANCE_TYPES = []
+DEFAULT_WARM_POOL_SIZE = 0
+DEFAULT_WORKER_CACHE_DIR = '/mnt/cache'
 DEFAULT_INSTANCE_TYPES = [
     ("", "Same as Master"),
     ("t1.micro", "Micro"),
@@ -106,7 +119,11 @@ class Configuration(object):
 
     def init_with_user_data(self, user_data):
         self.__configure_instance_management(user_data)
+        self.__configure_monitor(user_data)
+        self.__configure_autoscaling(user_data)
         self.__configure_instance_types(user_data)
+        self.__configure_cloud_cache(user_data)
+        self.__configure_worker_cache(user_data)
         self.condor_enabled = user_data.get("condor_enabled", False)
         self.hadoop_enabled = user_data.get("hadoop_enabled", False)
 
@@ -124,6 +141,76 @@ class Configuration(object):
         self.instance_terminate_attempts = \
             user_data.get("instance_terminate_attempts", DEFAULT_INSTANCE_TERMINATE_ATTEMPTS)
 
+    def __configure_monitor(self, user_data):
+        """Configure attributes used by cm.util.master:ConsoleMonitor when
+        checking the status of services."""
+        self.service_status_timeout = \
+            user_data.get("service_status_timeout", DEFAULT_SERVICE_STATUS_TIMEOUT)
+        # Per-service overrides of the above, keyed by service name, e.g.:
+        # service_status_timeouts: {Galaxy: 60, PostgreSQL: 30}
+        self.service_status_timeouts = dict((k, int(v)) for k, v in
+            (user_data.get("service_status_timeouts") or {}).iteritems())
+        self.service_status_workers = \
+            user_data.get("service_status_workers", DEFAULT_SERVICE_STATUS_WORKERS)
+        # Number of volumes/file systems that may be added concurrently
+        self.storage_workers = \
+            user_data.get("storage_workers", DEFAULT_STORAGE_WORKERS)
+
+    def __configure_cloud_cache(self, user_data):
+        """Configure for how long (in seconds) cm.clouds:CloudInterface reuses
+        responses of the cloud API describing each type of resource, e.g.:
+        cloud_cache_ttls: {instances: 10, volumes: 10, snapshots: 30}"""
+        self.cloud_cache_ttls = dict((k, int(v)) for k, v in
+            (user_data.get("cloud_cache_ttls") or {}).iteritems())
+
+    def __configure_worker_cache(self, user_data):
+        """Configure the read cache cm.util.worker_cache:WorkerCache keeps on
+        workers' local storage for the file systems mounted from the master,
+        per file system role (or name), e.g.:
+        worker_cache: {galaxyIndices: fscache, galaxy: {mode: rsync, paths: [tool-data]}}"""
+        self.worker_cache = {}
+        for key, conf in (user_data.get("worker_cache") or {}).iteritems():
+            if isinstance(conf, basestring):
+                conf = {'mode': conf}
+            self.worker_cache[key] = {'mode': conf.get('mode', 'fscache'),
+                                      'paths': conf.get('paths', [])}
+        self.worker_cache_dir = \
+            user_data.get("worker_cache_dir", DEFAULT_WORKER_CACHE_DIR)
+
+    def __configure_autoscaling(self, user_data):
+        """Configure attributes used by cm.services.autoscale:Autoscale to
+        decide on the size of the cluster."""
+        self.autoscale_policy = \
+            user_data.get("autoscale_policy", DEFAULT_AUTOSCALE_POLICY)
+        self.autoscale_max_step = \
+            user_data.get("autoscale_max_step", DEFAULT_AUTOSCALE_MAX_STEP)
+        # Whether the autoscaling min/max are a number of nodes or job slots
+        self.autoscale_units = \
+            user_data.get("autoscale_units", DEFAULT_AUTOSCALE_UNITS)
+        # With hourly billing, idle instances are removed within
+        # scale_down_window seconds of the end of their billing period; with
+        # per-second billing, once they have been idle for idle_cooldown seconds
+        self.billing_mode = \
+            user_data.get("billing_mode", DEFAULT_BILLING_MODE)
+        self.billing_period = \
+            user_data.get("billing_period", DEFAULT_BILLING_PERIOD)
+        self.scale_down_window = \
+            user_data.get("scale_down_window", DEFAULT_SCALE_DOWN_WINDOW)
+        self.idle_cooldown = \
+            user_data.get("idle_cooldown", DEFAULT_IDLE_COOLDOWN)
+        # Acceptable worker instance types, in order of preference, and the
+        # number of job slots each provides, e.g.:
+        # fleet_instance_types: [{type: c3.2xlarge, slots: 8}, {type: m3.xlarge, slots: 4}]
+        self.fleet_instance_types = [(t.get("type", ""), int(t.get("slots", 1))) for t in
+            user_data.get("fleet_instance_types", DEFAULT_FLEET_INSTANCE_TYPES)]
+        self.fleet_zones = user_data.get("fleet_zones", None)
+        # Number of standby workers to keep booted and added to SGE, but with
+        # their queues disabled, so they can take jobs within seconds of being
+        # needed (0 turns the warm pool off)
+        self.warm_pool_size = \
+            int(user_data.get("warm_pool_size", DEFAULT_WARM_POOL_SIZE))
+        self.warm_pool_instance_type = user_data.get("warm_pool_instance_type", "")
+
     def __configure_instance_types(self, user_data):
         cloud_name = user_data.get('cloud_name', 'amazon').lower()
         if "instance_types" in user_data:
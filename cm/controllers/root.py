@@ -188,7 +188,7 @@ class CM(BaseController):
 
     @expose
     def add_file_system(self, trans, fs_kind, dot=False, persist=False,
-            new_disk_size='', new_vol_fs_name='',
+            new_disk_size='', new_vol_fs_name='', new_vol_stripes=1,
             vol_id=None, vol_fs_name='',
             snap_id=None, snap_fs_name='',
             bucket_name='', bucket_fs_name='', bucket_a_key='', bucket_s_key='',
@@ -202,7 +202,8 @@ class CM(BaseController):
             * (AWS S3) bucket (bucket)
             * Existing volume (volume)
             * Existing snapshot (snapshot)
-            * New volume (new_volume)
+            * New volume (new_volume), optionally striped over
+              ``new_vol_stripes`` volumes
             * External NFS server (nfs)
 
         The ``dot`` parameter, if set to ``True``, will mark
@@ -251,8 +252,13 @@ class CM(BaseController):
                 "be deleted, of size {1}"
                 .format(new_vol_fs_name, new_disk_size, ('' if persist else ' not'),
                 ('' if dot else ' not')))
+            try:
+                new_vol_stripes = max(1, int(new_vol_stripes or 1))
+            except ValueError:
+                new_vol_stripes = 1
             self.app.manager.add_fs_volume(fs_name=new_vol_fs_name, fs_kind='new_volume',
-                vol_size=new_disk_size, persistent=persist, dot=dot)
+                vol_size=new_disk_size, persistent=persist, dot=dot,
+                num_stripes=new_vol_stripes)
         elif fs_kind == 'nfs':
             log.debug("Adding a new '{0}' file system: nfs-based,{1} persistent."
                 .format(nfs_fs_name, ('' if persist else ' not')))
@@ -344,13 +350,16 @@ class CM(BaseController):
         return self.instance_state_json(trans)
 
     @expose
-    def remove_instances(self, trans, number_nodes, force_termination):
+    def remove_instances(self, trans, number_nodes, force_termination, number_slots=None):
         try:
             number_nodes = int(number_nodes)
             force_termination = True if force_termination == 'True' else False
-            log.debug("Num nodes requested to terminate: %s, force termination: %s"
-                % (number_nodes, force_termination))
-            self.app.manager.remove_instances(number_nodes, force_termination)
+            if number_slots:
+                number_slots = int(number_slots)
+            log.debug("Num nodes requested to terminate: %s (slots: %s), force termination: %s"
+                % (number_nodes, number_slots, force_termination))
+            self.app.manager.remove_instances(number_nodes, force_termination,
+                                              num_slots=number_slots or None)
         except ValueError, e:
             log.error("You must provide valid value.  %s" % e)
         return self.instance_state_json(trans)
@@ -622,15 +631,16 @@ class CM(BaseController):
             return msg
 
     @expose
-    def toggle_autoscaling(self, trans, as_min=None, as_max=None, instance_type=None):
+    def toggle_autoscaling(self, trans, as_min=None, as_max=None, instance_type=None,
+                           policy=None, units=None):
         if self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE):
             log.debug("Turning autoscaling OFF")
             self.app.manager.stop_autoscaling()
         else:
             log.debug("Turning autoscaling ON")
-            if self.check_as_vals(as_min, as_max):
+            if self.check_as_vals(as_min, as_max, units):
                 self.app.manager.start_autoscaling(
-                    int(as_min), int(as_max), instance_type)
+                    int(as_min), int(as_max), instance_type, policy, units)
             else:
                 log.error("Invalid values for autoscaling bounds (min: %s, max: %s). " +
                           "Autoscaling is OFF." % (as_min, as_max))
@@ -649,7 +659,8 @@ class CM(BaseController):
     @expose
     def adjust_autoscaling(self, trans, as_min_adj=None, as_max_adj=None):
         if self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE):
-            if self.check_as_vals(as_min_adj, as_max_adj):
+            units = self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)[0].units
+            if self.check_as_vals(as_min_adj, as_max_adj, units):
                 # log.debug("Adjusting autoscaling; new bounds min: %s, max:
                 # %s" % (as_min_adj, as_max_adj))
                 self.app.manager.adjust_autoscaling(
@@ -667,10 +678,12 @@ class CM(BaseController):
                                'as_max': 0,
                                'ui_update_data': self.instance_state_json(trans, no_json=True)})
 
-    def check_as_vals(self, as_min, as_max):
-        """ Check if limits for autoscaling are acceptable."""
-        if as_min is not None and as_min.isdigit() and int(as_min) >= 0 and int(as_min) < 20 and \
-                as_max is not None and as_max.isdigit() and int(as_max) >= int(as_min) and int(as_max) < 20:
+    def check_as_vals(self, as_min, as_max, units=None):
+        """ Check if limits for autoscaling are acceptable. Limits expressed in
+            job slots (``units`` is 'slots') may be proportionally larger."""
+        limit = 20 if units != 'slots' else 1000
+        if as_min is not None and as_min.isdigit() and int(as_min) >= 0 and int(as_min) < limit and \
+                as_max is not None and as_max.isdigit() and int(as_max) >= int(as_min) and int(as_max) < limit:
             return True
         else:
             return False
@@ -797,11 +810,18 @@ class CM(BaseController):
     def instance_state_json(self, trans, no_json=False):
         dns = self.get_galaxy_dns(trans)
         snap_status = self.app.manager.snapshot_status()
+        as_svc = self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)
+        capacity = self.app.manager.get_slot_capacity()
         ret_dict = {'cluster_status': self.app.manager.get_cluster_status(),
                     'dns': dns,
                     'instance_status': {'idle': str(len(self.app.manager.get_idle_instances())),
                                         'available': str(self.app.manager.get_num_available_workers()),
-                                        'requested': str(len(self.app.manager.worker_instances))},
+                                        'requested': str(len(self.app.manager.worker_instances)),
+                                        'standby': str(len(self.app.manager.get_standby_instances()))},
+                    'slot_status': {'total': str(capacity.total),
+                                    'used': str(capacity.used),
+                                    'free': str(capacity.free),
+                                    'available': str(capacity.available)},
                     'disk_usage': {'used': str(self.app.manager.disk_used),
                                    'total': str(self.app.manager.disk_total),
                                    'pct': str(self.app.manager.disk_pct)},
@@ -812,13 +832,35 @@ class CM(BaseController):
                                  'progress': str(snap_status[1])},
                     'autoscaling': {'use_autoscaling': bool(self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)),
                                     'as_min': 'N/A' if not self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE) else self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)[0].as_min,
-                                    'as_max': 'N/A' if not self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE) else self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)[0].as_max}
+                                    'as_max': 'N/A' if not self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE) else self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)[0].as_max,
+                                    'as_units': 'N/A' if not as_svc else as_svc[0].units}
                     }
         if no_json:
             return ret_dict
         else:
             return json.dumps(ret_dict)
 
+    @expose
+    def autoscaling_metrics_json(self, trans, window=None):
+        """
+        Return rolling statistics (latest value, mean and percentiles) of the
+        job metrics recorded by autoscaling over the past ``window`` seconds.
+        """
+        as_svc = self.app.manager.get_services(svc_role=ServiceRole.AUTOSCALE)
+        if not as_svc:
+            return json.dumps({})
+        if window is not None and not str(window).isdigit():
+            window = None
+        return json.dumps(as_svc[0].metrics.summary(
+            window=int(window) if window is not None else None))
+
+    @expose
+    def cloud_cache_stats_json(self, trans):
+        """
+        Return the hit/miss counts of the cloud API response cache.
+        """
+        return json.dumps(self.app.cloud_interface.get_cache_stats())
+
     @expose
     def update_users_CM(self, trans):
         return json.dumps({'updated': self.app.manager.update_users_CM()})
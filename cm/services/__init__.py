@@ -2,6 +2,7 @@
 The base services package; all CloudMan services derive from this class.
 """
 import datetime as dt
+from cm.util import monitor_events
 from cm.util.bunch import Bunch
 
 import logging
@@ -331,3 +332,23 @@ class Service(object):
         Return full name of the service (useful if different from service type)
         """
         return "{0}".format(self.name)
+
+    @property
+    def state(self):
+        return self.__dict__.get('_state')
+
+    @state.setter
+    def state(self, value):
+        """
+        Set the service state and, if the state has changed, let the master's
+        monitor know about it (if one is listening) so it can react right away
+        rather than on its next periodic check.
+        """
+        old_state = self.__dict__.get('_state')
+        self._state = value
+        if old_state != value:
+            manager = getattr(getattr(self, 'app', None), 'manager', None)
+            monitor = getattr(manager, 'console_monitor', None)
+            if hasattr(monitor, 'post_event'):
+                monitor.post_event(monitor_events.SERVICE_STATE_CHANGED,
+                                   service=self, old_state=old_state, new_state=value)
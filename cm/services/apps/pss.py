@@ -31,22 +31,6 @@ class PSSService(ApplicationService):
         self.pss_url = self.app.ud.get('post_start_script_url', None) if self.instance_role == 'master' \
             else self.app.ud.get('worker_post_start_script_url', None)
 
-    def _prime_data(self):
-        """ Some data is slow to obtain because a call to the cloud middleware
-            is required. When such data is required to complete a user request,
-            the request may be slow to complete. In an effort to alleviate some
-            of those delays, prime the data into local variables (particularly
-            the ones that do not change over a lifetime of a cluster).
-        """
-        log.debug("Priming local data variables...")
-        self.app.cloud_interface.get_ami()
-        self.app.cloud_interface.get_zone()
-        self.app.cloud_interface.get_key_pair_name()
-        self.app.cloud_interface.get_security_groups()
-        self.app.cloud_interface.get_private_ip()
-        self.app.cloud_interface.get_public_ip()
-        self.app.cloud_interface.get_local_hostname()
-
     def add(self):
         """
         Check if prerequisites for running this service are satisfied and, if so,
@@ -138,7 +122,7 @@ class PSSService(ApplicationService):
                       % self.name)
         # Prime the object with instance data (because this may take a while
         # on some clouds, do so in a separate thread)
-        threading.Thread(target=self._prime_data).start()
+        threading.Thread(target=self.app.cloud_interface.prime_metadata).start()
         self.state = service_states.SHUT_DOWN
         log.debug("%s service done and marked as '%s'" % (self.name, self.state))
         if self.instance_role == 'master':
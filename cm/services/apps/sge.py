@@ -7,6 +7,8 @@ import pwd
 import grp
 import datetime
 import commands
+import threading
+import xml.etree.ElementTree as ET
 
 from string import Template
 
@@ -15,6 +17,7 @@ from cm.services import ServiceRole
 from cm.services import ServiceDependency
 from cm.services.apps import ApplicationService
 from cm.util import misc
+from cm.util.bunch import Bunch
 from cm.util import paths
 from cm.util import templates
 
@@ -40,6 +43,62 @@ def fix_libc():
                 "SGE config is likely to fail because '/lib64/libc.so.6' lib does not exists...")
 
 
+def _parse_sge_time(value):
+    """
+    Parse a time stamp as included in ``qstat`` XML output (e.g.,
+    ``2013-05-09T13:55:11``) into a ``datetime`` object or return ``None``.
+    """
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%m/%d/%Y %H:%M:%S"):
+        try:
+            return datetime.datetime(*time.strptime(value, fmt)[0:6])
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def _parse_qstat_job(job):
+    return Bunch(id=job.findtext('JB_job_number'),
+                 name=job.findtext('JB_name'),
+                 owner=job.findtext('JB_owner'),
+                 state=job.findtext('state'),
+                 slots=int(job.findtext('slots') or 1),
+                 # Running jobs carry the time they started, pending ones
+                 # the time they were submitted
+                 time=_parse_sge_time(job.findtext('JAT_start_time') or
+                                      job.findtext('JB_submission_time')))
+
+
+def parse_qstat_xml(xml):
+    """
+    Parse the output of ``qstat -f -u '*' -xml`` and return a ``Bunch`` with
+    ``hosts`` (a list of queue instances, each with ``name``, ``queue``,
+    ``hostname``, ``slots_used``, ``slots_total`` and ``state``) and ``jobs``
+    (a list of running and pending jobs, each with ``id``, ``name``,
+    ``owner``, ``state``, ``slots``, ``time`` and ``hostname``).
+    """
+    hosts = []
+    jobs = []
+    root = ET.fromstring(xml)
+    for q in root.iter('Queue-List'):
+        name = q.findtext('name') or ''
+        queue, _, hostname = name.partition('@')
+        hosts.append(Bunch(name=name, queue=queue, hostname=hostname,
+                           slots_used=int(q.findtext('slots_used') or 0),
+                           slots_total=int(q.findtext('slots_total') or 0),
+                           state=q.findtext('state') or ''))
+        for job in q.findall('job_list'):
+            j = _parse_qstat_job(job)
+            j.hostname = hostname
+            jobs.append(j)
+    pending = root.find('job_info')
+    if pending is not None:
+        for job in pending.findall('job_list'):
+            j = _parse_qstat_job(job)
+            j.hostname = None
+            jobs.append(j)
+    return Bunch(hosts=hosts, jobs=jobs)
+
+
 class SGEService(ApplicationService):
     def __init__(self, app):
         super(SGEService, self).__init__(app)
@@ -47,6 +106,18 @@ class SGEService(ApplicationService):
         self.name = ServiceRole.to_string(ServiceRole.SGE)
         self.dependencies = [ServiceDependency(self, ServiceRole.MIGRATION)]
         self.hosts = []
+        # Hosts waiting to be added to SGE: (inst_id, inst_private_ip, callback)
+        self.pending_hosts = []
+        self.pending_hosts_lock = threading.Lock()
+        self.pending_hosts_timer = None
+        # Seconds to wait for more hosts to arrive before adding a batch of them
+        self.host_batch_window = 5
+        # Parsed ``qstat`` output, shared by all the consumers of SGE's state
+        # (see ``get_queue_snapshot``)
+        self.queue_snapshot = None
+        self.queue_snapshot_time = 0
+        self.queue_snapshot_ttl = 10  # seconds
+        self.queue_snapshot_lock = threading.Lock()
 
     def start(self):
         self.state = service_states.STARTING
@@ -62,9 +133,9 @@ class SGEService(ApplicationService):
         log.info("Removing SGE service")
         super(SGEService, self).remove(synchronous)
         self.state = service_states.SHUTTING_DOWN
-        for inst in self.app.manager.worker_instances:
-            if not inst.is_spot() or inst.spot_was_filled():
-                self.remove_sge_host(inst.get_id(), inst.get_private_ip())
+        self.remove_sge_hosts([(inst.get_id(), inst.get_private_ip())
+                               for inst in self.app.manager.worker_instances
+                               if not inst.is_spot() or inst.spot_was_filled()])
 
         misc.run(
             'export SGE_ROOT=%s; . $SGE_ROOT/default/common/settings.sh; %s/bin/lx24-amd64/qconf -km' % (
@@ -254,6 +325,64 @@ class SGEService(ApplicationService):
         misc.run(
             "sed -i.bak '/^127.0.1./s/^/# (Commented by CloudMan) /' /etc/hosts")
 
+    def _sge_cmd(self, tool, *args):
+        """
+        Compose a shell command running SGE's ``tool`` (e.g., ``qconf``) once
+        for each of the given ``args`` (i.e., all the calls are made from a
+        single shell).
+        """
+        sge_root = self.app.path_resolver.sge_root
+        return 'export SGE_ROOT={0}; . $SGE_ROOT/default/common/settings.sh; {1}'.format(
+            sge_root, '; '.join('{0}/bin/lx24-amd64/{1} {2}'.format(sge_root, tool, a)
+                                for a in args))
+
+    def _qconf(self, *args):
+        return self._sge_cmd('qconf', *args)
+
+    def queue_host_addition(self, inst_id, inst_private_ip, callback=None):
+        """
+        Schedule the instance ``inst_id`` to be added into the SGE cluster.
+        Hosts queued within ``host_batch_window`` seconds of each other are
+        added together, in a single batch (see ``add_sge_hosts``). Once the
+        batch has been processed, ``callback`` (if provided) is called with
+        ``True`` if the instance was added successfully and ``False`` otherwise.
+        Note that ``callback`` is called from the thread processing the batch
+        so it should only hand the result over to the thread that owns any
+        shared resources (e.g., post an event to the master's monitor).
+        """
+        with self.pending_hosts_lock:
+            self.pending_hosts.append((inst_id, inst_private_ip, callback))
+            if self.pending_hosts_timer is None:
+                self.pending_hosts_timer = threading.Timer(
+                    self.host_batch_window, self._flush_host_additions)
+                self.pending_hosts_timer.daemon = True
+                self.pending_hosts_timer.start()
+        log.debug("Queued instance {0} w/ private IP/hostname {1} for addition to SGE"
+                  .format(inst_id, inst_private_ip))
+
+    def _flush_host_additions(self):
+        """
+        Add all the hosts queued via ``queue_host_addition`` and notify their callbacks.
+        """
+        with self.pending_hosts_lock:
+            pending = self.pending_hosts
+            self.pending_hosts = []
+            self.pending_hosts_timer = None
+        if not pending:
+            return
+        try:
+            added = self.add_sge_hosts([(inst_id, ip) for inst_id, ip, _ in pending])
+        except Exception, e:
+            log.exception("Error adding a batch of hosts to SGE: {0}".format(e))
+            added = {}
+        for inst_id, ip, callback in pending:
+            if callback:
+                try:
+                    callback(added.get(ip, False))
+                except Exception, e:
+                    log.exception("Error notifying instance {0} of its addition to SGE: {1}"
+                                  .format(inst_id, e))
+
     def add_sge_host(self, inst_id, inst_private_ip):
         """
         Add the instance ``inst_id`` into the SGE cluster. This implies adding
@@ -265,107 +394,118 @@ class SGEService(ApplicationService):
         visible (i.e., accessible) to the other nodes in the clusters.
         """
         # TODO: Should check to ensure SGE_ROOT mounted on worker
-        time.sleep(10)  # Wait in hope that SGE processed last host addition
-        log.debug("Adding instance {0} w/ private IP/hostname {1} to SGE"
-                  .format(inst_id, inst_private_ip))
-
-        # == Add instance as SGE administrative host
-        self._add_instance_as_admin_host(inst_id, inst_private_ip)
-
-        # == Add instance as SGE execution host
-        return self._add_instance_as_exec_host(inst_id, inst_private_ip)
+        return self.add_sge_hosts([(inst_id, inst_private_ip)]).get(inst_private_ip, False)
 
-    def _add_instance_as_admin_host(self, inst_id, inst_private_ip):
+    def add_sge_hosts(self, hosts):
         """
-        Add instance with ``inst_id`` and ``inst_private_ip`` to the SGE
-        administrative host list.
+        Add the instances in ``hosts``, a list of ``(inst_id, inst_private_ip)``
+        tuples, into the SGE cluster as administrative and execution hosts. All
+        the hosts are added in one batch: a single ``qconf`` call adds the
+        administrative hosts, one shell adds all the execution hosts and
+        @allhosts is rewritten once. Return a dict mapping each
+        ``inst_private_ip`` to ``True``: as has always been the case, problems
+        adding a host are only logged because, on instance reboot, SGE may
+        already have been configured for it and parts of the addition fail
+        although the instance still operates within SGE.
 
         ``inst_id`` is used only in log statements while the the ``inst_private_ip``
         is the IP address (or hostname) of the given instance, which must be
         visible (i.e., accessible) to the other nodes in the clusters.
         """
-        log.debug(
-            "Adding instance {0} as SGE administrative host.".format(inst_id))
-        stderr = stdout = None
-        error = False
-        cmd = 'export SGE_ROOT=%s;. $SGE_ROOT/default/common/settings.sh; %s/bin/lx24-amd64/qconf -ah %s' \
-            % (self.app.path_resolver.sge_root, self.app.path_resolver.sge_root, inst_private_ip)
-        log.debug("Add SGE admin host cmd: {0}".format(cmd))
-        proc = subprocess.Popen(
-            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc.wait() == 0:
-            log.debug("Successfully added instance {0} w/ private IP {1} as administrative host."
-                      .format(inst_id, inst_private_ip))
-        else:
-            error = True
-            log.error("Process encountered problems adding instance {0} as administrative host. "
-                      "Process returned code {1}".format(inst_id, proc.returncode))
-            stdout, stderr = proc.communicate()
-            log.debug("Adding instance {0} SGE administrative host stdout (private IP: {1}): {2}"
-                      .format(inst_id, inst_private_ip, stdout))
-            log.debug("Adding instance {0} SGE administrative host stderr (private IP: {1}): {2}"
-                      .format(inst_id, inst_private_ip, stderr))
-        return error
+        hosts = [(inst_id, ip) for inst_id, ip in hosts if ip]
+        if not hosts:
+            return {}
+        log.debug("Adding instance(s) {0} to SGE".format(
+            ', '.join("{0} ({1})".format(inst_id, ip) for inst_id, ip in hosts)))
 
-    def _add_instance_as_exec_host(self, inst_id, inst_private_ip):
-        """
-        Add instance with ``inst_id`` and ``inst_private_ip`` to the SGE
-        execution host list.
+        # == Add instances as SGE administrative hosts
+        self._add_instances_as_admin_hosts(hosts)
 
-        ``inst_id`` is used only in log statements while the the ``inst_private_ip``
-        is the IP address (or hostname) of the given instance, which must be
-        visible (i.e., accessible) to the other nodes in the clusters.
+        # == Add instances as SGE execution hosts
+        return self._add_instances_as_exec_hosts(hosts)
+
+    def _add_instances_as_admin_hosts(self, hosts):
+        """
+        Add the instances in ``hosts`` (a list of ``(inst_id, inst_private_ip)``
+        tuples) to the SGE administrative host list with a single ``qconf`` call.
+        Return ``True`` if there was an error, ``False`` otherwise.
         """
-        error = False
-        # Check if host is already in the exec host list
-        cmd = "export SGE_ROOT=%s; . $SGE_ROOT/default/common/settings.sh; %s/bin/lx24-amd64/qconf -sel" \
-            % (self.app.path_resolver.sge_root, self.app.path_resolver.sge_root)
+        ips = [ip for _, ip in hosts]
+        cmd = self._qconf('-ah {0}'.format(','.join(ips)))
+        log.debug("Add SGE admin host(s) cmd: {0}".format(cmd))
         proc = subprocess.Popen(
             cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         stdout, stderr = proc.communicate()
-        if inst_private_ip in stdout:
-            log.debug(
-                "Instance '%s' already in SGE execution host list" % inst_id)
-        else:
-            log.debug(
-                "Adding instance '%s' to SGE execution host list." % inst_id)
+        if proc.returncode == 0:
+            log.debug("Successfully added {0} as administrative host(s).".format(', '.join(ips)))
+            return False
+        # ``qconf`` also returns an error if any of the hosts already was an
+        # administrative host (e.g., after an instance reboot)
+        log.debug("Process adding {0} as administrative host(s) returned code {1}; "
+                  "stdout: {2}; stderr: {3}".format(', '.join(ips), proc.returncode,
+                                                   stdout, stderr))
+        return True
+
+    def _get_exec_hosts(self):
+        """
+        Return the output of ``qconf -sel`` (i.e., the SGE execution host list).
+        """
+        proc = subprocess.Popen(self._qconf('-sel'), shell=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return proc.communicate()[0] or ''
+
+    def _add_instances_as_exec_hosts(self, hosts):
+        """
+        Add the instances in ``hosts`` (a list of ``(inst_id, inst_private_ip)``
+        tuples) to the SGE execution host list and to @allhosts. Return a dict
+        mapping each ``inst_private_ip`` to ``True`` (see ``add_sge_hosts``).
+        """
+        # Check which hosts are already in the exec host list
+        exec_hosts = self._get_exec_hosts().split()
+        to_add = []
+        for inst_id, ip in hosts:
+            if ip in exec_hosts:
+                log.debug("Instance '%s' already in SGE execution host list" % inst_id)
+            else:
+                to_add.append((inst_id, ip))
+        if to_add:
             # Create a dir to hold all of workers host configuration files
             host_conf_dir = "%s/host_confs" % self.app.path_resolver.sge_root
             if not os.path.exists(host_conf_dir):
                 subprocess.call('mkdir -p %s' % host_conf_dir, shell=True)
                 os.chown(host_conf_dir, pwd.getpwnam(
                     "sgeadmin")[2], grp.getgrnam("sgeadmin")[2])
-            host_conf_file = os.path.join(host_conf_dir, str(inst_id))
-            with open(host_conf_file, 'w') as f:
-                print >> f, templates.SGE_HOST_CONF_TEMPLATE % (
-                    inst_private_ip)
-            os.chown(host_conf_file, pwd.getpwnam("sgeadmin")[
-                     2], grp.getgrnam("sgeadmin")[2])
-            log.debug(
-                "Created SGE host configuration template as file '%s'." % host_conf_file)
-            # Add worker instance as execution host to SGE
-            cmd = 'export SGE_ROOT=%s; . $SGE_ROOT/default/common/settings.sh; %s/bin/lx24-amd64/qconf -Ae %s' \
-                % (self.app.path_resolver.sge_root, self.app.path_resolver.sge_root, host_conf_file)
-            log.debug("Add SGE exec host cmd: {0}".format(cmd))
+            host_conf_files = []
+            for inst_id, ip in to_add:
+                host_conf_file = os.path.join(host_conf_dir, str(inst_id))
+                with open(host_conf_file, 'w') as conf:
+                    print >> conf, templates.SGE_HOST_CONF_TEMPLATE % (ip)
+                os.chown(host_conf_file, pwd.getpwnam("sgeadmin")[
+                         2], grp.getgrnam("sgeadmin")[2])
+                host_conf_files.append(host_conf_file)
+            log.debug("Created SGE host configuration template file(s) {0}".format(
+                ', '.join(host_conf_files)))
+            # Add all the worker instances as execution hosts to SGE from one shell
+            cmd = self._qconf(*['-Ae {0}'.format(f) for f in host_conf_files])
+            log.debug("Add SGE exec host(s) cmd: {0}".format(cmd))
             proc = subprocess.Popen(cmd, shell=True,
                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if proc.wait() == 0:
-                log.debug("Successfully added instance '%s' w/ private IP '%s' as an execution host."
-                          % (inst_id, inst_private_ip))
-            else:
-                error = True
-                log.error("Process encountered problems adding instance '%s' as an SGE execution host. "
-                          "Process returned code %s" % (inst_id, proc.returncode))
-                stderr = stdout = None
-                stdout, stderr = proc.communicate()
-                log.debug(" - adding instance '%s' SGE execution host stdout (private IP: %s): '%s'"
-                          % (inst_id, inst_private_ip, stdout))
-                log.debug(" - adding instance '%s' SGE execution host stderr (private IP: %s): '%s'"
-                          % (inst_id, inst_private_ip, stderr))
-
-        # == Add given instance's hostname to @allhosts
-        # Check if instance is already in allhosts file and do not recreate the
-        # file if so.
+            stdout, stderr = proc.communicate()
+            log.debug(" - adding SGE execution host(s) stdout: '%s'; stderr: '%s'"
+                      % (stdout, stderr))
+            # Each ``qconf`` call may have failed independently so check the
+            # resulting exec host list rather than the shell's return code
+            exec_hosts = self._get_exec_hosts().split()
+        errors = set()
+        for inst_id, ip in hosts:
+            if ip not in exec_hosts:
+                errors.add(ip)
+                log.error("Process encountered problems adding instance '%s' as an "
+                          "SGE execution host." % inst_id)
+
+        # == Add given instances' hostnames to @allhosts
+        # Check if instances are already in allhosts file and do not recreate
+        # the file if so.
         # Additional documentation: allhosts file can be generated by CloudMan
         # each time an instance is added or removed. The file is generated based
         # on the Instance object CloudMan keeps track of and, as a result, it
@@ -374,43 +514,50 @@ class SGEService(ApplicationService):
         # already included in the allhosts file. This approach ensures consistency
         # between SGE and CloudMan and has been working much better than trying
         # to sync the two via other methods.
-        proc = subprocess.Popen("export SGE_ROOT=%s; . $SGE_ROOT/default/common/settings.sh; "
-                                "%s/bin/lx24-amd64/qconf -shgrp @allhosts"
-                                % (self.app.path_resolver.sge_root, self.app.path_resolver.sge_root), shell=True, stdout=subprocess.PIPE)
-        allhosts_out = proc.communicate()[0]
-        if inst_private_ip not in allhosts_out:
+        proc = subprocess.Popen(self._qconf('-shgrp @allhosts'), shell=True,
+                                stdout=subprocess.PIPE)
+        allhosts = (proc.communicate()[0] or '').split()
+        missing = [(inst_id, ip) for inst_id, ip in hosts if ip not in allhosts]
+        if missing:
             now = datetime.datetime.utcnow()
             ah_file = '/tmp/ah_add_' + now.strftime("%H_%M_%S")
             self.write_allhosts_file(
-                filename=ah_file, to_add=inst_private_ip)
-            if not misc.run('export SGE_ROOT=%s;. $SGE_ROOT/default/common/settings.sh; '
-                            '%s/bin/lx24-amd64/qconf -Mhgrp %s'
-                            % (self.app.path_resolver.sge_root, self.app.path_resolver.sge_root, ah_file),
-                            "Problems updating @allhosts aimed at adding '%s'" % inst_id,
-                            "Successfully updated @allhosts to add '%s' with address '%s'" % (inst_id, inst_private_ip)):
-                error = True
+                filename=ah_file, to_add=[ip for _, ip in missing])
+            ids = ', '.join(inst_id for inst_id, _ in missing)
+            if not misc.run(self._qconf('-Mhgrp %s' % ah_file),
+                            "Problems updating @allhosts aimed at adding %s" % ids,
+                            "Successfully updated @allhosts to add %s" % ids):
+                errors.update(ip for _, ip in missing)
         else:
-            log.debug(
-                "Instance '%s' IP is already in SGE's @allhosts" % inst_id)
+            log.debug("Instance(s) IP already in SGE's @allhosts")
 
         # On instance reboot, SGE might have already been configured for a given
-        # instance and this method will fail along the way although the instance
-        # will still operate within SGE so don't explicitly state it was added.
-        if error is False:
-            log.debug("Successfully added instance '%s' to SGE" % inst_id)
-
-        return True
+        # instance and parts of this method will fail along the way although
+        # the instance will still operate within SGE so don't explicitly state
+        # it was added.
+        for inst_id, ip in hosts:
+            if ip not in errors:
+                log.debug("Successfully added instance '%s' to SGE" % inst_id)
+        return dict((ip, True) for _, ip in hosts)
 
     def stop_sge(self):
         log.info("Stopping SGE.")
-        for inst in self.app.manager.worker_instances:
-            self.remove_sge_host(inst.get_id(), inst.get_private_ip())
+        self.remove_sge_hosts([(inst.get_id(), inst.get_private_ip())
+                               for inst in self.app.manager.worker_instances])
         misc.run('export SGE_ROOT=%s; . $SGE_ROOT/default/common/settings.sh; %s/bin/lx24-amd64/qconf -km'
             % (self.app.path_resolver.sge_root, self.app.path_resolver.sge_root),
             "Problems stopping SGE master", "Successfully stopped SGE master.")
 
     def write_allhosts_file(self, filename='/tmp/ah', to_add=None, to_remove=None):
+        """
+        Write SGE's @allhosts group config file listing all the worker instances
+        (and the master if it is an execution host) except the ones with the
+        private IP(s) in ``to_remove`` (an address or a list of addresses).
+        """
         ahl = []
+        if isinstance(to_remove, basestring):
+            to_remove = [to_remove]
+        to_remove = to_remove or []
         log.debug("to_add: '%s'" % to_add)
         log.debug("to_remove: '%s'" % to_remove)
         # Add master instance to the execution host list
@@ -426,7 +573,7 @@ class SGEService(ApplicationService):
         # Add worker instances, excluding the one being removed or pending
         for inst in self.app.manager.worker_instances:
             if not inst.is_spot() or inst.spot_was_filled():
-                if inst.get_private_ip() != to_remove and \
+                if inst.get_private_ip() not in to_remove and \
                     inst.worker_status != 'Stopping' and \
                     inst.worker_status != 'Error' and \
                     inst.worker_status != 'Pending' and \
@@ -473,6 +620,76 @@ class SGEService(ApplicationService):
         self._remove_instance_from_admin_list(inst_id, inst_private_ip)
         return self._remove_instance_from_exec_list(inst_id, inst_private_ip)
 
+    def set_hosts_enabled(self, ips, enabled=True):
+        """
+        Enable (or disable) the queue instances on all the hosts with the given
+        private ``ips`` with a single ``qmod`` call. Jobs are not scheduled on
+        a host whose queue instances are disabled but the host otherwise
+        remains part of the cluster. Return ``True`` if the command succeeded.
+        """
+        ips = [ip for ip in ips if ip]
+        if not ips:
+            return True
+        action = 'Enabled' if enabled else 'Disabled'
+        ok = misc.run(self._sge_cmd('qmod', '{0} {1}'.format(
+                      '-e' if enabled else '-d', ' '.join("'*@{0}'".format(ip) for ip in ips))),
+                      "Problems {0} SGE queue instances on {1}".format(
+                          'enabling' if enabled else 'disabling', ', '.join(ips)),
+                      "{0} SGE queue instances on {1}".format(action, ', '.join(ips)))
+        # The queue states have changed
+        self.queue_snapshot_time = 0
+        return ok is not False
+
+    def remove_sge_hosts(self, hosts):
+        """
+        Remove the instances in ``hosts``, a list of ``(inst_id, inst_private_ip)``
+        tuples, from being tracked/controlled by SGE. All the hosts are removed
+        in one batch: their queue instances are first disabled so no new jobs
+        get scheduled on them, @allhosts is rewritten once, and a single
+        ``qconf`` call is made to remove all of them from each of the
+        administrative host list, the execution host list and the host
+        configurations. Return a dict mapping each ``inst_private_ip`` to
+        ``True`` if the given host is no longer an execution host, ``False``
+        otherwise.
+        """
+        hosts = [(inst_id, ip) for inst_id, ip in hosts if ip]
+        if not hosts:
+            return {}
+        ips = [ip for _, ip in hosts]
+        log.debug("Removing instance(s) {0} from SGE".format(
+            ', '.join("{0} ({1})".format(inst_id, ip) for inst_id, ip in hosts)))
+        # Drain the hosts
+        misc.run(self._sge_cmd('qmod', '-d {0}'.format(' '.join("'*@{0}'".format(ip) for ip in ips))),
+                 "Problems disabling SGE queue instances on {0}".format(', '.join(ips)),
+                 "Disabled SGE queue instances on {0}".format(', '.join(ips)))
+        # Remove them from @allhosts
+        now = datetime.datetime.utcnow()
+        ah_file = '/tmp/ah_remove_' + now.strftime("%H_%M_%S")
+        self.write_allhosts_file(filename=ah_file, to_remove=ips)
+        # Remove them as execution and administrative hosts
+        cmd = self._qconf('-Mhgrp {0}'.format(ah_file),
+                          '-de {0}'.format(','.join(ips)),
+                          '-dconf {0}'.format(','.join(ips)),
+                          '-dh {0}'.format(','.join(ips)))
+        log.debug("Remove SGE host(s) cmd: {0}".format(cmd))
+        proc = subprocess.Popen(cmd, shell=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        log.debug(" - removing SGE host(s) stdout: '%s'; stderr: '%s'" % (stdout, stderr))
+        # Each ``qconf`` call may have failed independently (e.g., a host that
+        # was never added) so check the resulting exec host list
+        exec_hosts = self._get_exec_hosts().split()
+        removed = {}
+        for inst_id, ip in hosts:
+            removed[ip] = ip not in exec_hosts
+            if removed[ip]:
+                log.debug("Successfully removed instance '%s' with IP '%s' from SGE."
+                          % (inst_id, ip))
+            else:
+                log.debug("Failed to remove instance '%s' with IP '%s' from SGE execution host list."
+                          % (inst_id, ip))
+        return removed
+
     def _remove_instance_from_admin_list(self, inst_id, inst_private_ip):
         """
         Remove instance ``inst_id`` from SGE's administrative host list.
@@ -534,6 +751,56 @@ class SGEService(ApplicationService):
                       % (inst_id, inst_private_ip, stderr))
             return False
 
+    def get_queue_snapshot(self, max_age=None):
+        """
+        Return the current state of the SGE cluster (see ``parse_qstat_xml``)
+        along with the ``time`` it was captured at. ``qstat`` is run at most
+        once every ``max_age`` seconds (``queue_snapshot_ttl`` by default);
+        in between, the cached snapshot is returned. If SGE is not available,
+        the snapshot contains no hosts or jobs.
+        """
+        if max_age is None:
+            max_age = self.queue_snapshot_ttl
+        with self.queue_snapshot_lock:
+            if (self.queue_snapshot is None or
+                    time.time() - self.queue_snapshot_time >= max_age):
+                self.queue_snapshot = self._read_queue_snapshot()
+                self.queue_snapshot_time = time.time()
+            return self.queue_snapshot
+
+    def _read_queue_snapshot(self):
+        snapshot = Bunch(hosts=[], jobs=[], time=datetime.datetime.utcnow())
+        if not os.path.exists('%s/default/common/settings.sh' % self.app.path_resolver.sge_root):
+            return snapshot
+        proc = subprocess.Popen(self._sge_cmd('qstat', "-f -u '*' -xml"), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        if proc.returncode != 0:
+            log.debug("Trouble running qstat (returned code {0}): {1}".format(
+                proc.returncode, stderr))
+            return snapshot
+        try:
+            parsed = parse_qstat_xml(stdout)
+            snapshot.hosts = parsed.hosts
+            snapshot.jobs = parsed.jobs
+        except (ET.ParseError, ValueError), e:
+            log.debug("Trouble parsing qstat output ({0}): {1}".format(stdout, e))
+        return snapshot
+
+    def get_idle_hosts(self):
+        """
+        Return the hostnames of the SGE execution hosts that are currently not
+        running any jobs, in any of the queues (a host has a queue instance in
+        each queue it belongs to).
+        """
+        hostnames = []
+        busy = set()
+        for h in self.get_queue_snapshot().hosts:
+            if h.hostname not in hostnames:
+                hostnames.append(h.hostname)
+            if h.slots_used:
+                busy.add(h.hostname)
+        return [hostname for hostname in hostnames if hostname not in busy]
+
     def check_sge(self):
         """
         Check if SGE qmaster is running and qstat returns at least one node
@@ -1,28 +1,167 @@
-import commands
 import datetime
+import math
 import time
+from collections import deque
 
 from cm.services import Service
 from cm.services import service_states
 from cm.services import ServiceRole
 from cm.services import ServiceType
 from cm.services import ServiceDependency
+from cm.util import metrics
+from cm.util.bunch import Bunch
+from cm.util.metrics import MetricsStore
 
 import logging
 log = logging.getLogger('cloudman')
 
+# Number of cluster state samples kept for the autoscaling policies
+HISTORY_SIZE = 60
+# Number of samples of each job metric kept for rolling statistics
+METRICS_SIZE = 360
+# Billing modes: instances are charged for each started ``billing_period``
+# or for the actual number of seconds they were running
+HOURLY_BILLING = 'hourly'
+PER_SECOND_BILLING = 'per_second'
+# Units the autoscaling limits (min/max) are expressed in
+NODE_UNITS = 'nodes'
+SLOT_UNITS = 'slots'
+# SGE queue instance states in which a host does not accept jobs
+UNAVAILABLE_QUEUE_STATES = 'duE'
+
+
+class AutoscalePolicy(object):
+    """
+    Decide how many worker instances the cluster should have. A policy gets
+    the current number of worker instances and the history of cluster state
+    samples (oldest first; see ``Autoscale.record_sample``) and returns the
+    target cluster size. The target is only used to scale up; idle instances
+    are removed independently of the policy.
+    """
+    name = None
+
+    def get_target_size(self, current, history):
+        raise NotImplementedError()
+
+    def _nodes_for_slots(self, slots, sample):
+        """
+        Number of worker instances needed to provide ``slots`` job slots.
+        """
+        if slots <= 0:
+            return 0
+        return int(math.ceil(float(slots) / max(1, sample.slots_per_node)))
+
+
+class ThresholdPolicy(AutoscalePolicy):
+    """
+    Add one instance at a time while there are no idle instances and queued
+    jobs are turning over slowly (i.e., more than ``num_queued_jobs`` jobs are
+    queued and running jobs have been running for over ``threshold`` seconds
+    on average). Queue length and running time are the medians over the last
+    ``window`` samples so a single unusual sample does not trigger scaling.
+    """
+    name = 'threshold'
+
+    def __init__(self, threshold=60, num_queued_jobs=2, window=5):
+        self.threshold = threshold
+        self.num_queued_jobs = num_queued_jobs
+        self.window = window
+
+    def get_target_size(self, current, history):
+        samples = list(history)[-self.window:]
+        if samples[-1].idle == 0 and \
+                metrics.percentile([s.queued_jobs for s in samples], 50) > self.num_queued_jobs and \
+                metrics.percentile([s.running_time_mean for s in samples], 50) > self.threshold:
+            return current + 1
+        return current
+
+
+class QueueProportionalPolicy(AutoscalePolicy):
+    """
+    Grow the cluster by as many instances as are needed to provide the job
+    slots requested by the queued jobs that cannot start on free slots.
+    """
+    name = 'queue'
+
+    def get_target_size(self, current, history):
+        sample = history[-1]
+        return current + self._nodes_for_slots(
+            sample.queued_slots - sample.free_slots, sample)
+
+
+class ForecastPolicy(QueueProportionalPolicy):
+    """
+    Fit a linear trend to the slot demand (running plus queued job slots)
+    over the last ``window`` samples and size the cluster for the demand
+    expected ``horizon`` seconds from now (i.e., by the time new instances
+    are ready to run jobs). Demand that is currently queued is always met.
+    Fall back to the queue-proportional policy until there are enough samples.
+    """
+    name = 'forecast'
+
+    def __init__(self, horizon=300, window=10):
+        self.horizon = horizon
+        self.window = window
+
+    def get_target_size(self, current, history):
+        target = super(ForecastPolicy, self).get_target_size(current, history)
+        samples = list(history)[-self.window:]
+        if len(samples) < 3:
+            return target
+        sample = samples[-1]
+        t0 = samples[0].time
+        xs = [s.time - t0 for s in samples]
+        ys = [s.running_slots + s.queued_slots for s in samples]
+        n = float(len(samples))
+        x_mean, y_mean = sum(xs) / n, sum(ys) / n
+        sxx = sum((x - x_mean) ** 2 for x in xs)
+        if sxx == 0:
+            return target
+        slope = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sxx
+        predicted = y_mean + slope * (xs[-1] + self.horizon - x_mean)
+        capacity = sample.running_slots + sample.free_slots
+        return max(target, current + self._nodes_for_slots(predicted - capacity, sample))
+
+
+POLICIES = dict((p.name, p) for p in (ThresholdPolicy, QueueProportionalPolicy, ForecastPolicy))
+
+
+def get_policy(name):
+    """
+    Return an instance of the autoscaling policy called ``name`` (one of
+    ``POLICIES``), defaulting to the threshold policy for an unknown name.
+    """
+    if name not in POLICIES:
+        log.warning("Unknown autoscaling policy '%s'; using '%s'" % (name, ThresholdPolicy.name))
+        name = ThresholdPolicy.name
+    return POLICIES[name]()
+
 
 class Autoscale(Service):
-    def __init__(self, app, as_min=-1, as_max=-1, instance_type=None):
+    def __init__(self, app, as_min=-1, as_max=-1, instance_type=None, policy=None,
+                 units=None):
         self.app = app
         self.state = service_states.UNSTARTED
         self.svc_roles = [ServiceRole.AUTOSCALE]
         self.svc_type = ServiceType.APPLICATION
         self.name = ServiceRole.to_string(ServiceRole.AUTOSCALE)
         self.dependencies = [ServiceDependency(self, ServiceRole.MIGRATION)]
-        self.as_max = as_max  # Max number of nodes autoscale should maintain
-        self.as_min = as_min  # Min number of nodes autoscale should maintain
+        self.as_max = as_max  # Max number of nodes (or slots) autoscale should maintain
+        self.as_min = as_min  # Min number of nodes (or slots) autoscale should maintain
+        # Whether the limits are expressed in nodes or job slots
+        self.units = units or app.config.autoscale_units
         self.instance_type = instance_type  # Type of instances to start
+        self.policy = get_policy(policy or app.config.autoscale_policy)
+        self.max_step = int(app.config.autoscale_max_step)  # Max nodes added at once
+        self.billing_mode = app.config.billing_mode
+        self.billing_period = int(app.config.billing_period)
+        self.scale_down_window = int(app.config.scale_down_window)
+        self.idle_cooldown = int(app.config.idle_cooldown)
+        self.history = deque(maxlen=HISTORY_SIZE)  # Cluster state samples
+        # Rolling job metrics, available to the policies and the web UI
+        self.metrics = MetricsStore(METRICS_SIZE)
+        self.seen_jobs = set()  # IDs of the jobs seen in the previous sample
+        self.capacity = None  # Slot capacity of the cluster as of the last sample
 
     def get_full_name(self):
         return "AS"  # A shortcut name for log display
@@ -41,32 +180,40 @@ class Autoscale(Service):
 
     def status(self):
         """Check the status/size of the cluster and initiate appropriate action if necessary"""
+        self.record_sample()
         if self.too_large():
             # Remove idle instances, leaving at least self.as_min
             num_instances_to_remove = self.get_num_instances_to_remove()
             log.debug(
                 "Autoscaling DOWN: %s instance(s)" % num_instances_to_remove)
-            self.app.manager.remove_instances(num_instances_to_remove)
+            self.app.manager.remove_instances(num_instances_to_remove,
+                instances=self.get_instances_to_remove())
         elif self.too_small():
             num_instances_to_add = self.get_num_instances_to_add()
             log.debug("Autoscaling UP: %s instance(s)" % num_instances_to_add)
-            self.app.manager.add_instances(
-                num_instances_to_add, instance_type=self.instance_type)
+            if self.app.config.fleet_instance_types:
+                # Request the equivalent capacity from any acceptable instance type
+                self.app.manager.add_capacity(
+                    num_instances_to_add * self._get_slots_per_node())
+            else:
+                self.app.manager.add_instances(
+                    num_instances_to_add, instance_type=self.instance_type)
 
     def too_large(self):
         """Check if the current size of the cluster is too large.
            The following checks are included:
                - number of nodes is more than the max size of the cluster set by user
-               - there are idle nodes and a new hour is about to begin (so not to get charged for the new hour)
+               - there are idle nodes whose billing period is about to roll over (so
+                 not to get charged for a new period) or, with per-second billing,
+                 that have been idle for longer than the cool-down period
         """
         # log.debug("Checking if cluster is too LARGE")
-        if len(self.app.manager.worker_instances) > self.as_max:
+        size = self.get_cluster_size()
+        if size > self.as_max:
             log.debug("Cluster is too explicitly large")
             return True
-        elif int(datetime.datetime.utcnow().strftime("%M")) > 57 and \
-            len(self.app.manager.worker_instances) > self.as_min and \
+        elif size > self.as_min and \
                 self.get_num_instances_to_remove() > 0:
-            # len(self.app.manager.get_idle_instances()) > 0 and \
             log.debug("Cluster is too large")
             return True
         return False
@@ -75,46 +222,184 @@ class Autoscale(Service):
         """Check if the current size of the cluster is too small.
            The following checks are included:
                - number of nodes is less than the min size of the cluster set by user
-               - minute in the current hour is less than 54 (this is to ensure down-scaling and up-scaling don't conflict)
-               - there are no idle resources, jobs are queued and job turnaround time is slow
+               - the autoscaling policy deems more nodes are needed (e.g., there are no
+                 idle resources, jobs are queued and job turnaround time is slow)
+           Because down-scaling is checked first, scaling up and down do not conflict.
         """
-        log.debug("Checking if cluster too SMALL: minute:%s,idle:%s,total workers:%s,avail workers:%s,min:%s,max:%s" %
-                 (datetime.datetime.utcnow().strftime("%M"), len(self.app.manager.get_idle_instances()),
-                  len(self.app.manager.worker_instances), self.app.manager.get_num_available_workers(), self.as_min, self.as_max))
+        size = self.get_cluster_size()
+        log.debug("Checking if cluster too SMALL: idle:%s,total workers:%s,avail workers:%s,size:%s %s,min:%s,max:%s" %
+                 (len(self.app.manager.get_idle_instances()),
+                  len(self._get_workers()), self.app.manager.get_num_available_workers(),
+                  size, self.units, self.as_min, self.as_max))
 
-        if len(self.app.manager.worker_instances) < self.as_min:
+        if size < self.as_min:
             return True
-        elif int(datetime.datetime.utcnow().strftime("%M")) < 55 and \
-            len(self.app.manager.get_idle_instances()) == 0 and \
-            len(self.app.manager.worker_instances) < self.as_max and \
-            len(self.app.manager.worker_instances) == self.app.manager.get_num_available_workers() and \
-                self.slow_job_turnover():
+        elif size < self.as_max and \
+            len(self._get_workers()) == self.app.manager.get_num_available_workers() and \
+                self.get_target_size() > len(self._get_workers()):
             return True
         return False
 
-    ## *************** Helper methods ***************
-    def slow_job_turnover(self, threshold=60, num_queued_jobs=2):
-        """Decide if the jobs currently in the queue are turning over slowly.
-           This is a simple heuristic, best-effort implementation that looks at the
-           mean time jobs are running and, if that time is greater than the threshold
-           and there are more queued jobs than num_queued_jobs, returns True.
-           :type threshold: int
-           :param threshold: Number of seconds that the mean time of running jobs must
-                             exceed to indicate slow job turnover
-          :type num_queued_jobs: int
-          :param num_queued_jobs: Number of jobs that should be queued before indicating slow job turnover
-        """
-        q_jobs = self.get_queue_jobs()
-        # log.debug('q_jobs: %s' % q_jobs)
-        r_jobs_mean, r_jobs_stdv = self.meanstdv(q_jobs['running'])
-        qw_jobs_mean, qw_jobs_stdv = self.meanstdv(q_jobs['queued'])
-        log.debug('Checking if slow job turnover: queued jobs: %s, avg runtime: %s' % (len(
-            q_jobs['queued']), r_jobs_mean))
-        if len(q_jobs['queued']) > num_queued_jobs and \
-                r_jobs_mean > threshold:
-            return True
-        return False
+    def record_sample(self):
+        """
+        Capture the current state of the cluster (queue depth, job arrival
+        rate and slot usage) into ``self.history`` and return the sample.
+        """
+        now = time.time()
+        idle_instances = self.app.manager.get_idle_instances()
+        self._update_idle_times(idle_instances)
+        if hasattr(self.app.manager, 'get_slot_capacity'):
+            self.capacity = self.app.manager.get_slot_capacity()
+        sample = Bunch(time=now, workers=len(self._get_workers()),
+                       idle=len(idle_instances),
+                       queued_jobs=0, running_jobs=0, queued_slots=0, running_slots=0,
+                       free_slots=0, total_slots=0, running_time_mean=0,
+                       wait_time_mean=0, wait_time_max=0, arrival_rate=0.0,
+                       slots_per_node=self._get_slots_per_node())
+        snapshot = self._get_queue_snapshot()
+        if snapshot:
+            for host in snapshot.hosts:
+                if not any(st in host.state for st in UNAVAILABLE_QUEUE_STATES):
+                    sample.total_slots += host.slots_total
+                    sample.free_slots += max(0, host.slots_total - host.slots_used)
+            job_ids = set()
+            for job in snapshot.jobs:
+                job_ids.add(job.id)
+                if job.state == 'r':
+                    sample.running_jobs += 1
+                    sample.running_slots += job.slots
+                elif job.state == 'qw':
+                    # Only pending jobs that can be scheduled (i.e., not held
+                    # (hqw) or in error (Eqw)) are worth adding capacity for
+                    sample.queued_jobs += 1
+                    sample.queued_slots += job.slots
+            if self.history:
+                new_jobs = len(job_ids - self.seen_jobs)
+                sample.arrival_rate = new_jobs / max(1.0, now - self.history[-1].time)
+            self.seen_jobs = job_ids
+            q_jobs = self.get_queue_jobs()
+            sample.running_time_mean = metrics.mean(q_jobs['running']) or 0
+            sample.wait_time_mean = metrics.mean(q_jobs['queued']) or 0
+            sample.wait_time_max = max(q_jobs['queued'] or [0])
+        self.history.append(sample)
+        slot_occupancy = None
+        if sample.total_slots:
+            slot_occupancy = float(sample.total_slots - sample.free_slots) / sample.total_slots
+        self.metrics.record(now, workers=sample.workers, idle=sample.idle,
+                            queued_jobs=sample.queued_jobs, running_jobs=sample.running_jobs,
+                            queued_slots=sample.queued_slots, running_slots=sample.running_slots,
+                            slot_occupancy=slot_occupancy, arrival_rate=sample.arrival_rate,
+                            running_time=sample.running_time_mean,
+                            wait_time=sample.wait_time_mean, wait_time_max=sample.wait_time_max)
+        log.debug("Autoscaling sample: workers: %s, idle: %s, queued jobs: %s (%s slots), "
+                  "slots used: %s/%s, job arrival rate: %.3f/s" % (sample.workers,
+                  sample.idle, sample.queued_jobs, sample.queued_slots,
+                  sample.total_slots - sample.free_slots, sample.total_slots,
+                  sample.arrival_rate))
+        return sample
 
+    def _update_idle_times(self, idle_instances):
+        """
+        Keep track of how long each worker instance has been idle for.
+        """
+        now = datetime.datetime.utcnow()
+        idle_ids = set(inst.id for inst in idle_instances)
+        for inst in self.app.manager.worker_instances:
+            if inst.id not in idle_ids:
+                inst.idle_since = None
+            elif getattr(inst, 'idle_since', None) is None:
+                inst.idle_since = now
+
+    def _get_idle_seconds(self, inst):
+        idle_since = getattr(inst, 'idle_since', None)
+        if idle_since is None:
+            return 0
+        return self.total_seconds(datetime.datetime.utcnow() - idle_since)
+
+    def get_removable_instances(self, all_idle=False):
+        """
+        Return the list of idle instances that should be removed now, ranked
+        in the order they should be removed in. With hourly billing, these
+        are the instances whose billing period rolls over within
+        ``scale_down_window`` seconds, the closest to the boundary first. With
+        per-second billing, these are the instances that have been idle for
+        at least ``idle_cooldown`` seconds, the longest idle first. If
+        ``all_idle`` is set, all idle instances are returned, ranked the same way.
+        """
+        idle_instances = self.app.manager.get_idle_instances()
+        if self.billing_mode == PER_SECOND_BILLING:
+            if not all_idle:
+                idle_instances = [i for i in idle_instances
+                                  if self._get_idle_seconds(i) >= self.idle_cooldown]
+            return sorted(idle_instances, key=self._get_idle_seconds, reverse=True)
+        to_boundary = dict((i.id, i.get_seconds_to_billing_boundary(self.billing_period))
+                           for i in idle_instances)
+        if not all_idle:
+            idle_instances = [i for i in idle_instances
+                              if to_boundary[i.id] <= self.scale_down_window]
+        return sorted(idle_instances, key=lambda i: to_boundary[i.id])
+
+    def get_target_size(self):
+        """
+        Return the number of worker instances the autoscaling policy deems
+        the cluster should have, not accounting for the autoscaling limits.
+        """
+        if not self.history:
+            self.record_sample()
+        return self.policy.get_target_size(
+            len(self._get_workers()), self.history)
+
+    def _get_queue_snapshot(self):
+        try:
+            sge_svc = self.app.manager.get_services(svc_role=ServiceRole.SGE)[0]
+        except IndexError:
+            return None
+        return sge_svc.get_queue_snapshot()
+
+    def _get_slots_per_node(self):
+        """
+        Return the average number of job slots (i.e., CPUs) of a worker instance.
+        """
+        slots = [self._get_instance_slots(w) for w in self._get_workers()]
+        if slots:
+            return max(1, sum(slots) / len(slots))
+        if self.app.config.fleet_instance_types:
+            return max(1, self.app.config.fleet_instance_types[0][1])
+        return 1
+
+    def _get_workers(self):
+        """
+        Return the worker instances that count toward the size of the cluster
+        (i.e., excluding standby instances kept in the warm pool).
+        """
+        if hasattr(self.app.manager, 'get_active_instances'):
+            return self.app.manager.get_active_instances()
+        return self.app.manager.worker_instances
+
+    def _get_instance_slots(self, inst):
+        if self.capacity and inst.id in self.capacity.nodes:
+            return self.capacity.nodes[inst.id].total
+        if hasattr(inst, 'get_num_slots'):
+            return inst.get_num_slots()
+        return max(1, int(getattr(inst, 'num_cpus', 1)))
+
+    def _get_instance_size(self, inst):
+        """
+        Return how much ``inst`` counts toward the size of the cluster, in
+        the units the autoscaling limits are expressed in.
+        """
+        if self.units == SLOT_UNITS:
+            return self._get_instance_slots(inst)
+        return 1
+
+    def get_cluster_size(self):
+        """
+        Return the current size of the cluster in the units the autoscaling
+        limits are expressed in (i.e., number of worker nodes or job slots).
+        """
+        return sum(self._get_instance_size(w) for w in self._get_workers())
+
+    ## *************** Helper methods ***************
     def get_queue_jobs(self):
         """Query SGE queue and filter running and queued jobs. Then, calculate total
            time in the queue (running or queued) for each of the jobs. Return a dict
@@ -124,74 +409,73 @@ class Autoscale(Service):
         """
         running_jobs = []
         queued_jobs = []
-        cmd = "%s/bin/lx24-amd64/qstat -f -u '*' | tr -s ' ' | grep ^' [0-9]' | cut -d' ' -f6,7,8" % self.app.path_resolver.sge_root
-        qstat_out = commands.getoutput(cmd)
-        # log.debug('Plain qstat_out for cmd "%s":\n"%s"' % (cmd, qstat_out))
-        if qstat_out != '':  # else, the job queue is empty so just return
-            qstat_out = qstat_out.split('\n')
-            # log.debug('Split qstat_out: %s' % qstat_out)
-            now = datetime.datetime.utcnow()
-            for job in qstat_out:
-                try:
-                    # log.debug('Autoscaling qstat_out: %s' % qstat_out)
-                    job_state = job.split()[0]
-                    job_time_entered_state = datetime.datetime(*time.strptime(
-                        job.split()[1] + ' ' + job.split()[2], "%m/%d/%Y %H:%M:%S")[0:6])
-                    if job_state == 'r':
-                        running_jobs.append(
-                            self.total_seconds(now - job_time_entered_state))
-                    elif job_state == 'qw':
-                        queued_jobs.append(
-                            self.total_seconds(now - job_time_entered_state))
-                except Exception, e:
-                    log.debug(
-                        "Trouble parsing qstat output (%s) as part of autoscaling: %s" % (qstat_out, e))
+        try:
+            sge_svc = self.app.manager.get_services(svc_role=ServiceRole.SGE)[0]
+        except IndexError:
+            return {'running': running_jobs, 'queued': queued_jobs}
+        # Use the (cached) queue state shared with the other SGE consumers
+        snapshot = sge_svc.get_queue_snapshot()
+        now = datetime.datetime.utcnow()
+        for job in snapshot.jobs:
+            if job.time is None:
+                log.debug("Trouble parsing qstat output (job %s) as part of autoscaling" % job.id)
+                continue
+            if job.state == 'r':
+                running_jobs.append(self.total_seconds(now - job.time))
+            elif job.state == 'qw':
+                queued_jobs.append(self.total_seconds(now - job.time))
         return {'running': running_jobs, 'queued': queued_jobs}
 
+    def get_instances_to_remove(self):
+        """Return the list of instances to remove during auto-DOWN-scaling, in
+           the order they should be removed in. These are the idle instances
+           that are due for removal (see ``get_removable_instances``) or, if the
+           cluster is larger than ``as_max``, as many idle instances as needed to
+           bring it down to ``as_max``, while respecting the min size of the
+           cluster that autoscaling should maintain."""
+        size = self.get_cluster_size()
+        over_max = size > self.as_max
+        to_remove = []
+        for inst in self.get_removable_instances(all_idle=over_max):
+            # If there are already more running instances than the current as_max,
+            # leave the max number of instances running after scaling down
+            if over_max and size <= self.as_max:
+                break
+            inst_size = self._get_instance_size(inst)
+            # Ensure the as_min size of the cluster is maintained
+            if size - inst_size < self.as_min:
+                continue
+            to_remove.append(inst)
+            size -= inst_size
+        return to_remove
+
     def get_num_instances_to_remove(self):
-        """Return the number of instance to remove during auto-DOWN-scaling.
-           The function returns the number of idle instances while respecting
-           the min number of instances that autoscaling should maintain."""
-        num_instances_to_remove = len(self.app.manager.get_idle_instances())
-        # If there are already more running instances than the current as_max,
-        # leave the max number of instances running after scaling down
-        if len(self.app.manager.worker_instances) > int(self.as_max):
-            num_instances_to_remove = len(
-                self.app.manager.worker_instances) - int(self.as_max)
-        # Ensure the as_min number of instances are maintained
-        if len(self.app.manager.worker_instances) - num_instances_to_remove < self.as_min:
-            num_instances_to_remove = len(
-                self.app.manager.worker_instances) - int(self.as_min)
-        return num_instances_to_remove
+        """Return the number of instance to remove during auto-DOWN-scaling
+           (see ``get_instances_to_remove``)."""
+        return len(self.get_instances_to_remove())
 
     def get_num_instances_to_add(self):
         """Return the number of instance to add during auto-UP-scaling.
-           The function returns 1 unless the number of instances autoscaling should
-           maintain is less then the current number of instances. In that case, it
-           returns the difference."""
-        num_instances_to_add = 1  # Add one instance at a time for now
-        if len(self.app.manager.worker_instances) + num_instances_to_add < self.as_min:
-            num_instances_to_add = int(
-                self.as_min) - len(self.app.manager.worker_instances)
-        elif len(self.app.manager.worker_instances) + num_instances_to_add > self.as_max:
-            num_instances_to_add = 0  # Already at as_max
-        return num_instances_to_add
+           The function returns the difference between the target size of the
+           cluster computed by the autoscaling policy and the current number of
+           instances (adding at most ``self.max_step`` instances at once) while
+           respecting the min and max size of the cluster autoscaling should
+           maintain."""
+        current = len(self._get_workers())
+        size = self.get_cluster_size()
+        # Size (in nodes or slots) a new instance is expected to add
+        new_size = self._get_slots_per_node() if self.units == SLOT_UNITS else 1
+        num_instances_to_add = min(max(0, self.get_target_size() - current), self.max_step)
+        if size + num_instances_to_add * new_size < self.as_min:
+            num_instances_to_add = int(math.ceil(float(self.as_min - size) / new_size))
+        if size + num_instances_to_add * new_size > self.as_max:
+            num_instances_to_add = int(math.floor(float(self.as_max - size) / new_size))
+        return max(0, num_instances_to_add)
 
     def total_seconds(self, td):
         """Compute the total number of seconds in a timedelta object td"""
         return td.seconds + td.days * 24 * 3600
 
-    def meanstdv(self, x):
-        """Compute mean and standard deviation of a list x"""
-        from math import sqrt
-        n, std, mean = len(x), 0, 0
-        if n > 0:
-            mean = sum(x) / n
-        if n > 1:
-            for a in x:
-                std += (a - mean) ** 2
-            std = sqrt(std / float(n - 1))
-        return mean, std
-
     def __str__(self):
-        return "Autoscaling limits min: %s max: %s; instance type: '%s'" % (self.as_min, self.as_max, self.instance_type)
+        return "Autoscaling limits min: %s max: %s %s; instance type: '%s'; policy: '%s'; billing: '%s'" % (
+            self.as_min, self.as_max, self.units, self.instance_type, self.policy.name, self.billing_mode)
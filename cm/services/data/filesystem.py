@@ -3,6 +3,7 @@ A core class for what CloudMan sees as a file system. This means that it is
 aware of it and can thus manipulate it.
 """
 import os
+import math
 import shutil
 import commands
 import threading
@@ -13,11 +14,16 @@ from boto.exception import EC2ResponseError
 from cm.util.misc import run
 from cm.util.misc import flock
 from cm.util.misc import nice_size
+from cm.util.pool import ThreadPool
 from cm.services import service_states
 from cm.services import ServiceRole
 from cm.services.data import DataService
+from cm.services.data import volume_status
 from cm.services.data.mountablefs import MountableFS
 from cm.services.data.volume import Volume
+from cm.services.data.volume import wait_for_snapshots
+from cm.services.data.striped import StripedVolume
+from cm.services.data.striped import DEFAULT_STRIPE_SIZE, DEFAULT_STRIPING_METHOD
 from cm.services.data.bucket import Bucket
 from cm.services.data.transient_storage import TransientStorage
 
@@ -41,13 +47,14 @@ class Filesystem(DataService):
         self.transient_storage = []  # Instance's transient storage
         self.nfs_fs = None  # NFS file system object implementing this file system's device
         self.gluster_fs = None  # GlusterFs based file system object implementing this file system's device
+        self.striped = None  # Striped device (over self.volumes) implementing this file system's device
         self.name = name  # File system name
         self.persistent = persistent  # Whether it should be part of the cluster config
         self.size = None  # Total size of this file system
         self.size_used = None  # Used size of the this file system
         self.size_pct = None  # Used percentage of this file system
         self.dirty = False
-        self.kind = None  # Choice of 'snapshot', 'volume', 'bucket', 'transient', or 'nfs'
+        self.kind = None  # Choice of 'snapshot', 'volume', 'striped', 'bucket', 'transient', or 'nfs'
         self.mount_point = mount_point if mount_point is not None else os.path.join(
             self.app.path_resolver.mount_root, self.name)
         self.grow = None  # Used (APPLICABLE ONLY FOR the galaxyData FS) to indicate a need to grow
@@ -84,6 +91,8 @@ class Filesystem(DataService):
             details = self.nfs_fs._get_details(details)
         if self.kind == 'gluster':
             details = self.gluster_fs._get_details(details)
+        if self.kind == 'striped':
+            details = self.striped._get_details(details)
         return details
 
     def _get_details(self, details):
@@ -116,10 +125,7 @@ class Filesystem(DataService):
                 # be `added` and thus we know what `kind` a FS is. So, instead of
                 # iterating over all devices, just use `self.kind`-based if/else, right?
                 # See `nfs` case as an example
-                for vol in self.volumes:
-                    # Threading has some issues w/ race conditions over device IDs
-                    # threading.Thread(target=vol.add).start()
-                    vol.add()
+                self._add_volumes(self.volumes)
                 for b in self.buckets:
                     self.kind = 'bucket'
                     threading.Thread(target=b.mount).start()
@@ -132,6 +138,8 @@ class Filesystem(DataService):
                     self.nfs_fs.start()
                 elif self.kind == 'gluster':
                     self.gluster_fs.start()
+                elif self.kind == 'striped':
+                    self.striped.start()
             except Exception, e:
                 log.error("Error adding file system service {0}: {1}".format(
                     self.get_full_name(), e))
@@ -146,6 +154,23 @@ class Filesystem(DataService):
                       .format(self.get_full_name(), service_states.UNSTARTED, self.state))
         return False
 
+    def _add_volumes(self, volumes):
+        """
+        Add (i.e., create, attach and, unless striped, mount) ``volumes``,
+        concurrently if there are several of them; ``Volume.attach`` makes
+        sure they pick distinct devices.
+        """
+        if len(volumes) > 1:
+            pool = ThreadPool(min(len(volumes), self.app.config.storage_workers),
+                              name='{0}-volumes'.format(self.name))
+            try:
+                pool.map(lambda vol: vol.add(), volumes)
+            finally:
+                pool.shutdown()
+        else:
+            for vol in volumes:
+                vol.add()
+
     def remove(self, synchronous=False, delete_devices=False):
         """
         Initiate removal of this file system from the system; do it in a
@@ -189,6 +214,10 @@ class Filesystem(DataService):
         super(Filesystem, self).remove(synchronous=True)
         log.debug("Removing {0} devices".format(self.get_full_name()))
         self.state = service_states.SHUTTING_DOWN
+        if self.striped:
+            # The striped device only needs to be deactivated if its volumes
+            # get detached
+            self.striped.stop(deactivate=detach)
         for vol in self.volumes:
             vol.remove(self.mount_point, delete_vols=delete_devices, detach=detach)
         for b in self.buckets:
@@ -224,14 +253,119 @@ class Filesystem(DataService):
             log.warning("Wanted to clean file system {0} but the service is not in state '{1}'; "
                         "it in state '{2}'").format(self.name, service_states.SHUT_DOWN, self.state)
 
-    def expand(self):
-        """
-        Exapnd the size of this file system. Note that this process requires
-        the file system to be unmounted during the operation and the new one
-        will be automatically remounted upon completion of the process.
+    def can_expand_online(self):
+        """
+        Return ``True`` if this file system can be expanded while it stays
+        mounted, i.e., all the volumes composing this file system are attached
+        and either the cloud supports resizing attached volumes or, for a
+        striped file system, its striped device can be grown (if need be, by
+        adding new stripes, see ``_expand_with_new_stripes``).
+        """
+        return bool(self.volumes and
+                    (self.striped.can_grow if self.striped else
+                     self.app.cloud_interface.supports_volume_resize) and
+                    all(vol.status == volume_status.ATTACHED for vol in self.volumes))
+
+    def _expand_online(self):
+        """
+        Grow the volumes composing this file system in place and then grow
+        the file system, all while it stays mounted and in use. Return
+        ``None`` if the cloud rejected resizing the (first) volume, in which
+        case nothing was changed and the file system can be expanded offline
+        instead.
+        """
+        log.info("Expanding {0} to {1}GB online".format(self.get_full_name(),
+                                                        self.grow['new_size']))
+        if self.striped and not self.app.cloud_interface.supports_volume_resize:
+            return self._expand_with_new_stripes()
+        new_size = self.grow['new_size']
+        if self.striped:
+            # The new size is spread evenly over the stripes
+            new_size = int(math.ceil(float(new_size) / len(self.volumes)))
+        for i, vol in enumerate(self.volumes):
+            if not vol.resize(new_size):
+                if i == 0 and vol.size < new_size:
+                    log.warning("Could not resize the volumes of {0} in place".format(
+                                self.get_full_name()))
+                    if self.striped:
+                        return self._expand_with_new_stripes()
+                    return None
+                log.error("Could not expand {0}".format(self.get_full_name()))
+                self.grow = None
+                self.status()
+                return False
+        if self.striped and not self.striped.grow():
+            log.error("Could not grow the striped device of {0}".format(self.get_full_name()))
+            self.grow = None
+            self.status()
+            return False
+        ok = run('/usr/sbin/xfs_growfs %s' % self.mount_point, "Error growing file system '%s'"
+                 % self.mount_point, "Successfully grew file system '%s'" % self.mount_point)
+        self.grow = None  # Reset flag
+        self.status()
+        return ok
+
+    def _expand_with_new_stripes(self):
+        """
+        Grow this striped file system, while it stays mounted, by adding a new
+        set of volumes (one per stripe) providing the missing space to its
+        striped device. Used where the volumes cannot be resized in place.
+        """
+        stripes = len(self.volumes)
+        missing = self.grow['new_size'] - sum(vol.size for vol in self.volumes)
+        vol_size = int(math.ceil(float(missing) / stripes))
+        if vol_size <= 0:
+            log.warning("Not expanding {0} to {1}GB; it is already {2}GB".format(
+                        self.get_full_name(), self.grow['new_size'], self.grow['new_size'] - missing))
+            self.grow = None
+            return False
+        log.info("Expanding {0} with {1} new {2}GB stripe(s)".format(
+                 self.get_full_name(), stripes, vol_size))
+        new_vols = [Volume(self, size=vol_size) for i in range(stripes)]
+        self._add_volumes(new_vols)
+        # The new volumes are part of the file system from now on, even if
+        # growing it fails, so they are not left behind
+        self.volumes.extend(new_vols)
+        new_devices = [vol.device for vol in new_vols]
+        if None in new_devices or not self.striped.grow(new_devices=new_devices):
+            log.error("Could not grow the striped device of {0}".format(self.get_full_name()))
+            self.grow = None
+            self.status()
+            return False
+        ok = run('/usr/sbin/xfs_growfs %s' % self.mount_point, "Error growing file system '%s'"
+                 % self.mount_point, "Successfully grew file system '%s'" % self.mount_point)
+        self.grow = None  # Reset flag
+        self.status()
+        return ok
+
+    def expand(self, online=None):
+        """
+        Exapnd the size of this file system.
+
+        If possible (see ``can_expand_online``), the underlying volumes are
+        resized in place and the file system is grown while it stays mounted.
+        Otherwise, or if the cloud rejects the resize request, this process
+        requires the file system to be unmounted during the operation and the
+        new one will be automatically remounted upon completion of the process.
+        If ``online`` is set to ``True``, only an online expansion is tried and
+        ``None`` is returned if the file system needs to be expanded offline
+        (so the caller can stop the services using it first); if set to
+        ``False``, the file system is expanded offline.
 
         Also note that this method applies only to Volume-based file systems.
         """
+        if self.grow is not None and online is not False and self.can_expand_online():
+            expanded = self._expand_online()
+            if expanded is not None or online:
+                return expanded
+            log.info("Falling back to expanding {0} offline".format(self.get_full_name()))
+        elif online:
+            return None
+        if self.grow is not None and self.striped:
+            log.error("Striped file system {0} can only be expanded online (using LVM)".format(
+                      self.get_full_name()))
+            self.grow = None
+            return False
         if self.grow is not None:
             self.__remove(delete_devices=False, remove_from_master=False)
             self.state = service_states.CONFIGURING
@@ -266,6 +400,7 @@ class Filesystem(DataService):
             for smaller_vol_id in smaller_vol_ids:
                 try:
                     ec2_conn.delete_volume(smaller_vol_id)
+                    self.app.cloud_interface.invalidate_cache('volumes')
                     log.debug("Deleted smaller volume {0} after resizing".format(
                         smaller_vol_id))
                 except EC2ResponseError, e:
@@ -276,6 +411,7 @@ class Filesystem(DataService):
             if self.grow['delete_snap'] is True:
                 try:
                     ec2_conn.delete_snapshot(snap_id)
+                    self.app.cloud_interface.invalidate_cache('snapshots')
                     log.debug("Deleted temporary snapshot {0} created and used during resizing"
                               .format(snap_id))
                 except EC2ResponseError, e:
@@ -290,21 +426,26 @@ class Filesystem(DataService):
 
     def create_snapshot(self, snap_description=None):
         """
-        Create a snapshot of this file system.
+        Create a snapshot of this file system, wait for it to complete and
+        return the list of snapshot IDs (one per volume).
+
+        On clouds that can snapshot attached volumes (i.e., AWS), a running
+        file system is only frozen while the snapshots are being initiated
+        (see ``start_snapshot``). Otherwise, the file system is removed for
+        the duration of the snapshot and added back afterwards.
 
         .. note::
             This functionality applies only to file systems based on volumes.
         """
-        detach = True
-        if self.app.cloud_type == "ec2":
-            # On AWS it is possible to snapshot a volume while it's still
-            # attached so do that because it's faster
-            detach = False
-        self.__remove(delete_devices=False, detach=detach)
-        snap_ids = []
-        # Create a snapshot of the detached volumes
-        for vol in self.volumes:
-            snap_ids.append(vol.create_snapshot(snap_description=snap_description))
+        if self.app.cloud_type == "ec2" and self.state == service_states.RUNNING:
+            return self.finish_snapshot(self.start_snapshot(snap_description))
+        # On AWS it is possible to snapshot a volume while it's still attached
+        self.__remove(delete_devices=False, detach=self.app.cloud_type != "ec2")
+        # Create a snapshot of the detached volumes, waiting for all of them
+        # together
+        snapshots = [(vol, vol.start_snapshot(snap_description=snap_description))
+                     for vol in self.volumes]
+        snap_ids = self.finish_snapshot([(vol, snap) for vol, snap in snapshots if snap])
         # After the snapshot is done, add the file system back as a cluster
         # service
         log.debug("{0} snapshot process completed; adding self to the list of master services"
@@ -313,6 +454,106 @@ class Filesystem(DataService):
         self.app.manager.add_master_service(self)
         return snap_ids
 
+    def _freeze(self, freeze=True):
+        """
+        Suspend (or, if ``freeze`` is ``False``, resume) writes to this file
+        system so its volumes can be snapshotted in a consistent state.
+        """
+        action = 'freeze' if freeze else 'thaw'
+        return run('/usr/sbin/xfs_freeze -{0} {1}'.format('f' if freeze else 'u', self.mount_point),
+                   "Failed to {0} file system {1}".format(action, self.get_full_name()),
+                   "Successfully {0}ed file system {1}".format(
+                       'froze' if freeze else action, self.get_full_name()))
+
+    def start_snapshot(self, snap_description=None):
+        """
+        Initiate a snapshot of each of the volumes composing this file system
+        without unmounting it: the file system is flushed and frozen, the
+        snapshots are initiated concurrently and the file system is thawed
+        right away (a snapshot captures the state of a volume at the time it
+        is initiated). Return a list of ``(Volume, boto snapshot)`` tuples for
+        the snapshots that were initiated; use ``finish_snapshot`` (or
+        ``snapshot_in_background``) to wait for them to complete.
+        """
+        log.info("Initiating snapshot of file system {0}".format(self.get_full_name()))
+        run('/bin/sync')
+        frozen = self._freeze()
+        try:
+            if len(self.volumes) > 1:
+                pool = ThreadPool(min(len(self.volumes), self.app.config.storage_workers),
+                                  name='{0}-snapshots'.format(self.name))
+                try:
+                    tasks = pool.map(lambda vol: vol.start_snapshot(snap_description),
+                                     self.volumes)
+                finally:
+                    pool.shutdown()
+                snaps = [task.result for task in tasks]
+            else:
+                snaps = [vol.start_snapshot(snap_description) for vol in self.volumes]
+        finally:
+            if frozen:
+                self._freeze(False)
+        snapshots = []
+        for vol, snap in zip(self.volumes, snaps):
+            if snap:
+                vol.snapshot_status = snap.status
+                vol.snapshot_progress = snap.progress
+                snapshots.append((vol, snap))
+            else:
+                log.error("Could not initiate a snapshot of volume {0}".format(vol.get_full_name()))
+        return snapshots
+
+    def finish_snapshot(self, snapshots):
+        """
+        Wait for ``snapshots`` (as returned by ``start_snapshot``) to complete
+        and return the list of snapshot IDs (``None`` for the snapshots that
+        failed).
+        """
+        wait_for_snapshots(self.app, snapshots)
+        snap_ids = []
+        for vol, snap in snapshots:
+            if snap.status == 'completed':
+                snap_ids.append(vol.finish_snapshot(snap))
+            else:
+                log.error("Snapshot {0} of volume {1} failed (status: {2})".format(
+                          snap.id, vol.get_full_name(), snap.status))
+                vol.snapshot_status = None
+                vol.snapshot_progress = None
+                snap_ids.append(None)
+        return snap_ids
+
+    def snapshot_in_background(self, snap_description=None, callback=None):
+        """
+        Initiate a snapshot of this file system (see ``start_snapshot``) and
+        track its progress in a separate thread, calling ``callback`` with the
+        list of snapshot IDs once all the snapshots are done. The progress is
+        reported via the volumes' ``snapshot_status`` in the meantime.
+        Return the list of IDs of the snapshots that were initiated.
+        """
+        snapshots = self.start_snapshot(snap_description)
+
+        def track():
+            snap_ids = self.finish_snapshot(snapshots)
+            log.info("Snapshot of file system {0} done: {1}".format(
+                     self.get_full_name(), snap_ids))
+            if callback:
+                callback(snap_ids)
+        threading.Thread(target=track).start()
+        return [snap.id for _, snap in snapshots]
+
+    def use_snapshots(self, snap_ids):
+        """
+        Record ``snap_ids`` (one per volume) as the snapshots this file
+        system's volumes originate from, as if the volumes had been recreated
+        from those snapshots, so they get used when the cluster is restarted.
+        """
+        for vol, snap_id in zip(self.volumes, snap_ids):
+            vol.from_snapshot_id = snap_id
+            # See Volume.add; a striped file system remains striped
+            if ServiceRole.GALAXY_DATA not in self.svc_roles and not self.striped:
+                vol.static = True
+                self.kind = 'snapshot'
+
     def _get_attach_device_from_device(self, device):
         """
         Get the device a volume is attached as from the volume itself (i.e.,
@@ -322,7 +563,8 @@ class Filesystem(DataService):
         """
         for vol in self.volumes:
             if device == vol.device:
-                # This is limited to file systems composed from 1 volume only
+                # This is limited to file systems composed from 1 volume only;
+                # a striped file system is mounted from its striped device
                 return vol.attach_device
         return None
 
@@ -560,7 +802,7 @@ class Filesystem(DataService):
                 try:
                     device, mnt_path = mnt_location[1].split(' ')
                     # Check volume(s) if part of the file system
-                    if len(self.volumes) > 0:
+                    if len(self.volumes) > 0 and not self.striped:
                         self.check_and_update_volume(
                             self._get_attach_device_from_device(device))
                     # Check mount point
@@ -597,6 +839,34 @@ class Filesystem(DataService):
         self.volumes.append(Volume(self, vol_id=vol_id, size=size,
                             from_snapshot_id=from_snapshot_id, static=dot, from_archive=from_archive))
 
+    def add_striped(self, vol_ids=None, size=0, num_volumes=2, snap_ids=None,
+                    method=DEFAULT_STRIPING_METHOD, stripe_size=DEFAULT_STRIPE_SIZE):
+        """
+        Make this a file system striped over several volumes: either the
+        existing volumes ``vol_ids``, volumes created from the snapshots
+        ``snap_ids`` (one per volume) or ``num_volumes`` new volumes adding up
+        to ``size`` GB. If both ``vol_ids`` and ``snap_ids`` are given, the
+        latter are recorded as the snapshots the volumes originate from. See
+        ``cm.services.data.striped``.
+        """
+        log.debug("Adding a {0}-striped device over volumes {1} (snapshots={2}, size={3}, "
+                  "num_volumes={4}) into Filesystem {5}".format(method, vol_ids, snap_ids, size,
+                                                                num_volumes, self.get_full_name()))
+        self.kind = 'striped'
+        self.striped = StripedVolume(self, method=method, stripe_size=stripe_size)
+        if vol_ids:
+            snap_ids = snap_ids if snap_ids and len(snap_ids) == len(vol_ids) else [None] * len(vol_ids)
+            for vol_id, snap_id in zip(vol_ids, snap_ids):
+                self.add_volume(vol_id=vol_id, from_snapshot_id=snap_id)
+        elif snap_ids:
+            for snap_id in snap_ids:
+                self.add_volume(from_snapshot_id=snap_id)
+        else:
+            num_volumes = max(1, int(num_volumes))
+            vol_size = int(math.ceil(float(size) / num_volumes))
+            for i in range(num_volumes):
+                self.add_volume(size=vol_size)
+
     def add_bucket(self, bucket_name, bucket_a_key=None, bucket_s_key=None):
         """
         Add a bucket to this file system.
@@ -0,0 +1,190 @@
+"""
+A file system striped (RAID0) over several volumes for higher throughput than
+a single volume can provide. The striped device is built either with LVM (the
+default; it can be grown online) or with Linux software RAID (md) over the
+devices of the volumes composing the encapsulating file system.
+"""
+import os
+import grp
+import pwd
+
+from cm.util.misc import run
+
+import logging
+log = logging.getLogger('cloudman')
+
+STRIPING_METHODS = ['lvm', 'md']
+DEFAULT_STRIPING_METHOD = 'lvm'
+DEFAULT_STRIPE_SIZE = 256  # KB
+
+
+class StripedVolume(object):
+
+    def __init__(self, filesystem, method=DEFAULT_STRIPING_METHOD,
+                 stripe_size=DEFAULT_STRIPE_SIZE):
+        self.fs = filesystem  # File system encapsulating this implementation
+        self.app = self.fs.app
+        if method not in STRIPING_METHODS:
+            log.warning("Unknown striping method '{0}'; using '{1}'".format(
+                method, DEFAULT_STRIPING_METHOD))
+            method = DEFAULT_STRIPING_METHOD
+        self.method = method
+        self.stripe_size = int(stripe_size)
+
+    def __str__(self):
+        return str(self.device)
+
+    def __repr__(self):
+        return str(self.device)
+
+    @property
+    def vg_name(self):
+        return 'cm_{0}'.format(self.fs.name)
+
+    @property
+    def device(self):
+        """
+        The striped device, as visible by the operating system.
+        """
+        if self.method == 'lvm':
+            return '/dev/{0}/data'.format(self.vg_name)
+        return '/dev/md/{0}'.format(self.fs.name)
+
+    @property
+    def devices(self):
+        """
+        The devices of the volumes the striped device is built over.
+        """
+        return [vol.device for vol in self.fs.volumes]
+
+    def _get_details(self, details):
+        details['device'] = self.device
+        details['striping'] = self.method
+        details['stripes'] = len(self.fs.volumes)
+        return details
+
+    def _is_member(self, device):
+        """
+        Check if ``device`` already belongs to a (LVM or md) striped device.
+        """
+        if self.method == 'lvm':
+            return run('/sbin/pvs {0}'.format(device), quiet=True) is not False
+        return run('/sbin/mdadm --examine {0}'.format(device), quiet=True) is not False
+
+    def _assemble(self):
+        """
+        Activate a previously created striped device from the attached volumes.
+        """
+        if self.method == 'lvm':
+            run('/sbin/vgscan', quiet=True)
+            return run('/sbin/vgchange -ay {0}'.format(self.vg_name),
+                       "Error activating volume group {0}".format(self.vg_name),
+                       "Activated volume group {0}".format(self.vg_name))
+        if os.path.exists(self.device):
+            return True
+        return run('/sbin/mdadm --assemble {0} {1}'.format(self.device, ' '.join(self.devices)),
+                   "Error assembling RAID device {0}".format(self.device),
+                   "Assembled RAID device {0}".format(self.device))
+
+    def _create(self):
+        """
+        Create a new striped device over the attached volumes and create a
+        file system on it.
+        """
+        devices = ' '.join(self.devices)
+        stripes = len(self.devices)
+        if self.method == 'lvm':
+            ok = (run('/sbin/pvcreate {0}'.format(devices)) and
+                  run('/sbin/vgcreate {0} {1}'.format(self.vg_name, devices)) and
+                  run('/sbin/lvcreate -i {0} -I {1} -l 100%FREE -n data {2}'.format(
+                      stripes, self.stripe_size, self.vg_name)))
+        else:
+            ok = run('/sbin/mdadm --create {0} --run --level=0 --chunk={1} --raid-devices={2} {3}'
+                     .format(self.device, self.stripe_size, stripes, devices))
+        if not ok:
+            log.error("Failed to create a striped device over {0}".format(devices))
+            return False
+        return run('/sbin/mkfs.xfs {0}'.format(self.device),
+                   "Failed to create a file system on device {0}".format(self.device),
+                   "Created a file system on device {0}".format(self.device))
+
+    def start(self):
+        """
+        Assemble the striped device (creating it if none of the volumes are
+        part of one yet), mount it at the file system's mount point and share
+        it over NFS.
+        """
+        devices = self.devices
+        if not devices or None in devices:
+            log.error("Not all the volumes of {0} are attached ({1}); cannot start the "
+                      "striped device".format(self.fs.get_full_name(), devices))
+            return False
+        members = [d for d in devices if self._is_member(d)]
+        if members:
+            if not self._assemble():
+                return False
+        elif not self._create():
+            return False
+        if not os.path.exists(self.fs.mount_point):
+            os.makedirs(self.fs.mount_point)
+        if not run('/bin/mount {0} {1}'.format(self.device, self.fs.mount_point),
+                   "Error mounting striped device {0}".format(self.device),
+                   "Mounted striped device {0} at {1}".format(self.device, self.fs.mount_point)):
+            return False
+        try:
+            os.chown(self.fs.mount_point, pwd.getpwnam("galaxy")[2], grp.getgrnam("galaxy")[2])
+        except (KeyError, OSError), e:
+            log.debug("Could not change the owner of {0}: {1}".format(self.fs.mount_point, e))
+        return self.fs.add_nfs_share(self.fs.mount_point)
+
+    def stop(self, deactivate=True):
+        """
+        Unmount the file system and, if ``deactivate`` is set, deactivate the
+        striped device so the volumes can be detached.
+        """
+        self.fs.remove_nfs_share(self.fs.mount_point)
+        if os.path.ismount(self.fs.mount_point):
+            if not run('/bin/umount {0}'.format(self.fs.mount_point),
+                       "Error unmounting file system {0}".format(self.fs.mount_point),
+                       "Unmounted file system {0}".format(self.fs.mount_point)):
+                return False
+        if not deactivate:
+            return True
+        if self.method == 'lvm':
+            return run('/sbin/vgchange -an {0}'.format(self.vg_name),
+                       "Error deactivating volume group {0}".format(self.vg_name),
+                       "Deactivated volume group {0}".format(self.vg_name))
+        return run('/sbin/mdadm --stop {0}'.format(self.device),
+                   "Error stopping RAID device {0}".format(self.device),
+                   "Stopped RAID device {0}".format(self.device))
+
+    @property
+    def can_grow(self):
+        """
+        Only LVM-based striped devices can be grown (while in use).
+        """
+        return self.method == 'lvm'
+
+    def grow(self, new_devices=None):
+        """
+        Grow the striped device after its volumes have been resized or after
+        ``new_devices`` (as many as there are stripes) were attached.
+        The file system on the device still needs to be grown afterwards.
+        """
+        if not self.can_grow:
+            log.error("Cannot grow {0}-based striped device {1}".format(self.method, self.device))
+            return False
+        if new_devices:
+            devices = ' '.join(new_devices)
+            if not (run('/sbin/pvcreate {0}'.format(devices)) and
+                    run('/sbin/vgextend {0} {1}'.format(self.vg_name, devices))):
+                return False
+        else:
+            for device in self.devices:
+                if not run('/sbin/pvresize {0}'.format(device)):
+                    return False
+        stripes = len(new_devices) if new_devices else len(self.devices)
+        return run('/sbin/lvextend -i {0} -I {1} -l +100%FREE {2}'.format(
+                   stripes, self.stripe_size, self.device),
+                   "Error extending striped device {0}".format(self.device),
+                   "Extended striped device {0}".format(self.device))
@@ -6,6 +6,8 @@ import os
 import grp
 import pwd
 import time
+import commands
+import threading
 import subprocess
 from glob import glob
 
@@ -18,12 +20,18 @@ from cm.services import ServiceRole
 from cm.services.data import BlockStorage
 from cm.services.data import volume_status
 from cm.util import misc
+from cm.util.waiter import Waiter
 
 import logging
 log = logging.getLogger('cloudman')
 
 
 MIN_TIME_BETWEEN_STATUS_CHECKS = 2  # seconds to wait before updating volume status
+# Volumes may be attached concurrently so picking a device for a volume and
+# requesting the attachment is serialized; the picked devices stay reserved
+# until the attachment completes so no two volumes pick the same device.
+_attach_lock = threading.Lock()
+_reserved_devices = set()
 volume_status_map = {
     'creating': volume_status.CREATING,
     'available': volume_status.AVAILABLE,
@@ -34,6 +42,36 @@ volume_status_map = {
 }
 
 
+def wait_for_snapshots(app, snapshots, timeout=None):
+    """
+    Wait for ``snapshots``, a list of ``(Volume, boto snapshot)`` tuples, to
+    complete (or fail), describing all of them with a single request per poll
+    and keeping each volume's snapshot progress and the snapshot objects'
+    status up to date.
+    Return ``True`` if all the snapshots completed before ``timeout``.
+    """
+    volumes = dict((snap.id, vol) for vol, snap in snapshots)
+    snaps = dict((snap.id, snap) for vol, snap in snapshots)
+
+    def describe(snap_ids):
+        described = app.cloud_interface.get_all_snapshots(snap_ids, max_age=0)
+        for snap in described:
+            vol = volumes.get(snap.id)
+            if vol:
+                log.debug("Snapshot '%s' progress: '%s'; status: '%s'"
+                          % (snap.id, snap.progress, snap.status))
+                vol.snapshot_progress = snap.progress
+                vol.snapshot_status = snap.status
+                snaps[snap.id].status = snap.status
+                snaps[snap.id].progress = snap.progress
+        return described
+    done = Waiter(timeout, initial_delay=5, max_delay=60).wait_for_many(
+        volumes.keys(), describe, lambda snap: snap.status in ('completed', 'error'),
+        "snapshots {0}".format(', '.join(volumes.keys())))
+    return (len(done) == len(volumes) and
+            all(snap.status == 'completed' for snap in done.values()))
+
+
 class Volume(BlockStorage):
 
     def __init__(
@@ -221,29 +259,15 @@ class Volume(BlockStorage):
             log.debug('Attempted to wait for a status ({0}) on a non-existent volume'.format(status))
             return False  # no volume means not worth waiting
         else:
-            start_time = time.time()
-            end_time = start_time + timeout
-            if timeout == -1:
-                checks = "infinite"
-                wait_time = 5
-                wait_forever = True
-            else:
-                checks = 10
-                wait_time = float(timeout) / checks
-                wait_forever = False
-            while wait_forever or time.time() <= end_time:
-                if self.status == status:
-                    log.debug(
-                        "Volume {0} ({1}) has reached status '{2}'".format(self.volume_id,
-                        self.fs.get_full_name(), status))
-                    return True
-                else:
-                    log.debug('Waiting for volume {0} (status "{1}"; {2}) to reach status "{3}". '
-                              'Remaining checks: {4}'.format(self.volume_id, self.status,
-                                                             self.fs.get_full_name(), status, checks))
-                    if timeout != -1:
-                        checks -= 1
-                    time.sleep(wait_time)
+            waiter = Waiter(timeout=None if timeout == -1 else timeout,
+                            initial_delay=MIN_TIME_BETWEEN_STATUS_CHECKS, max_delay=15)
+            if waiter.wait(lambda: self.status == status,
+                           "volume {0} ({1}) to reach status '{2}'".format(
+                           self.volume_id, self.fs.get_full_name(), status)):
+                log.debug(
+                    "Volume {0} ({1}) has reached status '{2}'".format(self.volume_id,
+                    self.fs.get_full_name(), status))
+                return True
             log.debug('Wait for volume {0} ({1}) to reach status {2} timed out. Current status {3}.'
                       .format(self.volume_id, self.fs.get_full_name(), status, self.status))
             return False
@@ -257,8 +281,8 @@ class Volume(BlockStorage):
             return None
 
         if self.from_snapshot_id and not self.volume:
-            self.snapshot = (self.app.cloud_interface.get_ec2_connection()
-                            .get_all_snapshots([self.from_snapshot_id])[0])
+            self.snapshot = self.app.cloud_interface.get_all_snapshots(
+                [self.from_snapshot_id])[0]
             # We need a size to be able to create a volume, so if none
             # is specified, use snapshot size
             if self.size == 0:
@@ -284,6 +308,7 @@ class Volume(BlockStorage):
                     % (self.size, self.app.cloud_interface.get_zone(), self.from_snapshot_id))
                 self.volume = self.app.cloud_interface.get_ec2_connection().create_volume(
                     self.size, self.app.cloud_interface.get_zone(), snapshot=self.from_snapshot_id)
+                self.app.cloud_interface.invalidate_cache('volumes')
                 self.size = int(self.volume.size or 0)  # when creating from a snapshot
                                                         # in Euca, volume.size may be None
                 log.debug("Created new volume of size '%s' from snapshot '%s' with ID '%s' in zone '%s'"
@@ -317,6 +342,7 @@ class Volume(BlockStorage):
         try:
             volume_id = self.volume_id
             self.volume.delete()
+            self.app.cloud_interface.invalidate_cache('volumes')
             log.debug("Deleted volume '%s'" % volume_id)
             self.volume = None
         except EC2ResponseError, e:
@@ -363,6 +389,37 @@ class Volume(BlockStorage):
         new_id = base + chr(ord(letter) + 1)
         return new_id
 
+    def _device_aliases(self, device):
+        """
+        Return the names a device requested as ``device`` may show up as in
+        the OS (e.g., a volume attached as ``/dev/sdf`` on AWS is visible as
+        ``/dev/xvdf``).
+        """
+        aliases = set([device])
+        if device.startswith('/dev/sd'):
+            aliases.add('/dev/xvd' + device[len('/dev/sd'):])
+        elif device.startswith('/dev/xvd'):
+            aliases.add('/dev/sd' + device[len('/dev/xvd'):])
+        return aliases
+
+    def _get_new_devices(self, pre_devices, own_devices):
+        """
+        Return the set of devices that are not in ``pre_devices``, ignoring
+        devices reserved by other volumes that are being attached concurrently
+        (i.e., other than ``own_devices``).
+        """
+        with _attach_lock:
+            others = _reserved_devices - own_devices
+        return self._get_device_list() - pre_devices - others
+
+    def _wait_for_new_devices(self, pre_devices, own_devices, timeout=10):
+        """
+        Wait up to ``timeout`` seconds for a new device to show up in the OS
+        (see ``_get_new_devices``) and return the set of new devices.
+        """
+        return Waiter(timeout, initial_delay=0.5, max_delay=3).wait(
+            lambda: self._get_new_devices(pre_devices, own_devices))
+
     def _get_likely_next_devices(self, devices=None):
         """
         Returns a list of possible devices to attempt to attempt to attach to.
@@ -373,8 +430,9 @@ class Volume(BlockStorage):
         If either ``/dev/vd?`` or ``/dev/xvd?`` devices exist, then we know to
         use the next of those. Otherwise, test ``/dev/sd?``, ``/dev/xvd?``, then ``/dev/vd?``.
 
-        **This is so totally not thread-safe.** If other devices get attached externally,
-        the device id may already be in use when we get there.
+        Volumes being attached concurrently by CloudMan reserve their devices
+        (see ``attach``), but if other devices get attached externally, the
+        device id may already be in use when we get there.
         """
         if not devices:
             devices = self._get_device_list()
@@ -406,6 +464,7 @@ class Volume(BlockStorage):
                          (self.volume_id, self.app.cloud_interface.get_instance_id(), attach_device))
                 self.volume.attach(
                     self.app.cloud_interface.get_instance_id(), attach_device)
+                self.app.cloud_interface.invalidate_cache('volumes')
             else:
                 log.error("Attaching volume '%s' to instance '%s' failed because could not determine device."
                     % (self.volume_id, self.app.cloud_interface.get_instance_id()))
@@ -460,38 +519,48 @@ class Volume(BlockStorage):
                 return None
 
         # attempt to attach
-        for attempted_device in self._get_likely_next_devices():
+        with _attach_lock:
             pre_devices = self._get_device_list()
-            log.debug(
-                'Before attach, devices = {0}'.format(' '.join(pre_devices)))
-            if self._do_attach(attempted_device):
-                if self.wait_for_status(volume_status.ATTACHED):
-                    time.sleep(10)  # give a few seconds for the device to show up in the OS
-                    post_devices = self._get_device_list()
-                    log.debug('After attach, devices = {0}'.format(
-                        ' '.join(post_devices)))
-                    new_devices = post_devices - pre_devices
-                    log.debug(
-                        'New devices = {0}'.format(' '.join(new_devices)))
-                    if len(new_devices) == 0:
-                        log.debug('Could not find attached device for volume {0}. Attempted device = {1}'
-                            .format(self.volume_id, attempted_device))
-                    elif attempted_device in new_devices:
-                        self.device = attempted_device
-                        return attempted_device
-                    elif len(new_devices) > 1:
-                        log.error("Multiple devices (%s) added to OS during process, "
-                                  "and none are the requested device. Can't determine "
-                                  "new device. Aborting" % ', '.join(new_devices))
-                        return None
-                    else:
-                        device = tuple(new_devices)[0]
-                        self.device = device
-                        return device
-                # requested device didn't attach, for whatever reason
-                if self.status != volume_status.AVAILABLE and attempted_device[-3:-1] != 'vd':
-                    self.detach()  # in case it attached invisibly
-                self.wait_for_status(volume_status.AVAILABLE, 60)
+            candidates = self._get_likely_next_devices(pre_devices | _reserved_devices) or ()
+            reserved = set()
+            for device in candidates:
+                reserved |= self._device_aliases(device)
+            _reserved_devices.update(reserved)
+        try:
+            for attempted_device in candidates:
+                log.debug(
+                    'Before attach, devices = {0}'.format(' '.join(pre_devices)))
+                if self._do_attach(attempted_device):
+                    if self.wait_for_status(volume_status.ATTACHED):
+                        # give a few seconds for the device to show up in the OS
+                        new_devices = self._wait_for_new_devices(pre_devices, reserved)
+                        log.debug(
+                            'New devices = {0}'.format(' '.join(new_devices)))
+                        if len(new_devices) == 0:
+                            log.debug('Could not find attached device for volume {0}. Attempted device = {1}'
+                                .format(self.volume_id, attempted_device))
+                        elif attempted_device in new_devices:
+                            self.device = attempted_device
+                            return attempted_device
+                        elif len(new_devices) > 1:
+                            log.error("Multiple devices (%s) added to OS during process, "
+                                      "and none are the requested device. Can't determine "
+                                      "new device. Aborting" % ', '.join(new_devices))
+                            return None
+                        else:
+                            device = tuple(new_devices)[0]
+                            self.device = device
+                            return device
+                    # requested device didn't attach, for whatever reason
+                    if self.status != volume_status.AVAILABLE and attempted_device[-3:-1] != 'vd':
+                        self.detach()  # in case it attached invisibly
+                    self.wait_for_status(volume_status.AVAILABLE, 60)
+        finally:
+            # The device of an attached volume stays reserved until it is
+            # detached, so it cannot be taken for a concurrently attached one
+            attached = self._device_aliases(self.device) if self.device else set()
+            with _attach_lock:
+                _reserved_devices.difference_update(reserved - attached)
         return None  # no device properly attached
 
     def detach(self):
@@ -502,6 +571,7 @@ class Volume(BlockStorage):
         if self.status == volume_status.ATTACHED or self.status == volume_status.IN_USE:
             try:
                 self.volume.detach()
+                self.app.cloud_interface.invalidate_cache('volumes')
             except EC2ResponseError, e:
                 log.error("Detaching volume '%s' from instance '%s' failed. Exception: %s"
                     % (self.volume_id, self.app.cloud_interface.get_instance_id(), e))
@@ -523,6 +593,9 @@ class Volume(BlockStorage):
             log.warning("Cannot detach volume '%s' in state '%s'" % (
                 self.volume_id, self.status))
             return False
+        if self.device:
+            with _attach_lock:
+                _reserved_devices.difference_update(self._device_aliases(self.device))
         return True
 
     def create_snapshot(self, snap_description=None):
@@ -530,37 +603,89 @@ class Volume(BlockStorage):
         Crete a point-in-time snapshot of the current volume, optionally specifying
         a description for the snapshot.
         """
+        snapshot = self.start_snapshot(snap_description)
+        if snapshot and wait_for_snapshots(self.app, [(self, snapshot)]):
+            return self.finish_snapshot(snapshot)
+        else:
+            log.error(
+                "Could not create snapshot from volume '%s'" % self.volume_id)
+            self.snapshot_progress = None
+            self.snapshot_status = None
+            return None
+
+    def start_snapshot(self, snap_description=None):
+        """
+        Initiate creation of a snapshot of the current volume and return the
+        boto snapshot object without waiting for the snapshot to complete.
+        """
         log.info("Initiating creation of a snapshot for the volume '%s'" %
                  self.volume_id)
         try:
             snapshot = self.volume.create_snapshot(
                 description=snap_description)
+            self.app.cloud_interface.invalidate_cache('snapshots')
         except EC2ResponseError as ex:
             log.error("Error creating a snapshot from volume '%s': %s" %
                       (self.volume_id, ex))
             raise
-        if snapshot:
-            while snapshot.status != 'completed':
-                log.debug("Snapshot '%s' progress: '%s'; status: '%s'"
-                          % (snapshot.id, snapshot.progress, snapshot.status))
-                self.snapshot_progress = snapshot.progress
-                self.snapshot_status = snapshot.status
-                time.sleep(6)
-                snapshot.update()
-            log.info("Completed creation of a snapshot for the volume '%s', snap id: '%s'"
-                % (self.volume_id, snapshot.id))
-            self.app.cloud_interface.add_tag(snapshot, 'clusterName',
-                self.app.ud['cluster_name'])
-            self.app.cloud_interface.add_tag(
-                self.volume, 'bucketName', self.app.ud['bucket_cluster'])
-            self.app.cloud_interface.add_tag(self.volume, 'filesystem', self.fs.name)
-            self.snapshot_progress = None  # Reset because of the UI
-            self.snapshot_status = None  # Reset because of the UI
-            return str(snapshot.id)
-        else:
-            log.error(
-                "Could not create snapshot from volume '%s'" % self.volume_id)
-            return None
+        return snapshot
+
+    def finish_snapshot(self, snapshot):
+        """
+        Tag the completed ``snapshot`` of the current volume and return its ID.
+        """
+        log.info("Completed creation of a snapshot for the volume '%s', snap id: '%s'"
+            % (self.volume_id, snapshot.id))
+        self.app.cloud_interface.add_tag(snapshot, 'clusterName',
+            self.app.ud['cluster_name'])
+        self.app.cloud_interface.add_tag(
+            self.volume, 'bucketName', self.app.ud['bucket_cluster'])
+        self.app.cloud_interface.add_tag(self.volume, 'filesystem', self.fs.name)
+        self.snapshot_progress = None  # Reset because of the UI
+        self.snapshot_status = None  # Reset because of the UI
+        return str(snapshot.id)
+
+    def _get_device_size(self):
+        """
+        Return the size (in bytes) of this volume's device as seen by the OS,
+        or 0 if it cannot be determined.
+        """
+        status, out = commands.getstatusoutput('/sbin/blockdev --getsize64 %s' % self.device)
+        if status != 0:
+            log.debug("Could not get the size of device {0}: {1}".format(self.device, out))
+            return 0
+        try:
+            return int(out.strip())
+        except ValueError:
+            return 0
+
+    def resize(self, new_size, timeout=600):
+        """
+        Grow this volume to ``new_size`` GB in place, while it stays attached
+        (and mounted), and wait up to ``timeout`` seconds for the new size to
+        be visible to the OS. Growing the file system on the volume is up to
+        the caller. Return ``True`` if the volume was resized.
+        """
+        if not self.app.cloud_interface.supports_volume_resize:
+            log.debug("Cloud does not support resizing attached volumes")
+            return False
+        if new_size <= self.size:
+            log.warning("Not resizing volume {0} to {1}GB; it is already {2}GB".format(
+                        self.get_full_name(), new_size, self.size))
+            return False
+        if not self.app.cloud_interface.resize_volume(self.volume_id, new_size):
+            return False
+        new_bytes = int(new_size) * 1024 ** 3
+        if not Waiter(timeout, initial_delay=2, max_delay=30).wait(
+                lambda: self._get_device_size() >= new_bytes,
+                "device {0} of volume {1} to grow to {2}GB".format(
+                self.device, self.volume_id, new_size)):
+            log.error("Volume {0} was not resized to {1}GB in time".format(
+                      self.get_full_name(), new_size))
+            return False
+        self.size = new_size
+        log.info("Resized volume {0} to {1}GB".format(self.get_full_name(), new_size))
+        return True
 
     def get_from_snap_id(self):
         """
@@ -576,6 +701,11 @@ class Volume(BlockStorage):
         the file system.
         """
         self.create(self.fs.name)
+        if self.fs.kind == 'striped':
+            # The file system is created and mounted over all the volumes
+            # once they are attached (see Filesystem.add)
+            self.attach()
+            return
         # Mark a volume as 'static' if created from a snapshot
         # Note that if a volume is marked as 'static', it is assumed it
         # can be deleted upon cluster termination!
@@ -613,7 +743,8 @@ class Volume(BlockStorage):
             Setting ``delete_vols`` is irreversible. All data will be
             permanently deleted.
         """
-        self.unmount(mount_point)
+        if self.fs.kind != 'striped':  # Unmounted by the striped device
+            self.unmount(mount_point)
         if detach:
             log.debug("Detaching volume {0} as {1}".format(
                 self.volume_id, self.fs.get_full_name()))
@@ -634,7 +765,8 @@ class Volume(BlockStorage):
         Mount this volume as a locally accessible file system and make it
         available over NFS
         """
-        for counter in range(30):
+        waiter = Waiter(timeout=60, initial_delay=MIN_TIME_BETWEEN_STATUS_CHECKS, max_delay=10)
+        while True:
             if self.status == volume_status.ATTACHED:
                 if os.path.exists(mount_point):
                     # Check if the mount location is empty
@@ -647,15 +779,11 @@ class Volume(BlockStorage):
                 # Potentially wait for the device to actually become available in the system
                 # TODO: Do something if the device is not available in the
                 # given time period
-                for i in range(10):
-                    if os.path.exists(self.device):
-                        log.debug("Device path {0} checked and it exists.".format(
-                            self.device))
-                        break
-                    else:
-                        log.debug("Device path {0} does not yet exist; waiting...".format(
-                            self.device))
-                        time.sleep(4)
+                if waiter.child(40, initial_delay=0.5, max_delay=5).wait(
+                        lambda: os.path.exists(self.device),
+                        "device path {0} to exist".format(self.device)):
+                    log.debug("Device path {0} checked and it exists.".format(
+                        self.device))
                 # Until the underlying issue is fixed (see FIXME below), mask this
                 # even more by custom-handling the run command and thus not
                 # printing the err
@@ -726,9 +854,10 @@ class Volume(BlockStorage):
                 if self.fs.add_nfs_share(mount_point):
                     return True
             log.warning(
-                "Cannot mount volume '%s' in state '%s'. Waiting (%s/30)." % (self.volume_id,
-                self.status, counter))
-            time.sleep(2)
+                "Cannot mount volume '%s' in state '%s'. Waiting (%ds left)." % (self.volume_id,
+                self.status, waiter.remaining()))
+            if not waiter.pause():
+                return False
 
     def unmount(self, mount_point):
         """
@@ -750,23 +879,19 @@ class Volume(BlockStorage):
         if self.fs.state == service_states.RUNNING or self.fs.state == service_states.SHUTTING_DOWN:
             log.debug("Unmounting volume-based FS from {0}".format(mount_point))
             if os.path.exists(mount_point):
-                for counter in range(10):
-                    if run('/bin/umount %s' % mount_point,
+                if not Waiter(timeout=30, max_delay=10).wait(
+                        lambda: run('/bin/umount %s' % mount_point,
                             "Error unmounting file system '%s'" % mount_point,
-                            "Successfully unmounted file system '%s'" % mount_point):
-                        # Clean up the system path now that the file system is
-                        # unmounted
-                        try:
-                            os.rmdir(mount_point)
-                        except OSError, e:
-                            log.error("Error removing unmounted path {0}: {1}".format(
-                                mount_point, e))
-                        break
-                    if counter == 9:
-                        log.warning("Could not unmount file system at '%s'" % mount_point)
-                        return False
-                    counter += 1
-                    time.sleep(3)
+                            "Successfully unmounted file system '%s'" % mount_point)):
+                    log.warning("Could not unmount file system at '%s'" % mount_point)
+                    return False
+                # Clean up the system path now that the file system is
+                # unmounted
+                try:
+                    os.rmdir(mount_point)
+                except OSError, e:
+                    log.error("Error removing unmounted path {0}: {1}".format(
+                        mount_point, e))
                 return True
             else:
                 log.debug("Did not unmount file system {0} because its mount point "
@@ -44,6 +44,14 @@ spot_states = Bunch(
     ACTIVE="active",
     CANCELLED="cancelled"
 )
+# Events the master's monitor reacts to (see ConsoleMonitor.post_event)
+monitor_events = Bunch(
+    AMQP_MESSAGE="amqp_message",
+    SERVICE_STATE_CHANGED="service_state_changed",
+    SERVICES_CHANGED="services_changed",
+    WORKERS_CHANGED="workers_changed",
+    SGE_HOST_ADDED="sge_host_added"
+)
 
 
 # DBTODO Find out if we use any of this
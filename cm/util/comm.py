@@ -1,9 +1,215 @@
 import amqplib.client_0_8 as amqp
 import logging
+import Queue
+import select
+import socket
+import threading
+import time
+
+from cm.util.protocol import MessageCodec
 
 log = logging.getLogger('cloudman')
 
 DEFAULT_HOST = 'localhost:5672'
+# Max number of unacknowledged messages the broker will push to a consumer
+DEFAULT_PREFETCH_COUNT = 50
+# Number of messages a consumer acknowledges with a single ack
+DEFAULT_ACK_BATCH_SIZE = 10
+# Seconds a consumer waits for a message before flushing pending acks
+ACK_FLUSH_INTERVAL = 1
+# Upper bound on the number of seconds between reconnect attempts
+MAX_RECONNECT_DELAY = 30
+# Milliseconds a queue is kept by the broker once it is no longer used (i.e.,
+# it has no consumers and is not polled), e.g., after its instance is gone.
+# Queues are not auto-deleted so messages sent while a consumer reconnects
+# are not lost.
+QUEUE_EXPIRES = 3600 * 1000
+# AMQP reply code for a redeclaration of a queue with different arguments
+PRECONDITION_FAILED = 406
+
+
+def declare_queue(channel, exchange, queue, routing_key):
+    """
+    Declare the ``exchange`` and ``queue`` on ``channel`` and bind them with
+    ``routing_key``. Return the channel to use from then on.
+
+    A queue declared by an older version of CloudMan (auto-deleted and without
+    an expiry) may still exist on the broker, e.g., after CloudMan has been
+    updated. Redeclaring it with different arguments is refused by the broker
+    (``PRECONDITION_FAILED``), which also closes the channel; in that case
+    the queue is declared again, on a new channel, the way it was originally
+    declared. Once such a queue gets deleted (i.e., when its consumer
+    disconnects), it gets declared with the current arguments.
+    """
+    channel.access_request('/data', active=True, write=True)
+    channel.exchange_declare(exchange, type='direct', durable=False, auto_delete=True)
+    try:
+        channel.queue_declare(queue=queue, durable=False, exclusive=False, auto_delete=False,
+                              arguments={'x-expires': QUEUE_EXPIRES})
+    except amqp.AMQPChannelException, e:
+        if e.amqp_reply_code != PRECONDITION_FAILED:
+            raise
+        log.debug("Queue '%s' exists with different arguments (%s); using its "
+                  "original arguments" % (queue, e))
+        channel = channel.connection.channel()
+        channel.access_request('/data', active=True, write=True)
+        channel.queue_declare(queue=queue, durable=False, exclusive=False, auto_delete=True)
+    channel.queue_bind(exchange=exchange, queue=queue, routing_key=routing_key)
+    return channel
+
+
+class AMQPConsumer(object):
+    """
+    A long-lived consumer that has the broker push messages from ``queue``
+    as they arrive (``basic_consume``) rather than having to poll for them.
+    Each message is passed to ``callback``, which typically hands it over to
+    another thread; that thread calls ``ack`` once it has handled the message
+    (messages must be handled in the order they were delivered). Messages are
+    acknowledged in batches of ``ack_batch_size`` (or after
+    ``ACK_FLUSH_INTERVAL`` seconds of inactivity) and at most
+    ``prefetch_count`` messages are outstanding at any time. Messages that
+    were not acknowledged when the connection is lost are delivered again.
+
+    The consumer uses its own connection (amqplib channels are not thread
+    safe) and runs in its own thread, automatically reconnecting (with a
+    backoff) if the connection to the broker is lost. Because amqplib does
+    not support AMQP heartbeats, TCP keepalive is enabled on the consumer's
+    socket so a dead broker connection is eventually detected.
+    """
+    def __init__(self, host, user, password, exchange, queue, routing_key,
+                 callback, prefetch_count=DEFAULT_PREFETCH_COUNT,
+                 ack_batch_size=DEFAULT_ACK_BATCH_SIZE):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.exchange = exchange
+        self.queue = queue
+        self.routing_key = routing_key
+        self.callback = callback
+        self.prefetch_count = prefetch_count
+        self.ack_batch_size = ack_batch_size
+        self.conn = None
+        self.channel = None
+        self.running = False
+        # (channel, delivery tag) of the messages handled by the receiver
+        self.handled = Queue.Queue()
+        self.num_unacked = 0
+        self.last_delivery_tag = None
+        self.thread = None
+
+    def is_connected(self):
+        return self.conn is not None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._consume,
+                                       name="amqp-consumer-%s" % self.queue)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._close()
+
+    def ack(self, msg):
+        """
+        Note that ``msg`` has been handled so it can be acknowledged. Safe to
+        call from any thread.
+        """
+        self.handled.put((msg.delivery_info.get('channel'), msg.delivery_tag))
+
+    def _connect(self):
+        self.conn = amqp.Connection(host=self.host,
+                                    userid=self.user, password=self.password)
+        sock = getattr(self.conn.transport, 'sock', None)
+        if sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.channel = self.conn.channel()
+        self.channel = declare_queue(self.channel, self.exchange, self.queue, self.routing_key)
+        self.channel.basic_qos(0, self.prefetch_count, False)
+        self.channel.basic_consume(queue=self.queue, no_ack=False,
+                                   callback=self._on_message)
+        self.num_unacked = 0
+        self.last_delivery_tag = None
+        log.debug("AMQP consumer on queue '%s' connected" % self.queue)
+
+    def _close(self):
+        conn, self.conn, self.channel = self.conn, None, None
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _on_message(self, msg):
+        try:
+            self.callback(msg)
+        except Exception, e:
+            log.exception("Error handling AMQP message %s: %s" % (msg.body, e))
+            # The message will not be handled so do not hold up the rest
+            self.ack(msg)
+
+    def _flush_acks(self, force=False):
+        """
+        Acknowledge the messages handled so far if there are
+        ``ack_batch_size`` of them (or any, if ``force`` is set).
+        """
+        while True:
+            try:
+                channel, delivery_tag = self.handled.get_nowait()
+            except Queue.Empty:
+                break
+            # Messages delivered over a previous connection get redelivered
+            if channel is self.channel and self.channel is not None:
+                self.num_unacked += 1
+                self.last_delivery_tag = max(delivery_tag, self.last_delivery_tag)
+        if self.num_unacked and self.channel and (force or self.num_unacked >= self.ack_batch_size):
+            # Acknowledge all the messages up to and including the last one
+            self.channel.basic_ack(self.last_delivery_tag, multiple=True)
+            self.num_unacked = 0
+
+    def _has_buffered_data(self):
+        """
+        Check if amqplib has already read (part of) a method from the socket
+        and not yet dispatched it.
+        """
+        method_reader = getattr(self.conn, 'method_reader', None)
+        return bool(getattr(self.conn.transport, '_read_buffer', None) or
+                    getattr(self.channel, 'method_queue', None) or
+                    (method_reader and not method_reader.queue.empty()))
+
+    def _wait(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for a message and dispatch it. The
+        socket is not given a timeout because a timeout in the middle of
+        reading a frame would leave amqplib out of sync with the stream.
+        Return ``False`` if no message arrived in time.
+        """
+        if not self._has_buffered_data():
+            readable = select.select([self.conn.transport.sock], [], [], timeout)[0]
+            if not readable:
+                return False
+        self.channel.wait()
+        return True
+
+    def _consume(self):
+        reconnect_delay = 1
+        while self.running:
+            try:
+                if not self.conn:
+                    self._connect()
+                    reconnect_delay = 1
+                # Flush pending acks once there is nothing else to do
+                self._flush_acks(force=not self._wait(ACK_FLUSH_INTERVAL))
+            except Exception, e:
+                if not self.running:
+                    break
+                log.warning("AMQP consumer on queue '%s' lost its connection (%s); "
+                            "reconnecting in %s seconds" % (self.queue, e, reconnect_delay))
+                self._close()
+                time.sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
+        self._close()
 
 
 class CMMasterComm(object):
@@ -20,6 +226,8 @@ class CMMasterComm(object):
         self.conn = None
         self.channel = None
         self.queue = 'master'
+        self.consumer = None
+        self.codec = MessageCodec('master')
 
     def is_connected(self):
         return self.conn is not None
@@ -30,32 +238,63 @@ class CMMasterComm(object):
             self.conn = amqp.Connection(host=self.host,
                                         userid=self.user, password=self.password)
             self.channel = self.conn.channel()
-            self.channel.access_request('/data', active=True, write=True)
-            self.channel.exchange_declare(self.exchange, type='direct',
-                                          durable=False, auto_delete=True)
-            self.channel.queue_declare(queue='master', durable=False,
-                                       exclusive=False, auto_delete=True)
-            self.channel.queue_bind(exchange=self.exchange,
-                                    queue='master', routing_key='master')
+            self.channel = declare_queue(self.channel, self.exchange, 'master', 'master')
             log.debug("Successfully established AMQP connection")
         except Exception, e:
             log.debug("AMQP Connection Failure:  %s", e)
             self.conn = None
 
+    def start_consumer(self, callback):
+        """
+        Have messages for the master delivered to ``callback`` as they arrive
+        (see ``AMQPConsumer``) rather than via ``recv``.
+        """
+        if not self.consumer:
+            self.consumer = AMQPConsumer(self.host, self.user, self.password,
+                                         self.exchange, self.queue, 'master', callback)
+            self.consumer.start()
+
+    def is_consuming(self):
+        return self.consumer is not None and self.consumer.is_connected()
+
+    def ack(self, msg):
+        """
+        Acknowledge a message pushed by the consumer once it has been handled.
+        """
+        if self.consumer:
+            self.consumer.ack(msg)
+
     def shutdown(self):
         log.info("Comm Shutdown Invoked")
+        if self.consumer:
+            self.consumer.stop()
         if self.channel:
             self.channel.close()
         if self.conn:
             self.conn.close()
 
-    def send(self, message, to):
+    def send(self, message, to, content_type='text/plain'):
         # log.debug("S_COMM: Sending from %s to %s message %s" % ('master', to,
         # message ))
         msg = amqp.Message(
-            message, reply_to='master', content_type='text/plain')
+            message, reply_to='master', content_type=content_type)
         self.channel.basic_publish(msg, exchange=self.exchange, routing_key=to)
 
+    def send_message(self, msg_type, to, payload=None, legacy=False):
+        """
+        Encode a message (see ``cm.util.protocol``) and send it to ``to``.
+        If ``legacy`` is set, the message is sent in the pipe-delimited
+        format understood by older versions of CloudMan.
+        """
+        self.send(self.codec.encode(msg_type, payload, legacy), to,
+                  'text/plain' if legacy else 'application/json')
+
+    def send_batch(self, messages, to):
+        """
+        Send a list of ``(msg_type, payload)`` tuples to ``to`` as a single message.
+        """
+        self.send(self.codec.encode_batch(messages), to, 'application/json')
+
     def recv(self):
         if self.conn:
             msg = self.channel.basic_get(self.queue)
@@ -84,6 +323,8 @@ class CMWorkerComm(object):
         self.channel = None
         self.queue = 'worker_' + iid
         self.got_conn = False
+        self.consumer = None
+        self.codec = MessageCodec(iid)
 
     def is_connected(self):
         return self.conn is not None
@@ -93,39 +334,70 @@ class CMWorkerComm(object):
             self.conn = amqp.Connection(host=self.host,
                                         userid=self.user, password=self.password)
             self.channel = self.conn.channel()
-            self.channel.access_request('/data', active=True, write=True)
-            self.channel.exchange_declare(self.exchange, type='direct',
-                                          durable=False, auto_delete=True)
-            self.channel.queue_declare(queue=self.queue, durable=False,
-                                       exclusive=False, auto_delete=True)
-            self.channel.queue_bind(
-                exchange=self.exchange, queue=self.queue, routing_key=self.iid)
+            self.channel = declare_queue(self.channel, self.exchange, self.queue, self.iid)
             self.got_conn = True
             log.debug("Successfully established AMQP connection")
         except Exception, e:
             log.debug("AMQP Connection Failure:  %s", e)
             self.conn = None
 
+    def start_consumer(self, callback):
+        """
+        Have messages for this worker delivered to ``callback`` as they arrive
+        (see ``AMQPConsumer``) rather than via ``recv``.
+        """
+        if not self.consumer:
+            self.consumer = AMQPConsumer(self.host, self.user, self.password,
+                                         self.exchange, self.queue, self.iid, callback)
+            self.consumer.start()
+
+    def is_consuming(self):
+        return self.consumer is not None and self.consumer.is_connected()
+
+    def ack(self, msg):
+        """
+        Acknowledge a message pushed by the consumer once it has been handled.
+        """
+        if self.consumer:
+            self.consumer.ack(msg)
+
     def shutdown(self):
         log.info("Comm Shutdown Invoked")
+        if self.consumer:
+            self.consumer.stop()
         if self.channel:
             self.channel.close()
         if self.conn:
             self.conn.close()
 
-    def send(self, message):
+    def send(self, message, content_type='text/plain'):
         if self.conn:
             log.debug("S_COMM: Sending from %s to %s message %s" % (
                 self.iid, 'master', message))
             """Worker will always rout to master, not another worker."""
             msg = amqp.Message(
-                message, reply_to=self.iid, content_type='text/plain')
+                message, reply_to=self.iid, content_type=content_type)
             self.channel.basic_publish(
                 msg, exchange=self.exchange, routing_key='master')
         else:
             log.error("S_COMM FAILURE: Sending from %s to %s message %s" % (
                 self.iid, 'master', message))
 
+    def send_message(self, msg_type, payload=None, legacy=False):
+        """
+        Encode a message (see ``cm.util.protocol``) and send it to the master.
+        If ``legacy`` is set, the message is sent in the pipe-delimited
+        format understood by older versions of CloudMan.
+        """
+        self.send(self.codec.encode(msg_type, payload, legacy),
+                  'text/plain' if legacy else 'application/json')
+
+    def send_batch(self, messages):
+        """
+        Send a list of ``(msg_type, payload)`` tuples to the master as a single message.
+        """
+        self.send(self.codec.encode_batch(messages), 'application/json')
+
     def recv(self):
         if self.conn:
             msg = self.channel.basic_get(self.queue)
@@ -1,14 +1,13 @@
 """Galaxy CM master manager"""
 import commands
-import fileinput
 import logging
 import logging.config
+import math
 import os
 import subprocess
 import threading
 import time
 import datetime as dt
-import json
 import shutil
 
 
@@ -26,19 +25,31 @@ from cm.services.apps.pss import PSSService
 from cm.services.apps.sge import SGEService
 from cm.services.autoscale import Autoscale
 from cm.services.data.filesystem import Filesystem
+from cm.services.data.striped import DEFAULT_STRIPE_SIZE, DEFAULT_STRIPING_METHOD
 from cm.util import (cluster_status, comm, instance_lifecycle, instance_states,
-        misc, spot_states, Time)
+        misc, monitor_events, spot_states, Time)
 from cm.util.decorators import TestFlag
 from cm.util.manager import BaseConsoleManager
+from cm.util import protocol
+from cm.util.bunch import Bunch
+from cm.util.pool import ThreadPool
+from cm.util.waiter import Waiter
+from cm.util.scheduler import EventScheduler
 
 import cm.util.paths as paths
 from boto.exception import EC2ResponseError, S3ResponseError
+from boto.utils import parse_ts
 
 log = logging.getLogger('cloudman')
 
 # Time well in past to seend reboot, last comm times with.
 TIME_IN_PAST = dt.datetime(2012, 1, 1, 0, 0, 0)
 
+# Bounds (in seconds) of the wait before retrying a warm pool launch that
+# did not start any instances; the wait doubles after each failed launch
+WARM_POOL_MIN_BACKOFF = 60
+WARM_POOL_MAX_BACKOFF = 3600
+
 s3_rlock = threading.RLock()
 
 
@@ -71,7 +82,8 @@ class ConsoleManager(BaseConsoleManager):
         # (because get_worker_instances currently depends on tags, which is only
         # supported by EC2, get the list of instances only for the case of EC2 cloud.
         # This initialization is applicable only when restarting a cluster.
-        self.worker_instances = self.get_worker_instances() if (self.app.cloud_type == 'ec2' or self.app.cloud_type == 'openstack') else []
+        self.worker_instances = WorkerInstanceList(self.get_worker_instances()
+            if (self.app.cloud_type == 'ec2' or self.app.cloud_type == 'openstack') else [])
         self.disk_total = "0"
         self.disk_used = "0"
         self.disk_pct = "0%"
@@ -80,24 +92,31 @@ class ConsoleManager(BaseConsoleManager):
         # If this is set to False, the master instance will not be an execution
         # host in SGE and thus not be running any jobs
         self.master_exec_host = True
+        # Polls the state of all outstanding Spot requests in bulk
+        self.spot_tracker = SpotRequestTracker(self.app)
         self.initial_cluster_type = None
         self.cluster_storage_type = None
         self.services = []
         # Static data - get snapshot IDs from the default bucket and add respective file systems
         self.snaps = self._load_snapshot_data()
         self.default_galaxy_data_size = 0
+        # Failed warm pool launches are retried with an increasing wait
+        self.warm_pool_backoff = 0
+        self.warm_pool_next_launch = None
 
     def add_master_service(self, new_service):
         if not self.get_services(svc_name=new_service.name):
             log.debug("Adding service %s into the master service registry" % new_service.name)
             self.services.append(new_service)
             self._update_dependencies(new_service, "ADD")
+            self.console_monitor.post_event(monitor_events.SERVICES_CHANGED)
         else:
             log.debug("Would add master service %s but one already exists" % new_service.name)
 
     def remove_master_service(self, service_to_remove):
         self.services.remove(service_to_remove)
         self._update_dependencies(service_to_remove, "REMOVE")
+        self.console_monitor.post_event(monitor_events.SERVICES_CHANGED)
 
     def _update_dependencies(self, new_service, action):
         """
@@ -262,8 +281,8 @@ class ConsoleManager(BaseConsoleManager):
                     if 'size' in snap:
                         self.default_galaxy_data_size = snap['size']
                     elif 'snap_id' in snap:
-                        self.snapshot = (self.app.cloud_interface.get_ec2_connection()
-                            .get_all_snapshots([snap['snap_id']])[0])
+                        self.snapshot = self.app.cloud_interface.get_all_snapshots(
+                            [snap['snap_id']])[0]
                         self.default_galaxy_data_size = self.snapshot.volume_size
                     log.debug("Got default galaxy FS size as {0}GB".format(
                         self.default_galaxy_data_size))
@@ -384,6 +403,13 @@ class ConsoleManager(BaseConsoleManager):
                                     from_snapshot_id=att_vol.snapshot_id)
                             else:
                                 filesystem.add_volume(from_snapshot_id=snap)
+                    elif fs['kind'] == 'striped':
+                        # Existing volumes get reassembled into the striped
+                        # device; otherwise, new volumes are created
+                        filesystem.add_striped(vol_ids=fs.get('ids'), size=fs.get('size', 0),
+                            num_volumes=fs.get('num_volumes', 2), snap_ids=fs.get('snap_ids'),
+                            method=fs.get('striping', DEFAULT_STRIPING_METHOD),
+                            stripe_size=fs.get('stripe_size', DEFAULT_STRIPE_SIZE))
                     elif fs['kind'] == 'nfs':
                         filesystem.add_nfs(fs['nfs_server'], None, None, mount_options=fs.get('mount_options', None))
                     elif fs['kind'] == 'gluster':
@@ -493,11 +519,11 @@ class ConsoleManager(BaseConsoleManager):
                 return vol
         return None
 
-    def start_autoscaling(self, as_min, as_max, instance_type):
+    def start_autoscaling(self, as_min, as_max, instance_type, policy=None, units=None):
         as_svc = self.get_services(svc_role=ServiceRole.AUTOSCALE)
         if not as_svc:
             self.add_master_service(
-                Autoscale(self.app, as_min, as_max, instance_type))
+                Autoscale(self.app, as_min, as_max, instance_type, policy, units))
         else:
             log.debug("Autoscaling is already on.")
         as_svc = self.get_services(svc_role=ServiceRole.AUTOSCALE)
@@ -863,6 +889,8 @@ class ConsoleManager(BaseConsoleManager):
                 if reservation.instances[0].state != 'terminated' and reservation.instances[0].state != 'shutting-down':
                     i = Instance(self.app, inst=reservation.instances[0],
                                  m_state=reservation.instances[0].state, reboot_required=True)
+                    i.standby = self.app.cloud_interface.get_tag(
+                        reservation.instances[0], 'standby') == 'true'
                     instances.append(i)
                     log.info("Instance '%s' found alive (will configure it later)." % reservation.instances[0].id)
         except EC2ResponseError, e:
@@ -1033,6 +1061,7 @@ class ConsoleManager(BaseConsoleManager):
                     if vol.status == 'available':
                         log.debug("As part of cluster deletion, deleting volume '%s'" % vol.id)
                         vol.delete()
+                        self.app.cloud_interface.invalidate_cache('volumes')
                     else:
                         log.debug("Not deleting volume {0} because it is in state {1}"
                             .format(vol.id, vol.status))
@@ -1071,48 +1100,32 @@ class ConsoleManager(BaseConsoleManager):
         Get a list of instances that are currently not executing any job manager
         jobs. Return a list of ``Instance`` objects.
         """
-        # log.debug( "Looking for idle instances" )
         idle_instances = []  # List of Instance objects corresponding to idle instances
-        if os.path.exists('%s/default/common/settings.sh' % self.app.path_resolver.sge_root):
-            proc = subprocess.Popen("export SGE_ROOT=%s; . $SGE_ROOT/default/common/settings.sh; "
-                                    "%s/bin/lx24-amd64/qstat -f | grep all.q" % (
-                                        self.app.path_resolver.sge_root, self.app.path_resolver.sge_root),
-                                    shell=True, stdout=subprocess.PIPE)
-            qstat_out = proc.communicate()[0]
-            # log.debug( "qstat output: %s" % qstat_out )
-            instances = qstat_out.splitlines()
-            nodes_list = []  # list of nodes containing node's domain name and number of used processing slots
-            idle_instances_dn = []  # list of domain names of idle instances
-            for inst in instances:
-                # Get instance domain name and # of used processing slots: ['domU-12-31-38-00-48-D1.c:0']
-                nodes_list.append(inst.split('@')[1].split(' ')[0] + ':' + inst.split('/')[1])
-            # if len( nodes_list ) > 0:
-            #     log.debug( "Processed qstat output: %s" % nodes_list )
-
-            for node in nodes_list:
-                # If number of used slots on given instance is 0, mark it as idle
-                if int(node.split(':')[1]) == 0:
-                    idle_instances_dn.append(node.split(':')[0])
-            # if len( idle_instances_dn ) > 0:
-            #     log.debug( "Idle instances' DNs: %s" % idle_instances_dn )
-
-            for idle_instance_dn in idle_instances_dn:
-                for w_instance in self.worker_instances:
-                    # log.debug("Trying to match worker instance with private IP '%s' to idle "
-                    #    "instance '%s'" % (w_instance.get_local_hostname(), idle_instance_dn))
-                    if w_instance.get_local_hostname() is not None:
-                        if w_instance.get_local_hostname().lower().startswith(str(idle_instance_dn).lower()):
-                            # log.debug("Marking instance '%s' with FQDN '%s' as idle." \
-                            #     % (w_instance.id, idle_instance_dn))
-                            idle_instances.append(w_instance)
+        try:
+            sge_svc = self.get_services(svc_role=ServiceRole.SGE)[0]
+        except IndexError:
+            return idle_instances
+        # The SGE service caches the queue state so this does not run qstat
+        # each time it is called
+        for idle_instance_dn in sge_svc.get_idle_hosts():
+            w_instance = self.worker_instances.get_by_hostname(idle_instance_dn)
+            # Standby instances are idle by design; they are not up for removal
+            if w_instance and not w_instance.standby:
+                idle_instances.append(w_instance)
         return idle_instances
 
-    def remove_instances(self, num_nodes, force=False):
+    def remove_instances(self, num_nodes, force=False, instances=None, num_slots=None):
         """
         Remove a number (``num_nodes``) of worker instances from the cluster, first
         deciding which instance(s) to terminate and then removing them from SGE and
         terminating. An instance is deemed removable if it is not currently running
-        any jobs.
+        any jobs. If provided, ``instances`` is a list of the ``Instance`` objects
+        to choose from, in order of preference (e.g., as ranked by autoscaling);
+        otherwise, all the idle instances are considered.
+
+        If ``num_slots`` is provided, remove instances until (at most) that many
+        job slots have been removed from the cluster instead; ``num_nodes``
+        then caps the number of instances removed.
 
         Note that if the number of removable instances is smaller than the
         number of instances requested to remove, the smaller number of instances
@@ -1120,38 +1133,61 @@ class ConsoleManager(BaseConsoleManager):
         case, removable instances are removed first, then additional instances are
         chosen at random and removed.
         """
-        num_terminated = 0
+        to_remove = []
         # First look for idle instances that can be removed
-        idle_instances = self.get_idle_instances()
+        idle_instances = instances if instances is not None else self.get_idle_instances()
         if len(idle_instances) > 0:
             log.debug("Found %s idle instances; trying to remove %s." %
                       (len(idle_instances), num_nodes))
-            for i in range(0, num_nodes):
-                for inst in idle_instances:
-                    if num_terminated < num_nodes:
-                        self.remove_instance(inst.id)
-                        num_terminated += 1
+            if num_slots is None:
+                to_remove = list(idle_instances[:num_nodes])
+            else:
+                to_remove = self._pick_instances_by_slots(idle_instances, num_slots,
+                                                          num_nodes)
         else:
             log.info("No idle instances found")
-        log.debug("Num to terminate: %s, num terminated: %s; force set to '%s'"
-                  % (num_nodes, num_terminated, force))
+        log.debug("Num to terminate: %s, num idle to terminate: %s; force set to '%s'"
+                  % (num_nodes, len(to_remove), force))
         # If force is set, terminate requested number of instances regardless
         # whether they are idle
-        if force is True and num_terminated < num_nodes:
-            force_kill_instances = num_nodes - num_terminated
+        if force is True and num_slots is not None:
+            removed_slots = sum(inst.get_num_slots() for inst in to_remove)
+            to_remove += self._pick_instances_by_slots(
+                [inst for inst in self.get_active_instances() if inst not in to_remove and
+                 (not inst.is_spot() or inst.spot_was_filled())],
+                num_slots - removed_slots, num_nodes - len(to_remove))
+        elif force is True and len(to_remove) < num_nodes:
+            force_kill_instances = num_nodes - len(to_remove)
             log.info(
                 "Forcefully terminating %s instances." % force_kill_instances)
-            for i in range(force_kill_instances):
-                for inst in self.worker_instances:
-                    if not inst.is_spot() or inst.spot_was_filled():
-                        self.remove_instance(inst.id)
-                        num_terminated += 1
-        if num_terminated > 0:
+            for inst in self.get_active_instances():
+                if len(to_remove) >= num_nodes:
+                    break
+                if inst not in to_remove and (not inst.is_spot() or inst.spot_was_filled()):
+                    to_remove.append(inst)
+        if to_remove:
+            self.remove_instances_batch(to_remove)
             log.info("Initiated requested termination of instances. Terminating '%s' instances."
-                     % num_terminated)
+                     % len(to_remove))
         else:
             log.info("Did not terminate any instances.")
 
+    def _pick_instances_by_slots(self, instances, num_slots, max_nodes=None):
+        """
+        Pick instances from the ``instances`` list (in order) whose combined
+        number of job slots does not exceed ``num_slots``. Instances that
+        would overshoot are skipped in favor of smaller ones further down the
+        list. At most ``max_nodes`` instances are picked.
+        """
+        picked = []
+        for inst in instances:
+            if num_slots <= 0 or (max_nodes is not None and len(picked) >= max_nodes):
+                break
+            if inst.get_num_slots() <= num_slots:
+                picked.append(inst)
+                num_slots -= inst.get_num_slots()
+        return picked
+
     def remove_instance(self, instance_id=''):
         """
         Remove an instance with ID ``instance_id`` from the cluster. This means
@@ -1163,30 +1199,67 @@ class ConsoleManager(BaseConsoleManager):
                 "Tried to remove an instance but did not receive instance ID")
             return False
         log.debug("Specific termination of instance '%s' requested." % instance_id)
-        for inst in self.worker_instances:
-            if inst.id == instance_id:
+        inst = self.worker_instances.get_by_id(instance_id)
+        if inst:
+            self.remove_instances_batch([inst])
+        else:
+            self.console_monitor.post_event(monitor_events.WORKERS_CHANGED)
+        log.info("Initiated requested termination of instance. Terminating '%s'." %
+                 instance_id)
+
+    def remove_instances_batch(self, instances):
+        """
+        Remove all of the given ``Instance`` objects from the cluster at once:
+        remove them from the job manager with one batched operation, rewrite
+        ``/etc/hosts`` once, and then terminate all of them with a single
+        cloud middleware request. Termination happens in a background thread
+        so the caller (e.g., the monitor) is not held up; the returned thread
+        can be joined on if needed.
+        """
+        known = [inst for inst in instances if inst.get_id() is not None]
+        if known:
+            try:
                 sge_svc = self.get_services(svc_role=ServiceRole.SGE)[0]
                 # DBTODO Big problem here if there's a failure removing from allhosts.  Need to handle it.
-                # if sge_svc.remove_sge_host(inst.get_id(), inst.get_private_ip()) is True:
                 # Best-effort PATCH until above issue is handled
-                if inst.get_id() is not None:
-                    sge_svc.remove_sge_host(
-                        inst.get_id(), inst.get_private_ip())
-                    # Remove the given instance from /etc/hosts files
-                    log.debug("Removing instance {0} from /etc/hosts".format(
-                        inst.get_id()))
-                    for line in fileinput.input('/etc/hosts', inplace=1):
-                        line = line.strip()
-                        # (print all lines except the one w/ instance IP back to the file)
-                        if not inst.private_ip in line:
-                            print line
-                try:
-                    inst.terminate()
-                except EC2ResponseError, e:
-                    log.error("Trouble terminating instance '{0}': {1}".format(
-                        instance_id, e))
-        log.info("Initiated requested termination of instance. Terminating '%s'." %
-                 instance_id)
+                sge_svc.remove_sge_hosts([(inst.get_id(), inst.get_private_ip())
+                                          for inst in known])
+            except IndexError:
+                log.warning("Could not get a handle on SGE service to remove hosts")
+            # Remove the given instances from /etc/hosts
+            log.debug("Removing instance(s) {0} from /etc/hosts".format(
+                ', '.join(inst.get_id() for inst in known)))
+            misc.remove_from_etc_hosts([inst.private_ip for inst in known])
+        for inst in instances:
+            inst.worker_status = "Stopping"
+        t_thread = threading.Thread(target=self._terminate_instances, args=(instances,))
+        t_thread.start()
+        self.console_monitor.post_event(monitor_events.WORKERS_CHANGED)
+        return t_thread
+
+    def _terminate_instances(self, instances):
+        """
+        Terminate ``instances`` using a single cloud request, if the cloud
+        interface supports it, and update their state accordingly.
+        """
+        batch = [inst for inst in instances if inst.id is not None]
+        if len(batch) > 1 and hasattr(self.app.cloud_interface, 'terminate_instances_batch'):
+            try:
+                terminated = self.app.cloud_interface.terminate_instances_batch(
+                    [(inst.id, inst.spot_request_id if inst.is_spot() else None)
+                     for inst in batch])
+            except EC2ResponseError, e:
+                log.error("Trouble terminating instances: {0}".format(e))
+                terminated = {}
+            for inst in batch:
+                inst.handle_termination(terminated.get(inst.id, False))
+            instances = [inst for inst in instances if inst not in batch]
+        for inst in instances:
+            try:
+                inst.terminate().join()
+            except EC2ResponseError, e:
+                log.error("Trouble terminating instance '{0}': {1}".format(
+                    inst.id, e))
 
     def reboot_instance(self, instance_id='', count_reboot=True):
         """
@@ -1199,18 +1272,144 @@ class ConsoleManager(BaseConsoleManager):
             log.warning("Tried to reboot an instance but did not receive instance ID")
             return False
         log.info("Specific reboot of instance '%s' requested." % instance_id)
-        for inst in self.worker_instances:
-            if inst.id == instance_id:
-                inst.reboot(count_reboot=count_reboot)
+        inst = self.worker_instances.get_by_id(instance_id)
+        if inst:
+            inst.reboot(count_reboot=count_reboot)
         log.info("Initiated requested reboot of instance. Rebooting '%s'." % instance_id)
 
-    def add_instances(self, num_nodes, instance_type='', spot_price=None):
+    def add_instances(self, num_nodes, instance_type='', spot_price=None, standby=False):
+        """
+        Add ``num_nodes`` worker instances to the cluster. Instances from the
+        warm pool are put to use first and only the remainder is started. If
+        ``standby`` is set, the started instances are kept in the warm pool
+        instead (see ``maintain_warm_pool``). Return the list of instances
+        that were started.
+        """
+        if not standby:
+            num_nodes -= len(self.activate_standby_instances(num_nodes))
+            if num_nodes <= 0:
+                return []
+            # Remove master from execution queue automatically (standby
+            # instances do not run jobs until they are activated)
+            if self.master_exec_host:
+                self.toggle_master_as_exec_host()
+        started = self.app.cloud_interface.run_instances(num=num_nodes,
+                                                         instance_type=instance_type,
+                                                         spot_price=spot_price) or []
+        if standby:
+            for inst in started:
+                w_instance = self.worker_instances.get_by_id(inst.id)
+                if w_instance:
+                    w_instance.set_standby(True)
+        if started:
+            self.console_monitor.post_event(monitor_events.WORKERS_CHANGED)
+        return started
+
+    def add_capacity(self, num_slots, instance_types=None, spot_price=None):
+        """
+        Add worker instances providing (at least) ``num_slots`` job slots,
+        using any of the ``instance_types`` (a list of ``(instance_type, slots)``
+        tuples in order of preference; ``config.fleet_instance_types`` by
+        default). If the cloud interface cannot launch a fleet of mixed instance
+        types, the required number of instances of the first type is added.
+        """
+        instance_types = instance_types or self.app.config.fleet_instance_types or [('', 1)]
+        # Put the warm pool to use first
+        num_standby, standby_slots = 0, 0
+        for inst in self.get_standby_instances():
+            if standby_slots >= num_slots:
+                break
+            num_standby += 1
+            standby_slots += inst.get_num_slots()
+        num_slots -= sum(inst.get_num_slots() for inst in
+                         self.activate_standby_instances(num_standby))
+        if num_slots <= 0:
+            return
+        if not hasattr(self.app.cloud_interface, 'run_fleet'):
+            instance_type, slots = instance_types[0]
+            self.add_instances(int(math.ceil(float(num_slots) / max(1, slots))),
+                               instance_type=instance_type, spot_price=spot_price)
+            return
+        # Remove master from execution queue automatically
+        if self.master_exec_host:
+            self.toggle_master_as_exec_host()
+        # Launching a fleet can take a while so don't hold up the caller
+        threading.Thread(target=self.app.cloud_interface.run_fleet, args=(
+            num_slots, instance_types), kwargs={'spot_price': spot_price,
+            'zones': self.app.config.fleet_zones}).start()
+        self.console_monitor.post_event(monitor_events.WORKERS_CHANGED)
+
+    def get_standby_instances(self):
+        """
+        Return the list of worker instances currently kept in the warm pool.
+        """
+        return [inst for inst in self.worker_instances if inst.standby]
+
+    def get_active_instances(self):
+        """
+        Return the list of worker instances that are not in the warm pool.
+        """
+        return [inst for inst in self.worker_instances if not inst.standby]
+
+    def activate_standby_instances(self, num_nodes):
+        """
+        Put (up to) ``num_nodes`` instances from the warm pool to use, enabling
+        their SGE queues with a single call. Instances that are already
+        configured are preferred over ones still booting, which simply join
+        the cluster as regular workers once ready. Return the list of
+        activated instances.
+        """
+        standby = sorted(self.get_standby_instances(),
+                         key=lambda inst: not inst.node_ready)[:max(0, num_nodes)]
+        if not standby:
+            return []
+        sge_svc = self.get_services(svc_role=ServiceRole.SGE)
+        if sge_svc:
+            # Instances not added to SGE yet will not get their queues disabled
+            sge_svc[0].set_hosts_enabled([inst.private_ip for inst in standby
+                                          if inst.private_ip])
+        for inst in standby:
+            inst.set_standby(False)
         # Remove master from execution queue automatically
         if self.master_exec_host:
             self.toggle_master_as_exec_host()
-        self.app.cloud_interface.run_instances(num=num_nodes,
-                                               instance_type=instance_type,
-                                               spot_price=spot_price)
+        log.info("Activated {0} standby instance(s): {1}".format(
+                 len(standby), ', '.join(inst.get_desc() for inst in standby)))
+        self.console_monitor.post_event(monitor_events.WORKERS_CHANGED)
+        return standby
+
+    def maintain_warm_pool(self):
+        """
+        Start workers to keep ``config.warm_pool_size`` standby instances in
+        the warm pool. Standby instances boot and get added to SGE like any
+        other worker but their queues are left disabled so no jobs run on them
+        until they are activated (see ``activate_standby_instances``). After
+        a launch that did not start any instances (e.g., the cloud is out of
+        capacity), the next one is only attempted after a wait that doubles
+        with each failed launch.
+        """
+        pool_size = self.app.config.warm_pool_size
+        if pool_size <= 0 or self.cluster_status == cluster_status.TERMINATED:
+            return
+        sge_svc = self.get_services(svc_role=ServiceRole.SGE)
+        if not sge_svc or sge_svc[0].state != service_states.RUNNING:
+            return
+        num_missing = pool_size - len(self.get_standby_instances())
+        if num_missing <= 0:
+            return
+        if self.warm_pool_next_launch and Time.now() < self.warm_pool_next_launch:
+            return
+        log.debug("Adding {0} standby instance(s) to the warm pool".format(num_missing))
+        if self.add_instances(num_missing, self.app.config.warm_pool_instance_type,
+                              standby=True):
+            self.warm_pool_backoff = 0
+            self.warm_pool_next_launch = None
+        else:
+            self.warm_pool_backoff = min(WARM_POOL_MAX_BACKOFF,
+                                         max(WARM_POOL_MIN_BACKOFF, 2 * self.warm_pool_backoff))
+            self.warm_pool_next_launch = Time.now() + dt.timedelta(seconds=self.warm_pool_backoff)
+            log.warning("Could not add standby instance(s) to the warm pool; retrying in "
+                        "{0} seconds".format(self.warm_pool_backoff))
 
     def add_live_instance(self, instance_id):
         """
@@ -1232,6 +1431,7 @@ class ConsoleManager(BaseConsoleManager):
                         "Worker: {0}".format(self.app.ud['cluster_name']))
                     self.worker_instances.append(i)
                     i.send_alive_request()  # to make sure info like ip-address and hostname are updated
+                    self.console_monitor.post_event(monitor_events.WORKERS_CHANGED)
                     log.debug('Added instance {0}....'.format(instance_id))
                 else:
                     log.debug("Live instance '%s' is at the end of its life (state: %s); not adding the instance." %
@@ -1423,12 +1623,13 @@ class ConsoleManager(BaseConsoleManager):
                     # this code will need to adjusted to accommodate that. Currently, the assumption is
                     # that only 1 snap ID will be provided as the data file
                     # system.
-                    snap = ec2_conn.get_all_snapshots(shared_data_vol_snaps)[0]
+                    snap = self.app.cloud_interface.get_all_snapshots(shared_data_vol_snaps)[0]
                     # Create a volume here because we'll be dealing with a volume-based file system
                     # and for that we need a volume ID
                     data_vol = ec2_conn.create_volume(
                         snap.volume_size, self.app.cloud_interface.get_zone(),
                         snapshot=snap)
+                    self.app.cloud_interface.invalidate_cache('volumes')
                     # Old style for persistent data - delete if the other method works as expected
                     # scpd['data_filesystems'] = {'galaxyData': [{'vol_id': data_vol.id, 'size': data_vol.size}]}
                     # Compose a persistent_data compatible entry for the shared data volume so that
@@ -1732,6 +1933,7 @@ class ConsoleManager(BaseConsoleManager):
         try:
             ec2_conn = self.app.cloud_interface.get_ec2_connection()
             ec2_conn.delete_snapshot(snap_id)
+            self.app.cloud_interface.invalidate_cache('snapshots')
             log.debug(
                 "As part of shared cluster instance deletion, deleted snapshot '%s'" % snap_id)
         except EC2ResponseError, e:
@@ -1756,12 +1958,25 @@ class ConsoleManager(BaseConsoleManager):
         5. Add a new reference to the created snapshot, which gets picked up
            by the monitor and a new volume is created and file system mounted
         6. Unsuspend services
+
+        On clouds that can snapshot attached volumes (i.e., AWS), none of the
+        services are stopped: the file system is frozen only while the
+        snapshots are initiated, the snapshots' progress is tracked in the
+        background (see ``snapshot_status``) and, once they complete, the
+        file system's volumes are recorded as originating from the new
+        snapshots.
         """
         if self.app.TESTFLAG is True:
             log.debug("Attempted to update file system '%s', but TESTFLAG is set." % file_system_name)
             return None
         log.info("Initiating file system '%s' update." % file_system_name)
         self.cluster_manipulation_in_progress = True
+        if self.app.cloud_type == 'ec2':
+            for svc in self.get_services(svc_type=ServiceType.FILE_SYSTEM):
+                if (svc.name == file_system_name and svc.volumes and
+                        svc.state == service_states.RUNNING):
+                    return self._update_file_system_online(svc)
+
         self._stop_app_level_services()
 
         # Initiate snapshot of the specified file system
@@ -1781,16 +1996,18 @@ class ConsoleManager(BaseConsoleManager):
                     svc.remove()
                     log.debug("Creating file system '%s' from snaps '%s'" % (file_system_name, snap_ids))
                     fs = Filesystem(self.app, file_system_name, svc.svc_roles)
-                    for snap_id in snap_ids:
-                        fs.add_volume(from_snapshot_id=snap_id)
+                    if svc.striped:
+                        fs.add_striped(snap_ids=snap_ids, method=svc.striped.method,
+                                       stripe_size=svc.striped.stripe_size)
+                    else:
+                        for snap_id in snap_ids:
+                            fs.add_volume(from_snapshot_id=snap_id)
                     self.add_master_service(fs)
                     # Monitor will pick up the new service and start it up but
                     # need to wait until that happens before can add rest of
                     # the services
-                    while fs.state != service_states.RUNNING:
-                        log.debug("Service '%s' not quite ready: '%s'" % (
-                            fs.get_full_name(), fs.state))
-                        time.sleep(6)
+                    Waiter(max_delay=15).wait(lambda: fs.state == service_states.RUNNING,
+                                              "service '%s' to be ready" % fs.get_full_name())
         if found_fs_name:
             self._start_app_level_services()
             self.cluster_manipulation_in_progress = False
@@ -1801,6 +2018,32 @@ class ConsoleManager(BaseConsoleManager):
                       file_system_name)
             return False
 
+    def _update_file_system_online(self, svc):
+        """
+        Update file system service ``svc`` (see ``update_file_system``)
+        while it, and the services using it, keep running.
+        """
+        def snapshot_done(snap_ids):
+            if snap_ids and None not in snap_ids:
+                svc.use_snapshots(snap_ids)
+                if self.console_monitor:
+                    self.console_monitor.store_cluster_config()
+                log.info("File system '%s' update complete" % svc.name)
+            else:
+                log.error("File system '%s' update failed; snapshots: %s" % (svc.name, snap_ids))
+            self.cluster_manipulation_in_progress = False
+        try:
+            snap_ids = svc.snapshot_in_background(
+                snap_description="File system '%s' from CloudMan instance '%s'; bucket: %s"
+                % (svc.name, self.app.ud['cluster_name'], self.app.ud['bucket_cluster']),
+                callback=snapshot_done)
+        except EC2ResponseError, e:
+            log.error("Error initiating snapshot of file system '%s': %s" % (svc.name, e))
+            self.cluster_manipulation_in_progress = False
+            return False
+        log.info("Initiated snapshots %s of file system '%s'" % (snap_ids, svc.name))
+        return True
+
     def add_fs_bucket(self, bucket_name, fs_name=None, fs_roles=[ServiceRole.GENERIC_FS],
                       bucket_a_key=None, bucket_s_key=None, persistent=False):
         """
@@ -1820,17 +2063,23 @@ class ConsoleManager(BaseConsoleManager):
 
     @TestFlag(None)
     def add_fs_volume(self, fs_name, fs_kind, vol_id=None, snap_id=None, vol_size=0,
-                      fs_roles=[ServiceRole.GENERIC_FS], persistent=False, dot=False):
+                      fs_roles=[ServiceRole.GENERIC_FS], persistent=False, dot=False,
+                      num_stripes=1):
         """
         Add a new file system based on an existing volume, a snapshot, or a new
         volume. Provide ``fs_kind`` to distinguish between these (accepted values
         are: ``volume``, ``snapshot``, or ``new_volume``). Depending on which
         kind is provided, must provide ``vol_id``, ``snap_id``, or ``vol_size``,
         respectively - but not all!
+        A ``new_volume`` file system can be striped over ``num_stripes``
+        volumes (adding up to ``vol_size``) for higher throughput.
         """
         log.info("Adding a {0}-based file system '{1}'".format(fs_kind, fs_name))
         fs = Filesystem(self.app, fs_name, persistent=persistent, svc_roles=fs_roles)
-        fs.add_volume(vol_id=vol_id, size=vol_size, from_snapshot_id=snap_id, dot=dot)
+        if fs_kind == 'new_volume' and int(num_stripes) > 1:
+            fs.add_striped(size=int(vol_size), num_volumes=num_stripes)
+        else:
+            fs.add_volume(vol_id=vol_id, size=vol_size, from_snapshot_id=snap_id, dot=dot)
         self.add_master_service(fs)
         log.debug("Master done adding {0}-based FS {1}".format(fs_kind, fs_name))
 
@@ -1988,6 +2237,7 @@ class ConsoleManager(BaseConsoleManager):
         svc.grow = {
             'new_size': new_vol_size, 'snap_description': snap_description,
             'delete_snap': delete_snap}
+        self.console_monitor.post_event(monitor_events.SERVICES_CHANGED)
 
     @TestFlag('TESTFLAG_ROOTPUBLICKEY')
     def get_root_public_key(self):
@@ -2035,6 +2285,44 @@ class ConsoleManager(BaseConsoleManager):
         f.close()
         return True
 
+    def refresh_worker_states(self, instances=None):
+        """
+        Update the machine state of worker ``instances`` (all worker instances
+        by default) using a single request to the cloud middleware, rather than
+        one request per instance. Spot instances whose request has not yet been
+        filled are skipped because they do not have an instance ID yet.
+        """
+        if self.app.TESTFLAG is True:
+            log.debug("Attempted to refresh worker states, but TESTFLAG is set.")
+            return
+        if instances is None:
+            instances = self.worker_instances
+        instances = [i for i in instances if i.id]
+        if not instances:
+            return
+        if self.app.cloud_type in ['opennebula', 'dummy']:
+            # These clouds do not support requesting multiple instances at once
+            for inst in instances:
+                inst.get_m_state()
+            return
+        try:
+            reservations = self.app.cloud_interface.get_all_instances(
+                instance_ids=[i.id for i in instances])
+        except EC2ResponseError, e:
+            # An ID the cloud no longer knows about fails the whole request so
+            # fall back to checking the instances one at a time
+            log.warning("Trouble refreshing the state of {0} workers at once ({1}); "
+                        "refreshing one at a time.".format(len(instances), e))
+            for inst in instances:
+                inst.get_m_state()
+            return
+        cloud_instances = {}
+        for r in reservations:
+            for ci in r.instances:
+                cloud_instances[str(ci.id)] = ci
+        for inst in instances:
+            inst.set_cloud_instance_object(cloud_instances.get(inst.id))
+
     def get_workers_status(self, worker_id=None):
         """
         Retrieves current status of all worker instances or of only worker
@@ -2056,8 +2344,9 @@ class ConsoleManager(BaseConsoleManager):
                 log.error("Error while updating instance '%s' status: %s" % (worker_id, e))
         else:
             logging.info("Checking status of all worker nodes... ")
+            self.refresh_worker_states()
             for w_instance in self.worker_instances:
-                workers_status[w_instance.id] = w_instance.get_m_state()
+                workers_status[w_instance.id] = w_instance.m_state
         return workers_status
 
     def get_num_available_workers(self):
@@ -2067,11 +2356,46 @@ class ConsoleManager(BaseConsoleManager):
         """
         # log.debug("Gathering number of available workers" )
         num_available_nodes = 0
-        for inst in self.worker_instances:
+        for inst in self.get_active_instances():
             if inst.node_ready is True:
                 num_available_nodes += 1
         return num_available_nodes
 
+    def get_slot_capacity(self):
+        """
+        Return the job slot capacity of the cluster as a ``Bunch`` with the
+        ``total``, ``used`` and ``free`` number of slots across all worker
+        instances, the number of ``available`` (i.e., free on ``READY`` nodes)
+        slots, and a ``nodes`` dict mapping each worker instance ID to a
+        ``Bunch`` with its own ``total``, ``used`` and ``free`` slots.
+
+        The number of slots a node provides is taken from the job manager if the
+        node has been added to it; otherwise, it is the number of CPUs the node
+        reported. Used slots are those currently occupied by jobs.
+        """
+        sge_hosts = {}  # Instance ID -> SGE queue instance
+        try:
+            sge_svc = self.get_services(svc_role=ServiceRole.SGE)[0]
+            for host in sge_svc.get_queue_snapshot().hosts:
+                w_instance = self.worker_instances.get_by_hostname(host.hostname)
+                if w_instance:
+                    sge_hosts[w_instance.id] = host
+        except IndexError:
+            pass
+        capacity = Bunch(total=0, used=0, free=0, available=0, nodes={})
+        for inst in self.get_active_instances():
+            host = sge_hosts.get(inst.id)
+            total = host.slots_total if host and host.slots_total else inst.get_num_slots()
+            used = min(host.slots_used, total) if host else 0
+            node = Bunch(total=total, used=used, free=total - used)
+            capacity.nodes[inst.id] = node
+            capacity.total += node.total
+            capacity.used += node.used
+            capacity.free += node.free
+            if inst.node_ready is True:
+                capacity.available += node.free
+        return capacity
+
     # ==========================================================================
     # ============================ UTILITY METHODS =============================
     # ========================================================================
@@ -2162,7 +2486,7 @@ class ConsoleManager(BaseConsoleManager):
                     'instance_type': 'tester', 'public_ip': public_ip}
         else:
             num_cpus = int(commands.getoutput("cat /proc/cpuinfo | grep processor | wc -l"))
-            load = (commands.getoutput("cat /proc/loadavg | cut -d' ' -f1-3")).strip()  # Returns system load in format "0.00 0.02 0.39" for the past 1, 5, and 15 minutes, respectively
+            load = misc.get_load_average()  # Returns system load in format "0.00 0.02 0.39" for the past 1, 5, and 15 minutes, respectively
         if load != 0:
             lds = load.split(' ')
             if len(lds) == 3:
@@ -2184,13 +2508,43 @@ class ConsoleMonitor(object):
         self.conn = comm.CMMasterComm()
         if not self.app.TESTFLAG:
             self.conn.setup()
-        self.sleeper = misc.Sleeper()
         self.running = True
         # Keep some local stats to be able to adjust system updates
-        self.last_update_time = Time.now()
         self.last_system_change_time = Time.now()
         self.update_frequency = 10  # Frequency (in seconds) between system updates
         self.num_workers = -1
+        # Events (e.g., AMQP messages, service state changes, user actions)
+        # get posted to the scheduler while periodic checks run as
+        # independently timed jobs
+        self.scheduler = EventScheduler()
+        # Service status checks run concurrently, each limited in how long the
+        # monitor waits for it (see __check_services)
+        self.status_pool = ThreadPool(self.app.config.service_status_workers,
+                                      name='service-status')
+        self.status_checks = {}  # service -> PoolTask of its latest status check
+        self.adding_services = set()  # Services whose add() is in progress
+        # File systems (and the volumes composing them) get added concurrently
+        self.storage_pool = ThreadPool(self.app.config.storage_workers, name='storage')
+        # Messages are pushed by the AMQP consumer as AMQP_MESSAGE events; the
+        # job only polls for messages if the consumer is not connected
+        self.scheduler.add_job('messages', self.__check_amqp_messages, 2)
+        self.scheduler.add_handler(monitor_events.AMQP_MESSAGE,
+                                   lambda event: self._handle_pushed_message(event.data.message))
+        self.scheduler.add_job('add_services', self.__add_services, 10,
+                               events=[monitor_events.SERVICES_CHANGED])
+        self.scheduler.add_job('services', self.__check_services, self._get_update_frequency,
+                               events=[monitor_events.SERVICES_CHANGED])
+        self.scheduler.add_job('workers', self.__check_workers, self._get_update_frequency,
+                               events=[monitor_events.WORKERS_CHANGED])
+        self.scheduler.add_job('disk', self.__check_disk, 60)
+        self.scheduler.add_job('warm_pool', self.__maintain_warm_pool, 60,
+                               events=[monitor_events.WORKERS_CHANGED])
+        self.scheduler.add_handler(monitor_events.SERVICE_STATE_CHANGED,
+                                   self._handle_service_state_change)
+        # SGE host additions are processed in batches, off the monitor thread;
+        # instances act on the outcome (i.e., message the worker) from here
+        self.scheduler.add_handler(monitor_events.SGE_HOST_ADDED,
+                                   lambda event: event.data.instance._sge_host_added(event.data.success))
         # Start the monitor thread
         self.monitor_thread = threading.Thread(target=self.__monitor)
 
@@ -2226,11 +2580,43 @@ class ConsoleMonitor(object):
             if self.conn:
                 self.conn.shutdown()
             self.running = False
-            self.sleeper.wake()
+            self.scheduler.stop()
+            self.status_pool.shutdown()
+            self.storage_pool.shutdown()
             log.info("ConsoleMonitor thread stopped")
         except:
             pass
 
+    def post_event(self, event, **data):
+        """
+        Notify the monitor of an event (see ``monitor_events``) so it can react
+        to it without waiting for the next periodic check. Any keyword arguments
+        are made available to the event handlers. Safe to call from any thread.
+        """
+        self.scheduler.post(event, **data)
+
+    def _handle_service_state_change(self, event):
+        """
+        A service that has started (or completed) may satisfy the dependencies
+        of other services so check if any services can be added now. A newly
+        unstarted service is also an indication there is something to add.
+        """
+        self.last_system_change_time = Time.now()
+        if event.data.new_state in [service_states.RUNNING, service_states.COMPLETED]:
+            self.scheduler.get_job('add_services').run_soon()
+        elif (event.data.new_state == service_states.UNSTARTED and
+              event.data.old_state != service_states.STARTING):
+            # Services that fail their prerequisites go from STARTING back to
+            # UNSTARTED; reacting to those would just spin the monitor.
+            self.scheduler.get_job('add_services').run_soon()
+
+    def _get_update_frequency(self):
+        """ Return the frequency (in seconds) at which system updates are
+            performed by the monitor.
+        """
+        self._update_frequency()
+        return self.update_frequency
+
     def _update_frequency(self):
         """ Update the frequency value at which system updates are performed by the monitor.
         """
@@ -2253,23 +2639,24 @@ class ConsoleMonitor(object):
         :type state: string
         """
         log.debug("Updating local ref to instance '%s' state to '%s'" % (inst_id, state))
-        for inst in self.app.manager.worker_instances:
-            if inst.id == inst_id:
-                inst.sw_state = state
+        inst = self.app.manager.worker_instances.get_by_id(inst_id)
+        if inst:
+            inst.sw_state = state
 
     def expand_user_data_volume(self):
         # TODO: recover services if process fails midway
         log.info("Initiating user data volume resizing")
-        self.app.manager._stop_app_level_services()
-
         # Grow galaxyData filesystem
         svcs = self.app.manager.get_services(svc_type=ServiceType.FILE_SYSTEM)
         for svc in svcs:
             if ServiceRole.GALAXY_DATA in svc.svc_roles:
                 log.debug("Expanding '%s'" % svc.get_full_name())
-                svc.expand()
-
-        self.app.manager._start_app_level_services()
+                # If possible, the file system stays mounted so services keep
+                # running; otherwise, it is expanded offline
+                if svc.expand(online=True) is None:
+                    self.app.manager._stop_app_level_services()
+                    svc.expand(online=False)
+                    self.app.manager._start_app_level_services()
         return True
 
     def create_cluster_config_file(self, file_name='persistent_data-current.yaml', addl_data=None):
@@ -2300,6 +2687,13 @@ class ConsoleMonitor(object):
                             fs['secret_key'] = b.s_key
                         elif srvc.kind == 'volume':
                             fs['ids'] = [v.volume_id for v in srvc.volumes]
+                        elif srvc.kind == 'striped':
+                            fs['ids'] = [v.volume_id for v in srvc.volumes]
+                            snap_ids = [v.from_snapshot_id for v in srvc.volumes]
+                            if None not in snap_ids:
+                                fs['snap_ids'] = snap_ids
+                            fs['striping'] = srvc.striped.method
+                            fs['stripe_size'] = srvc.striped.stripe_size
                         elif srvc.kind == 'snapshot':
                             fs['ids'] = [
                                 v.from_snapshot_id for v in srvc.volumes]
@@ -2441,22 +2835,31 @@ class ConsoleMonitor(object):
     def __add_services(self):
         # Check and add any new services
         added_srvcs = False  # Flag to indicate if cluster conf was changed
-        for service in [s for s in self.app.manager.services if s.state == service_states.UNSTARTED]:
+        unstarted = [s for s in self.app.manager.services if s.state == service_states.UNSTARTED]
+        # File systems do not depend on one another so they are added
+        # concurrently; the monitor still waits for all of them to be added
+        # before storing the cluster configuration
+        # A service whose status is still being checked (in a status pool
+        # thread) is not added until the check completes
+        unstarted = [s for s in unstarted if self._status_check_done(s)]
+        fs_svcs = [s for s in unstarted if s.svc_type == ServiceType.FILE_SYSTEM]
+        if len(fs_svcs) > 1:
+            for service in fs_svcs:
+                log.debug("Monitor adding service '%s'" % service.get_full_name())
+            self.last_system_change_time = Time.now()
+            for task in self.storage_pool.map(self._add_service, fs_svcs):
+                if task.result:
+                    added_srvcs = True
+            unstarted = [s for s in unstarted if s not in fs_svcs]
+        for service in unstarted:
             log.debug("Monitor adding service '%s'" % service.get_full_name())
             self.last_system_change_time = Time.now()
-            if service.add():
-                added_srvcs = True  # else:
-
-            # log.debug("Monitor DIDN'T add service {0}? Service state: {1}"\
-            # .format(service.get_full_name(), service.state))
+            if self._add_service(service):
+                added_srvcs = True
             # Store cluster conf after all services have been added.
             # NOTE: this flag relies on the assumption service additions are
-            # sequential (i.e., monitor waits for the service add call to complete).
-            # If any of the services are to be added via separate threads, a
-            # system-wide flag should probably be maintained for that particular
-            # service that would indicate the configuration of the service is
-            # complete. This could probably be done by monitoring
-            # the service state flag that is already maintained?
+            # complete once add() returns (i.e., the monitor waits for the
+            # service add calls to complete, even the concurrent ones above).
         if added_srvcs and self.app.cloud_type != 'opennebula':
             self.store_cluster_config()  # Check and grow the file system
         svcs = self.app.manager.get_services(svc_type=ServiceType.FILE_SYSTEM)
@@ -2468,29 +2871,193 @@ class ConsoleMonitor(object):
                 if self.app.cloud_type != 'opennebula':
                     self.store_cluster_config()
 
+    def _add_service(self, service):
+        """
+        Add ``service``, keeping its status from being checked meanwhile.
+        """
+        self.adding_services.add(service)
+        try:
+            return service.add()
+        finally:
+            self.adding_services.discard(service)
+
+    def _status_check_done(self, service):
+        task = self.status_checks.get(service)
+        if task and not task.done:
+            log.debug("Not adding service {0} while its status is being checked"
+                      .format(service.get_full_name()))
+            return False
+        return True
+
+    def _get_status_timeout(self, service):
+        """
+        Return how long (in seconds) the monitor waits for a status check of
+        ``service`` to complete once it has started running.
+        """
+        timeouts = self.app.config.service_status_timeouts
+        return timeouts.get(service.get_full_name(), timeouts.get(
+            service.name, self.app.config.service_status_timeout))
+
+    def _handle_amqp_message(self, m):
+        def do_match():
+            inst = self.app.manager.worker_instances.get_by_id(str(m.properties['reply_to']))
+            if inst:
+                inst.handle_message(m.body)
+                return True
+            return False
+
+        if not do_match():
+            log.debug("No instance (%s) match found for message %s; will add instance now!"
+                % (m.properties['reply_to'], m.body))
+            if self.app.manager.add_live_instance(m.properties['reply_to']):
+                do_match()
+            else:
+                log.warning("Potential error, got message from instance '%s' "
+                            "but not aware of this instance. Ignoring the instance."
+                            % m.properties['reply_to'])
+
+    def _handle_pushed_message(self, m):
+        """
+        Handle a message pushed by the AMQP consumer and only then have the
+        consumer acknowledge it so it is not lost if the master goes down
+        before the message is handled.
+        """
+        try:
+            self._handle_amqp_message(m)
+        finally:
+            self.conn.ack(m)
+
     def __check_amqp_messages(self):
+        if self.conn.is_consuming():
+            return  # Messages are being pushed to us
         # Check for any new AMQP messages
         m = self.conn.recv()
         while m is not None:
-            def do_match():
-                match = False
-                for inst in self.app.manager.worker_instances:
-                    if str(inst.id) == str(m.properties['reply_to']):
-                        match = True
-                        inst.handle_message(m.body)
-                return match
-
-            if not do_match():
-                log.debug("No instance (%s) match found for message %s; will add instance now!"
-                    % (m.properties['reply_to'], m.body))
-                if self.app.manager.add_live_instance(m.properties['reply_to']):
-                    do_match()
-                else:
-                    log.warning("Potential error, got message from instance '%s' "
-                                "but not aware of this instance. Ignoring the instance."
-                                % m.properties['reply_to'])
+            self._handle_amqp_message(m)
             m = self.conn.recv()
 
+    def __check_disk(self):
+        self.app.manager.check_disk()
+
+    def __maintain_warm_pool(self):
+        self.app.manager.maintain_warm_pool()
+
+    def __check_services(self):
+        # Check services' status concurrently so one slow (or hung) check does
+        # not hold up the rest. Each check is given its service's timeout from
+        # the time it starts running (not from the time it got queued). If a
+        # check does not complete in time, the service keeps its last known
+        # state and the check is not resubmitted until the outstanding one
+        # completes. Services being added are not checked. The autoscaler's
+        # status check adds and removes worker instances so it runs on the
+        # monitor thread, once the other checks are done, rather than
+        # concurrently with __check_workers.
+        services = [s for s in self.app.manager.services
+                    if s not in self.adding_services]
+        inline_services = [s for s in services if ServiceRole.AUTOSCALE in s.svc_roles]
+        services = [s for s in services if s not in inline_services]
+        for service in services:
+            task = self.status_checks.get(service)
+            if task and not task.done:
+                log.warning("Status check for service {0} has not completed in {1} "
+                    "secs; using its last known state ({2})".format(
+                    service.get_full_name(), int(time.time() - task.submitted),
+                    service.state))
+                continue
+            self.status_checks[service] = self.status_pool.submit(service.status)
+        for service in self.status_checks.keys():
+            if service not in self.app.manager.services:
+                # Service has been removed; stop tracking its checks
+                del self.status_checks[service]
+        pending = dict((task, service) for service, task in self.status_checks.iteritems()
+                       if service in services and not task.done)
+        while pending:
+            idle = self.status_pool.idle  # Read before the tasks' start times
+            now = time.time()
+            deadlines = dict((t, t.started + self._get_status_timeout(s))
+                             for t, s in pending.iteritems() if t.started)
+            running = [t for t, deadline in deadlines.iteritems() if now < deadline]
+            # Queued checks are waited for as long as there are threads free
+            # to run them (i.e., not held up by checks that have timed out)
+            queued = [t for t in pending if t not in deadlines]
+            if not running and not (queued and idle):
+                break
+            if running:
+                task = min(running, key=deadlines.get)
+                task.wait(min(0.5, deadlines[task] - now))
+            else:
+                time.sleep(0.05)
+            pending = dict((t, s) for t, s in pending.iteritems() if not t.done)
+        for task, service in pending.iteritems():
+            if task.started:
+                log.debug("Status check for service {0} timed out after {1} secs"
+                    .format(service.get_full_name(), self._get_status_timeout(service)))
+            else:
+                log.debug("Status check for service {0} is queued behind checks "
+                    "that have not completed".format(service.get_full_name()))
+        for service in inline_services:
+            try:
+                service.status()
+            except Exception, e:
+                log.exception("Error checking the status of service {0}: {1}".format(
+                    service.get_full_name(), e))
+        # Indicate migration is in progress
+        migration_service = self.app.manager.get_services(svc_role=ServiceRole.MIGRATION)
+        if migration_service:
+            migration_service = migration_service[0]
+            msg = "Migration service in progress; please wait."
+            if migration_service.state == service_states.RUNNING:
+                if not self.app.msgs.message_exists(msg):
+                    self.app.msgs.critical(msg)
+            elif migration_service.state == service_states.COMPLETED:
+                self.app.msgs.remove_message(msg)
+        # Log current services' states (in condensed format)
+        svcs_state = "S&S: "
+        for s in self.app.manager.services:
+            svcs_state += "%s..%s; " % (s.get_full_name(),
+                'OK' if s.state == 'Running' else s.state)
+        log.debug(svcs_state)
+
+    def __check_workers(self):
+        # Check the status of worker instances
+        quiet_instances = []  # Instances whose state needs to be checked
+        # Update all the outstanding Spot requests at once
+        self.app.manager.spot_tracker.update()
+        for w_instance in self.app.manager.worker_instances:
+            if w_instance.is_spot():
+                w_instance.update_spot()
+                if not w_instance.spot_was_filled():
+                    # Wait until the Spot request has been filled to start
+                    # treating the instance as a regular Instance
+                    continue
+            # Send current mount points to ensure master and workers FSs are in sync
+            if w_instance.node_ready:
+                w_instance.send_mount_points()
+            # As long we we're hearing from an instance, assume all OK (workers
+            # that have nothing new to report only send a periodic heartbeat,
+            # at the interval they last announced).
+            if (Time.now() - w_instance.last_comm).seconds < w_instance.heartbeat_interval + 12:
+                # log.debug("Instance {0} OK (heard from it {1} secs ago)".format(
+                #     w_instance.get_desc(),
+                #     (Time.now() - w_instance.last_comm).seconds))
+                continue
+            # Explicitly check the state of a quiet instance (but only
+            # periodically)
+            elif (Time.now() - w_instance.last_state_update).seconds > 30:
+                log.debug("Have not heard from or checked on instance {0} "
+                    "for a while; checking now.".format(w_instance.get_desc()))
+                quiet_instances.append(w_instance)
+            else:
+                log.debug("Instance {0} has been quiet for a while (last check "
+                    "{1} secs ago); will wait a bit longer before a check..."
+                    .format(w_instance.get_desc(),
+                    (Time.now() - w_instance.last_state_update).seconds))
+        if quiet_instances:
+            # Get the state of all the quiet instances with a single cloud request
+            self.app.manager.refresh_worker_states(quiet_instances)
+            for w_instance in quiet_instances:
+                w_instance.maintain(refresh=False)
+
     def __monitor(self):
         if not self.app.manager.manager_started:
             if not self.app.manager.start():
@@ -2498,7 +3065,6 @@ class ConsoleMonitor(object):
                 return False
         log.debug("Monitor started; manager started")
         while self.running:
-            self.sleeper.sleep(4)
             if self.app.manager.cluster_status == cluster_status.TERMINATED:
                 self.running = False
                 return
@@ -2508,60 +3074,164 @@ class ConsoleMonitor(object):
                 log.debug(
                     "Trying to setup AMQP connection; conn = '%s'" % self.conn)
                 self.conn.setup()
-                continue
-            # Do a periodic system state update (eg, services, workers)
-            self._update_frequency()
-            if (Time.now() - self.last_update_time).seconds > self.update_frequency:
-                self.last_update_time = Time.now()
-                self.app.manager.check_disk()
-                for service in self.app.manager.services:
-                    service.status()
-                # Indicate migration is in progress
-                migration_service = self.app.manager.get_services(svc_role=ServiceRole.MIGRATION)
-                if migration_service:
-                    migration_service = migration_service[0]
-                    msg = "Migration service in progress; please wait."
-                    if migration_service.state == service_states.RUNNING:
-                        if not self.app.msgs.message_exists(msg):
-                            self.app.msgs.critical(msg)
-                    elif migration_service.state == service_states.COMPLETED:
-                        self.app.msgs.remove_message(msg)
-                # Log current services' states (in condensed format)
-                svcs_state = "S&S: "
-                for s in self.app.manager.services:
-                    svcs_state += "%s..%s; " % (s.get_full_name(),
-                        'OK' if s.state == 'Running' else s.state)
-                log.debug(svcs_state)
-                # Check the status of worker instances
-                for w_instance in self.app.manager.worker_instances:
-                    if w_instance.is_spot():
-                        w_instance.update_spot()
-                        if not w_instance.spot_was_filled():
-                            # Wait until the Spot request has been filled to start
-                            # treating the instance as a regular Instance
-                            continue
-                    # Send current mount points to ensure master and workers FSs are in sync
-                    if w_instance.node_ready:
-                        w_instance.send_mount_points()
-                    # As long we we're hearing from an instance, assume all OK.
-                    if (Time.now() - w_instance.last_comm).seconds < 22:
-                        # log.debug("Instance {0} OK (heard from it {1} secs ago)".format(
-                        #     w_instance.get_desc(),
-                        #     (Time.now() - w_instance.last_comm).seconds))
-                        continue
-                    # Explicitly check the state of a quiet instance (but only
-                    # periodically)
-                    elif (Time.now() - w_instance.last_state_update).seconds > 30:
-                        log.debug("Have not heard from or checked on instance {0} "
-                            "for a while; checking now.".format(w_instance.get_desc()))
-                        w_instance.maintain()
-                    else:
-                        log.debug("Instance {0} has been quiet for a while (last check "
-                            "{1} secs ago); will wait a bit longer before a check..."
-                            .format(w_instance.get_desc(),
-                            (Time.now() - w_instance.last_state_update).seconds))
-            self.__add_services()
-            self.__check_amqp_messages()
+                if not self.conn.is_connected():
+                    time.sleep(4)
+                    continue
+            # Have messages pushed to the monitor as they arrive
+            self.conn.start_consumer(
+                lambda m: self.post_event(monitor_events.AMQP_MESSAGE, message=m))
+            self.scheduler.run_pending()
+
+
+class WorkerInstanceList(list):
+    """
+    The list of worker ``Instance`` objects, with constant time lookups of an
+    instance by its ID, private IP or hostname. The lookup indexes are kept
+    in sync as instances are added to or removed from the list; an instance
+    whose ID, IP or hostname changes after it has been added should call
+    ``reindex``. A lookup that misses the index falls back to scanning the
+    list (and indexes the instance if found there).
+    """
+    def __init__(self, instances=None):
+        super(WorkerInstanceList, self).__init__(instances or [])
+        self.lock = threading.RLock()
+        self._indexes = {'id': {}, 'ip': {}, 'hostname': {}}
+        self._keys = {}  # id(instance) -> list of (index name, key) tuples
+        for inst in self:
+            self.reindex(inst)
+
+    @staticmethod
+    def _hostname_keys(hostname):
+        # SGE may refer to a host by its full or its short hostname
+        hostname = str(hostname).lower()
+        return set([hostname, hostname.split('.')[0]])
+
+    def _instance_keys(self, inst):
+        keys = []
+        if inst.id:
+            keys.append(('id', str(inst.id)))
+        if inst.private_ip:
+            keys.append(('ip', str(inst.private_ip)))
+        if inst.local_hostname:
+            keys.extend([('hostname', h) for h in self._hostname_keys(inst.local_hostname)])
+        return keys
+
+    def _unindex(self, inst):
+        with self.lock:
+            for index, key in self._keys.pop(id(inst), []):
+                if self._indexes[index].get(key) is inst:
+                    del self._indexes[index][key]
+
+    def reindex(self, inst):
+        """ (Re)build the index entries for ``inst``. """
+        with self.lock:
+            self._unindex(inst)
+            keys = self._instance_keys(inst)
+            for index, key in keys:
+                self._indexes[index][key] = inst
+            self._keys[id(inst)] = keys
+
+    def _lookup(self, index, key, matches):
+        with self.lock:
+            inst = self._indexes[index].get(key)
+            if inst is not None and matches(inst):
+                return inst
+            for inst in self:
+                if matches(inst):
+                    self.reindex(inst)
+                    return inst
+            return None
+
+    def get_by_id(self, instance_id):
+        instance_id = str(instance_id)
+        return self._lookup('id', instance_id, lambda i: str(i.id) == instance_id)
+
+    def get_by_ip(self, private_ip):
+        private_ip = str(private_ip)
+        return self._lookup('ip', private_ip, lambda i: str(i.private_ip) == private_ip)
+
+    def get_by_hostname(self, hostname):
+        hostname = str(hostname).lower()
+        return self._lookup('hostname', hostname, lambda i: i.local_hostname is not None and
+                            str(i.local_hostname).lower().startswith(hostname))
+
+    def append(self, inst):
+        with self.lock:
+            super(WorkerInstanceList, self).append(inst)
+            self.reindex(inst)
+
+    def extend(self, instances):
+        for inst in instances:
+            self.append(inst)
+
+    def insert(self, index, inst):
+        with self.lock:
+            super(WorkerInstanceList, self).insert(index, inst)
+            self.reindex(inst)
+
+    def remove(self, inst):
+        with self.lock:
+            super(WorkerInstanceList, self).remove(inst)
+            self._unindex(inst)
+
+    def pop(self, index=-1):
+        with self.lock:
+            inst = super(WorkerInstanceList, self).pop(index)
+            self._unindex(inst)
+            return inst
+
+
+class SpotRequestTracker(object):
+    """
+    Keep track of all outstanding Spot requests in the cluster, polling the
+    cloud middleware for their state with a single request (rather than
+    one request per Spot request) and applying any state transitions to
+    the respective Instance objects.
+    """
+    def __init__(self, app, poll_interval=10):
+        self.app = app
+        # Minimum number of seconds between consecutive polls
+        self.poll_interval = poll_interval
+        self.last_poll = None
+        self.lock = threading.Lock()
+
+    def get_outstanding(self):
+        """ Return the list of Spot Instance objects whose request has not
+            been filled yet.
+        """
+        return [i for i in self.app.manager.worker_instances
+                if i.is_spot() and i.spot_state != spot_states.ACTIVE]
+
+    def update(self, force=False):
+        """ Poll for the state of all outstanding Spot requests, but not more
+            often than every ``self.poll_interval`` seconds unless ``force``
+            is set. Return the number of requests that were polled.
+        """
+        if not self.lock.acquire(False):
+            return 0  # Another thread is polling right now
+        try:
+            if (not force and self.last_poll is not None and
+               time.time() - self.last_poll < self.poll_interval):
+                return 0
+            outstanding = dict((i.spot_request_id, i) for i in self.get_outstanding())
+            if not outstanding:
+                return 0
+            self.last_poll = time.time()
+            try:
+                ec2_conn = self.app.cloud_interface.get_ec2_connection()
+                reqs = ec2_conn.get_all_spot_instance_requests(
+                    request_ids=outstanding.keys())
+            except EC2ResponseError, e:
+                log.error("Trouble retrieving {0} spot requests: {1}".format(
+                    len(outstanding), e))
+                return 0
+            for req in reqs:
+                inst = outstanding.get(req.id)
+                if inst:
+                    inst.apply_spot_request(req)
+            return len(outstanding)
+        finally:
+            self.lock.release()
 
 
 class Instance(object):
@@ -2594,27 +3264,45 @@ class Instance(object):
         self.is_alive = False
         self.node_ready = False
         self.num_cpus = 1
+        self.standby = False  # Whether the instance is kept in the warm pool
         self.time_rebooted = TIME_IN_PAST  # Initialize to a date in the past
         self.reboot_count = 0
         self.terminate_attempt_count = 0
         self.last_comm = TIME_IN_PAST  # Initialize to a date in the past
+        # Longest the instance may go without sending a message (in seconds)
+        self.heartbeat_interval = protocol.HEARTBEAT_INTERVAL
+        self.launch_time = None  # As reported by the cloud middleware
+        self.time_created = Time.now()
+        self.idle_since = None  # Since when the instance has not run any jobs
         self.nfs_data = 0
         self.nfs_tools = 0
         self.nfs_indices = 0
         self.nfs_sge = 0
         self.nfs_tfs = 0  # Transient file system, NFS-mounted from the master
+        self.cache = {}  # File system name -> status of the worker's local read cache for it
         self.get_cert = 0
         self.sge_started = 0
         self.worker_status = 'Pending'  # Pending, Wake, Startup, Ready, Stopping, Error
         self.load = 0
         self.type = 'Unknown'
         self.reboot_required = reboot_required
-        self.update_spot()
-
-    def maintain(self):
+        # Version of the message protocol the instance speaks; assume the
+        # legacy format until the instance tells us otherwise
+        self.protocol_version = protocol.LEGACY_VERSION
+        if self.is_spot():
+            # The state of the request gets updated by the manager's spot tracker
+            self.spot_state = spot_states.OPEN
+
+    def maintain(self, refresh=True):
         """ Based on the state and status of this instance, try to do the right thing
             to keep the instance functional. Note that this may lead to terminating
             the instance.
+
+            :type refresh: bool
+            :param refresh: If True, query the cloud middleware for the current
+                            state of the instance; else, use the state obtained
+                            by the most recent update (e.g., via
+                            ``ConsoleManager.refresh_worker_states``)
         """
         def reboot_terminate_logic():
             """ Make a decision whether to terminate or reboot an instance.
@@ -2633,7 +3321,7 @@ class Instance(object):
                 self.terminate()
 
         # Update state then do resolution
-        state = self.get_m_state()
+        state = self.get_m_state() if refresh else self.m_state
         if state == instance_states.PENDING or state == instance_states.SHUTTING_DOWN:
             if (Time.now() - self.last_m_state_change).seconds > self.config.instance_state_change_wait and \
                (Time.now() - self.time_rebooted).seconds > self.config.instance_reboot_timeout:
@@ -2662,6 +3350,49 @@ class Instance(object):
                (Time.now() - self.time_rebooted).seconds > self.config.instance_reboot_timeout:
                 reboot_terminate_logic()
 
+    def get_launch_time(self):
+        """
+        Return the time (as a UTC ``datetime``) the instance was launched at,
+        as reported by the cloud middleware. If not available, the time
+        this object was created is returned.
+        """
+        if self.launch_time is None and self.inst is not None:
+            try:
+                self.launch_time = parse_ts(self.inst.launch_time)
+            except (AttributeError, TypeError, ValueError), e:
+                log.debug("Could not get launch time for instance {0}: {1}"
+                          .format(self.id, e))
+        return self.launch_time or self.time_created
+
+    def get_seconds_to_billing_boundary(self, period=3600):
+        """
+        Return the number of seconds until the current billing period (of
+        ``period`` seconds, counted from the instance launch time) of this
+        instance rolls over.
+        """
+        uptime = Time.now() - self.get_launch_time()
+        uptime = uptime.seconds + uptime.days * 24 * 3600
+        return period - (max(0, uptime) % period)
+
+    def set_standby(self, standby):
+        """
+        Mark this instance as kept in (or taken out of) the warm pool,
+        recording it in the instance tags so a restarted master knows too.
+        """
+        self.standby = standby
+        if self.inst:
+            self.app.cloud_interface.add_tag(self.inst, 'standby', 'true' if standby else 'false')
+
+    def get_num_slots(self):
+        """
+        Return the number of job slots this instance provides, as reported
+        by the instance itself (i.e., its number of CPUs).
+        """
+        try:
+            return max(1, int(self.num_cpus))
+        except (TypeError, ValueError):
+            return 1
+
     def get_cloud_instance_object(self, deep=False):
         """ Get the instance object for this instance from the library used to
             communicate with the cloud middleware. In the case of boto, this
@@ -2683,7 +3414,9 @@ class Instance(object):
             self.inst = None
         if self.inst is None and self.id is not None:
             try:
-                rs = self.app.cloud_interface.get_all_instances(self.id)
+                # A deep check must not be answered from the response cache
+                rs = self.app.cloud_interface.get_all_instances(
+                    self.id, max_age=0 if deep else None)
                 if len(rs) == 0:
                     log.warning("Instance {0} not found on the cloud?".format(
                         self.id))
@@ -2733,6 +3466,7 @@ class Instance(object):
                  'nfs_indices': self.nfs_indices,
                  'nfs_sge': self.nfs_sge,
                  'nfs_tfs': self.nfs_tfs,
+                 'cache': self.cache,
                  'get_cert': self.get_cert,
                  'sge_started': self.sge_started,
                  'worker_status': self.worker_status,
@@ -2832,6 +3566,14 @@ class Instance(object):
         inst_terminated = self.app.cloud_interface.terminate_instance(
             instance_id=self.id,
             spot_request_id=self.spot_request_id if self.is_spot() else None)
+        self.handle_termination(inst_terminated)
+
+    def handle_termination(self, inst_terminated):
+        """
+        Update the state of this instance after a termination request for it
+        (e.g., one of a batch, see ``ConsoleManager.remove_instances``) was
+        made. ``inst_terminated`` indicates whether the request succeeded.
+        """
         self.terminate_attempt_count += 1
         if inst_terminated is False:
             log.error("Terminating instance %s did not go smoothly; instance state: '%s'"
@@ -2885,8 +3627,41 @@ class Instance(object):
             log.debug("Getting m_state for instance {0} but TESTFLAG is set; returning 'running'"
                 .format(self.get_id()))
             return "running"
-        self.last_state_update = Time.now()
         self.get_cloud_instance_object(deep=True)
+        return self._update_m_state()
+
+    def set_cloud_instance_object(self, inst):
+        """ Set the cloud instance object for this instance (e.g., as obtained
+            via a batched request for the state of multiple instances) and
+            update the machine state of the instance accordingly.
+
+            :type inst: boto.ec2.instance.Instance
+            :param inst: Cloud instance object for this instance or ``None`` if
+                         the instance was not found on the cloud
+
+            :rtype: String
+            :return: the current state of the instance
+        """
+        self.inst = inst
+        if inst is not None and self.id != str(inst.id):
+            self.id = str(inst.id)
+            self.launch_time = None
+            self._reindex()
+        return self._update_m_state()
+
+    def _reindex(self):
+        """ Let the list of worker instances know that an attribute used for
+            looking up this instance (ID, private IP or hostname) has changed.
+        """
+        worker_instances = getattr(self.app.manager, 'worker_instances', None)
+        if hasattr(worker_instances, 'reindex'):
+            worker_instances.reindex(self)
+
+    def _update_m_state(self):
+        """ Update the machine state of the current instance from the local
+            cloud instance object (``self.inst``).
+        """
+        self.last_state_update = Time.now()
         if self.inst:
             try:
                 state = self.inst.state
@@ -2908,14 +3683,14 @@ class Instance(object):
 
     @TestFlag(None)
     def send_alive_request(self):
-        self.app.manager.console_monitor.conn.send('ALIVE_REQUEST', self.id)
+        self._send_msg('ALIVE_REQUEST')
 
     def send_sync_etc_host(self, msg):
         # Because the hosts file is synced over the transientFS, give the FS
         # some time to become available before sending the msg
         for i in range(5):
             if int(self.nfs_tfs):
-                self.app.manager.console_monitor.conn.send('SYNC_ETC_HOSTS | ' + msg, self.id)
+                self._send_msg('SYNC_ETC_HOSTS', hosts_file=msg)
                 break
             log.debug("Transient FS on instance not available; waiting a bit...")
             time.sleep(7)
@@ -2924,14 +3699,14 @@ class Instance(object):
         # log.debug("\tMT: Sending STATUS_CHECK message" )
         if self.app.TESTFLAG is True:
             return
-        self.app.manager.console_monitor.conn.send('STATUS_CHECK', self.id)
+        self._send_msg('STATUS_CHECK')
         # log.debug( "\tMT: Message STATUS_CHECK sent; waiting on response" )
 
     def send_worker_restart(self):
         # log.info("\tMT: Sending restart message to worker %s" % self.id)
         if self.app.TESTFLAG is True:
             return
-        self.app.manager.console_monitor.conn.send('RESTART | %s' % self.app.cloud_interface.get_private_ip(), self.id)
+        self._send_msg('RESTART', master_ip=self.app.cloud_interface.get_private_ip())
         log.info("\tMT: Sent RESTART message to worker '%s'" % self.id)
 
     def update_spot(self, force=False):
@@ -2947,46 +3722,60 @@ class Instance(object):
                           irrespective of the stored spot request state.
         """
         if self.is_spot() and (force or self.spot_state != spot_states.ACTIVE):
-            old_state = self.spot_state
+            spot_tracker = getattr(self.app.manager, 'spot_tracker', None)
+            if not force and spot_tracker is not None:
+                # Outstanding requests are polled in bulk by the spot tracker
+                spot_tracker.update()
+                return self.spot_state
             try:
                 ec2_conn = self.app.cloud_interface.get_ec2_connection()
                 reqs = ec2_conn.get_all_spot_instance_requests(
                     request_ids=[self.spot_request_id])
                 for req in reqs:
-                    self.spot_state = req.state
-                    # Also update the worker_status because otherwise there's no
-                    # single source to distinguish between simply an instance
-                    # in Pending state and a Spot request
-                    self.worker_status = self.spot_state
-                    # If the state has changed, do a deeper update
-                    if self.spot_state != old_state:
-                        if self.spot_state == spot_states.CANCELLED:
-                            # The request was canceled so remove this Instance
-                            # object
-                            log.info("Spot request {0} was canceled; removing Instance object {1}"
-                                .format(self.spot_request_id, self.id))
-                            self._remove_instance()
-                        elif self.spot_state == spot_states.ACTIVE:
-                            # We should have an instance now
-                            self.id = req.instance_id
-                            log.info("Spot request {0} filled with instance {1}"
-                                .format(self.spot_request_id, self.id))
-                            # Potentially give it a few seconds so everything gets registered
-                            for i in range(3):
-                                instance = self.get_cloud_instance_object()
-                                if instance:
-                                    self.app.cloud_interface.add_tag(instance,
-                                        'clusterName', self.app.ud['cluster_name'])
-                                    self.app.cloud_interface.add_tag(instance, 'role', 'worker')
-                                    self.app.cloud_interface.add_tag(instance,
-                                        'Name', "Worker: {0}".format(self.app.ud['cluster_name']))
-                                    break
-                                time.sleep(5)
+                    self.apply_spot_request(req)
             except EC2ResponseError, e:
                 log.error("Trouble retrieving spot request {0}: {1}".format(
                     self.spot_request_id, e))
         return self.spot_state
 
+    def apply_spot_request(self, req):
+        """ Update this Instance from the Spot request object ``req`` (as
+            obtained from the cloud middleware). If the request has entered
+            spot_states.ACTIVE or spot_states.CANCELLED states, update the
+            Instance object itself otherwise just update state.
+        """
+        old_state = self.spot_state
+        self.spot_state = req.state
+        # Also update the worker_status because otherwise there's no
+        # single source to distinguish between simply an instance
+        # in Pending state and a Spot request
+        self.worker_status = self.spot_state
+        # If the state has changed, do a deeper update
+        if self.spot_state != old_state:
+            if self.spot_state == spot_states.CANCELLED:
+                # The request was canceled so remove this Instance
+                # object
+                log.info("Spot request {0} was canceled; removing Instance object {1}"
+                    .format(self.spot_request_id, self.id))
+                self._remove_instance()
+            elif self.spot_state == spot_states.ACTIVE:
+                # We should have an instance now
+                self.id = req.instance_id
+                self._reindex()
+                log.info("Spot request {0} filled with instance {1}"
+                    .format(self.spot_request_id, self.id))
+                # Potentially give it a few seconds so everything gets registered
+                for i in range(3):
+                    instance = self.get_cloud_instance_object()
+                    if instance:
+                        self.app.cloud_interface.add_tag(instance,
+                            'clusterName', self.app.ud['cluster_name'])
+                        self.app.cloud_interface.add_tag(instance, 'role', 'worker')
+                        self.app.cloud_interface.add_tag(instance,
+                            'Name', "Worker: {0}".format(self.app.ud['cluster_name']))
+                        break
+                    time.sleep(5)
+
     def get_private_ip(self):
         # log.debug("Getting instance '%s' private IP: '%s'" % ( self.id, self.private_ip ) )
         if self.app.TESTFLAG is True:
@@ -3056,26 +3845,25 @@ class Instance(object):
                  'server': server,
                  'mount_options': options,
                  'shared_mount_path': fs.get_details()['mount_point'],
-                 'fs_name': fs.get_details()['name']})
-        jmp = json.dumps({'mount_points': mount_points})
-        self.app.manager.console_monitor.conn.send('MOUNT | %s' % jmp, self.id)
+                 'fs_name': fs.get_details()['name'],
+                 'roles': ServiceRole.to_string_array(fs.svc_roles)})
+        self._send_msg('MOUNT', mount_points=mount_points)
         # log.debug("Sent mount points %s to worker %s" % (mount_points, self.id))
 
     def send_master_pubkey(self):
         # log.info("\tMT: Sending MASTER_PUBKEY message: %s" % self.app.manager.get_root_public_key() )
-        self.app.manager.console_monitor.conn.send('MASTER_PUBKEY | %s'
-            % self.app.manager.get_root_public_key(), self.id)
+        self._send_msg('MASTER_PUBKEY', public_key=self.app.manager.get_root_public_key())
         log.debug("Sent master public key to worker instance '%s'." % self.id)
         log.debug("\tMT: Message MASTER_PUBKEY %s sent to '%s'"
             % (self.app.manager.get_root_public_key(), self.id))
 
     def send_start_sge(self):
         log.debug("\tMT: Sending START_SGE message to instance '%s'" % self.id)
-        self.app.manager.console_monitor.conn.send('START_SGE', self.id)
+        self._send_msg('START_SGE')
 
     def send_add_s3fs(self, bucket_name, svc_roles):
-        msg = 'ADDS3FS | {0} | {1}'.format(bucket_name, ServiceRole.to_string(svc_roles))
-        self._send_msg(msg)
+        self._send_msg('ADDS3FS', bucket_name=bucket_name,
+                       svc_roles=ServiceRole.to_string(svc_roles))
 
     # def send_add_nfs_fs(self, nfs_server, fs_name, svc_roles, username=None, pwd=None):
     #     """
@@ -3089,36 +3877,110 @@ class Instance(object):
     #     msg = "ADD_NFS_FS | {0}".format(json.dumps({'nfs_server_info': nfs_server_info}))
     #     self._send_msg(msg)
 
-    def _send_msg(self, msg):
+    def _uses_legacy_protocol(self):
+        return self.protocol_version < protocol.PROTOCOL_VERSION
+
+    def _send_msg(self, msg_type, **payload):
         """
-        An internal convenience method to log and send a message to the current instance.
+        An internal convenience method to log and send a message to the current
+        instance, encoded in the format the instance understands.
         """
-        log.debug("\tMT: Sending message '{msg}' to instance {inst}".format(msg=msg, inst=self.id))
-        self.app.manager.console_monitor.conn.send(msg, self.id)
+        log.debug("\tMT: Sending message '{msg}' to instance {inst}".format(msg=msg_type, inst=self.id))
+        self.app.manager.console_monitor.conn.send_message(
+            msg_type, self.id, payload, legacy=self._uses_legacy_protocol())
+
+    def _send_batch(self, messages):
+        """
+        Send a list of ``(msg_type, payload)`` tuples to the current instance,
+        as a single message if the instance understands batched messages.
+        """
+        if self._uses_legacy_protocol():
+            for msg_type, payload in messages:
+                self._send_msg(msg_type, **payload)
+        else:
+            log.debug("\tMT: Sending batch of messages {msgs} to instance {inst}"
+                      .format(msgs=[m[0] for m in messages], inst=self.id))
+            self.app.manager.console_monitor.conn.send_batch(messages, self.id)
+
+    def _queue_sge_host_added(self, success):
+        """
+        Callback for the SGE service once it has processed the addition of
+        this instance as an SGE host. It is called from the thread processing
+        the batch of host additions so only hand the outcome over to the
+        monitor thread, which owns the AMQP connection.
+        """
+        self.app.manager.console_monitor.post_event(
+            monitor_events.SGE_HOST_ADDED, instance=self, success=success)
+
+    def _sge_host_added(self, success):
+        """
+        Act on the outcome of the addition of this instance as an SGE host
+        (called from the monitor thread).
+        """
+        if success:
+            if self.standby:
+                # Keep jobs off the instance until it is taken out of the warm pool
+                sge_svc = self.app.manager.get_services(svc_role=ServiceRole.SGE)
+                if sge_svc:
+                    sge_svc[0].set_hosts_enabled([self.private_ip], enabled=False)
+            # Send a message to worker to start SGE and, if there
+            # are any bucket-based FSs, tell the worker to add those
+            msgs = [('START_SGE', {})]
+            fss = self.app.manager.get_services(
+                svc_type=ServiceType.FILE_SYSTEM)
+            for fs in fss:
+                if len(fs.buckets) > 0:
+                    for b in fs.buckets:
+                        msgs.append(('ADDS3FS', {
+                            'bucket_name': b.bucket_name,
+                            'svc_roles': ServiceRole.to_string(fs.svc_roles)}))
+            self._send_batch(msgs)
+            log.info("Waiting on worker instance %s to configure itself..."
+                % self.get_desc())
+        else:
+            log.error("Adding host to SGE did not go smoothly, "
+                "not instructing worker to configure SGE daemon.")
 
     def handle_message(self, msg):
+        """
+        Handle a message received from this instance. ``msg`` is the message
+        body, in either the current or the legacy format (see ``cm.util.protocol``).
+        """
         # log.debug( "Handling message: %s from %s" % ( msg, self.id ) )
         self.is_alive = True
         self.last_comm = Time.now()
+        try:
+            messages = protocol.decode(msg, sender=self.id)
+        except protocol.MessageError, e:
+            log.debug("Unknown Message: %s (%s)" % (msg, e))
+            return
+        for m in messages:
+            if m.version > self.protocol_version:
+                self.protocol_version = m.version
+            self._handle_message(m)
+
+    def _handle_message(self, m):
         # Transition from states to a particular response.
         if self.app.manager.console_monitor.conn:
-            msg_type = msg.split(' | ')[0]
+            msg_type = m.type
             if msg_type == "ALIVE":
                 self.worker_status = "Starting"
                 log.info("Instance %s reported alive" % self.get_desc())
-                msp = msg.split(' | ')
-                self.private_ip = msp[1]
-                self.public_ip = msp[2]
-                self.zone = msp[3]
-                self.type = msp[4]
-                self.ami = msp[5]
+                self.private_ip = m.get('private_ip')
+                self.public_ip = m.get('public_ip')
+                self.zone = m.get('zone')
+                self.type = m.get('type')
+                self.ami = m.get('ami')
+                # Older versions of CloudMan did not pass this value so if the master
+                # and the worker are running 2 diff versions (can happen after an
+                # automatic update), don't crash here.
+                self.local_hostname = m.get('local_hostname', self.public_ip)
                 try:
-                    self.local_hostname = msp[6]
-                except:
-                    # Older versions of CloudMan did not pass this value so if the master
-                    # and the worker are running 2 diff versions (can happen after an
-                    # automatic update), don't crash here.
-                    self.local_hostname = self.public_ip
+                    self.protocol_version = max(self.protocol_version,
+                                                int(m.get('protocol_version', 0)))
+                except ValueError:
+                    pass
+                self._reindex()
                 log.debug("INSTANCE_ALIVE private_dns:%s public_dns:%s pone:%s type:%s ami:%s hostname: %s"
                     % (self.private_ip,
                        self.public_ip,
@@ -3154,28 +4016,16 @@ class Instance(object):
                     f.close()
             elif msg_type == "WORKER_H_CERT":
                 self.is_alive = True  # This is for the case that an existing worker is added to a new master.
-                self.app.manager.save_host_cert(msg.split(" | ")[1])
+                self.app.manager.save_host_cert(m.get('host_cert'))
                 log.debug("Worker '%s' host certificate received and appended to /root/.ssh/known_hosts"
                     % self.id)
                 try:
                     sge_svc = self.app.manager.get_services(
                         svc_role=ServiceRole.SGE)[0]
-                    if sge_svc.add_sge_host(self.get_id(), self.local_hostname):
-                        # Send a message to worker to start SGE
-                        self.send_start_sge()
-                        # If there are any bucket-based FSs, tell the worker to
-                        # add those
-                        fss = self.app.manager.get_services(
-                            svc_type=ServiceType.FILE_SYSTEM)
-                        for fs in fss:
-                            if len(fs.buckets) > 0:
-                                for b in fs.buckets:
-                                    self.send_add_s3fs(b.bucket_name, fs.svc_roles)
-                        log.info("Waiting on worker instance %s to configure itself..."
-                            % self.get_desc())
-                    else:
-                        log.error("Adding host to SGE did not go smoothly, "
-                            "not instructing worker to configure SGE daemon.")
+                    # Hosts are added to SGE in batches; the worker is
+                    # instructed to proceed once its batch has been processed
+                    sge_svc.queue_host_addition(self.get_id(), self.local_hostname,
+                                                callback=self._queue_sge_host_added)
                 except IndexError:
                     log.error(
                         "Could not get a handle on SGE service to add a host; host not added")
@@ -3183,12 +4033,11 @@ class Instance(object):
                 self.node_ready = True
                 self.worker_status = "Ready"
                 log.info("Instance %s ready" % self.get_desc())
-                msplit = msg.split(' | ')
                 try:
-                    self.num_cpus = int(msplit[2])
-                except:
+                    self.num_cpus = int(m.get('num_cpus'))
+                except (TypeError, ValueError):
                     log.debug(
-                        "Instance '%s' num CPUs is not int? '%s'" % (self.id, msplit[2]))
+                        "Instance '%s' num CPUs is not int? '%s'" % (self.id, m.get('num_cpus')))
                 log.debug("Instance '%s' reported as having '%s' CPUs." %
                           (self.id, self.num_cpus))
                 # Make sure the instace is tagged (this is also necessary to do
@@ -3204,20 +4053,24 @@ class Instance(object):
                 log.debug("update etc host through master")
                 self.app.manager.update_etc_host()
             elif msg_type == "NODE_STATUS":
-                msplit = msg.split(' | ')
-                self.nfs_data = msplit[1]
-                self.nfs_tools = msplit[2]  # Workers currently do not update this field
-                self.nfs_indices = msplit[3]
-                self.nfs_sge = msplit[4]
-                self.get_cert = msplit[5]
-                self.sge_started = msplit[6]
-                self.load = msplit[7]
-                self.worker_status = msplit[8]
-                self.nfs_tfs = msplit[9]
+                # Workers send only the fields that have changed since their
+                # previous status message
+                for field in protocol.NODE_STATUS_FIELDS:
+                    # (nfs_tools: workers currently do not update this field)
+                    if field in m.payload:
+                        setattr(self, field, m.payload[field])
+                # Workers send a status update or heartbeat in the shortest
+                # interval again after a status change
+                self.heartbeat_interval = protocol.HEARTBEAT_INTERVAL
+            elif msg_type == "HEARTBEAT":
+                try:
+                    self.heartbeat_interval = min(max(int(m.get('interval', 0)),
+                        protocol.HEARTBEAT_INTERVAL), protocol.MAX_HEARTBEAT_INTERVAL)
+                except (TypeError, ValueError):
+                    self.heartbeat_interval = protocol.HEARTBEAT_INTERVAL
             elif msg_type == 'NODE_SHUTTING_DOWN':
-                msplit = msg.split(' | ')
-                self.worker_status = msplit[1]
+                self.worker_status = m.get('worker_status')
             else:  # Catch-all condition
-                log.debug("Unknown Message: %s" % msg)
+                log.debug("Unknown Message: %s" % m)
         else:
             log.error("Epic Failure, squeue not available?")
@@ -0,0 +1,112 @@
+"""
+A compact, in-memory time-series store. Each metric keeps its most recent
+samples in a fixed-size buffer so memory use does not grow with uptime,
+and can be queried for rolling statistics (e.g., percentiles over the past
+few minutes) to smooth decisions that would be noisy if based on a single
+sample.
+"""
+import threading
+import time
+from collections import deque
+
+
+def percentile(values, pct):
+    """
+    Return the ``pct`` percentile (0-100) of ``values``, interpolating
+    linearly between the closest ranks, or ``None`` if ``values`` is empty.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * min(max(pct, 0), 100) / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def mean(values):
+    values = list(values)
+    if not values:
+        return None
+    return sum(values) / float(len(values))
+
+
+class MetricsStore(object):
+    """
+    Record named numeric metrics over time. Each metric keeps (at most) the
+    last ``size`` ``(timestamp, value)`` samples. Safe to use from multiple
+    threads.
+    """
+    def __init__(self, size=360):
+        self.size = size
+        self.series = {}  # metric name -> deque of (timestamp, value)
+        self.lock = threading.Lock()
+
+    def record(self, timestamp=None, **values):
+        """
+        Record a sample for each of the metrics given as keyword arguments
+        (e.g., ``record(queued_jobs=3, running_jobs=8)``) at ``timestamp``
+        (seconds since the epoch; now by default). ``None`` values are skipped.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            for name, value in values.iteritems():
+                if value is None:
+                    continue
+                if name not in self.series:
+                    self.series[name] = deque(maxlen=self.size)
+                self.series[name].append((timestamp, value))
+
+    def names(self):
+        with self.lock:
+            return sorted(self.series.keys())
+
+    def get_series(self, name, window=None, now=None):
+        """
+        Return the list of ``(timestamp, value)`` samples recorded for
+        metric ``name`` (oldest first), limited to the past ``window`` seconds
+        if ``window`` is provided.
+        """
+        with self.lock:
+            samples = list(self.series.get(name, []))
+        if window is not None:
+            since = (now or time.time()) - window
+            samples = [s for s in samples if s[0] >= since]
+        return samples
+
+    def values(self, name, window=None, now=None):
+        return [v for _, v in self.get_series(name, window, now)]
+
+    def latest(self, name):
+        with self.lock:
+            if name not in self.series:
+                return None
+            return self.series[name][-1][1]
+
+    def percentile(self, name, pct, window=None, now=None):
+        """
+        Return the ``pct`` percentile of metric ``name`` over the past
+        ``window`` seconds (all recorded samples by default), or ``None`` if
+        there are no samples.
+        """
+        return percentile(self.values(name, window, now), pct)
+
+    def mean(self, name, window=None, now=None):
+        return mean(self.values(name, window, now))
+
+    def summary(self, window=None, percentiles=(50, 90, 99)):
+        """
+        Return a dict with the latest value, mean and the requested
+        percentiles of each metric over the past ``window`` seconds.
+        """
+        now = time.time()
+        result = {}
+        for name in self.names():
+            values = self.values(name, window, now)
+            stats = {'latest': self.latest(name), 'mean': mean(values),
+                     'samples': len(values)}
+            for pct in percentiles:
+                stats['p%s' % pct] = percentile(values, pct)
+            result[name] = stats
+        return result
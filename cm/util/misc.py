@@ -843,13 +843,14 @@ def _if_not_installed(prog_name):
 
 def add_to_etc_hosts(hostname, ip_address):
     """
-    Add ``hostname`` and its ``ip_address`` to ``/etc/hosts``
+    Add ``hostname`` and its ``ip_address`` to ``/etc/hosts``, replacing any
+    existing line that lists ``hostname`` as one of its names.
     """
     try:
         etc_hosts = open('/etc/hosts', 'r')
         tmp = NamedTemporaryFile()
         for l in etc_hosts:
-            if not hostname in l:
+            if hostname not in l.split():
                 tmp.write(l)
         etc_hosts.close()
         # add a line for the new hostname
@@ -868,13 +869,19 @@ def add_to_etc_hosts(hostname, ip_address):
 
 def remove_from_etc_hosts(hostname):
     """
-    Remove ``hostname`` from ``/etc/hosts``
+    Remove ``hostname`` (a hostname or an IP address, or a list of them) from
+    ``/etc/hosts``, rewriting the file once.
     """
+    if isinstance(hostname, basestring):
+        hostname = [hostname]
+    hostnames = set(h for h in hostname if h)
+    if not hostnames:
+        return
     try:
         etc_hosts = open('/etc/hosts', 'r')
         tmp = NamedTemporaryFile()
         for l in etc_hosts:
-            if not hostname in l:
+            if not hostnames.intersection(l.split()):
                 tmp.write(l)
         etc_hosts.close()
 
@@ -908,6 +915,20 @@ class Sleeper(object):
         self.condition.release()
 
 
+def get_load_average():
+    """
+    Return the system load for the past 1, 5, and 15 minutes as a string in
+    the following format: "0.00 0.02 0.39". The value is read directly from
+    ``/proc/loadavg`` rather than by spawning a shell pipeline.
+    """
+    try:
+        with open('/proc/loadavg') as f:
+            return ' '.join(f.read().split()[:3])
+    except IOError, e:
+        log.debug("Could not read system load: {0}".format(e))
+        return "0.00 0.00 0.00"
+
+
 def nice_size(size):
     """
     Returns a readably formatted string with the size
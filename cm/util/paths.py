@@ -18,6 +18,7 @@ P_LN = "/bin/ln"
 C_PSQL_PORT = "5910"
 USER_DATA_FILE = "userData.yaml"
 SYSTEM_MESSAGES_FILE = '/mnt/cm/sysmsg.txt'
+INSTANCE_METADATA_FILE = '/mnt/cm/instance_metadata.json'
 LOGIN_SHELL_SCRIPT = "/etc/bash.bashrc"
 
 # Paths
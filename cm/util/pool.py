@@ -0,0 +1,123 @@
+"""
+A simple bounded pool of worker threads. Tasks submitted to the pool are run
+by at most ``size`` threads; the caller gets a ``PoolTask`` back that can be
+waited on with a timeout. Because Python threads cannot be killed, a task that
+does not complete within the time a caller is willing to wait keeps occupying
+its worker thread; callers should avoid resubmitting work whose previous task
+has not completed yet (see ``PoolTask.done``).
+"""
+import Queue
+import threading
+import time
+
+import logging
+log = logging.getLogger('cloudman')
+
+
+class PoolTask(object):
+    """
+    Handle to a function submitted to a ``ThreadPool``.
+    """
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait up to ``timeout`` seconds (forever if ``None``) for the task to
+        complete. Return ``True`` if the task has completed, ``False`` otherwise.
+        """
+        self._done.wait(timeout)
+        return self.done
+
+    def _run(self):
+        if self.started is None:
+            self.started = time.time()
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception, e:
+            log.exception("Error running pooled task {0}: {1}".format(self.func, e))
+            self.error = e
+        finally:
+            self.finished = time.time()
+
+
+class ThreadPool(object):
+    """
+    A fixed-size pool of daemon threads that run submitted tasks.
+    """
+    def __init__(self, size, name='pool'):
+        self.size = max(1, int(size))
+        self.name = name
+        self.tasks = Queue.Queue()
+        self.threads = []
+        self.busy = 0  # Number of threads running a task
+        self.lock = threading.Lock()
+        for i in range(self.size):
+            t = threading.Thread(target=self._work, name="{0}-{1}".format(name, i))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            with self.lock:
+                # A task is marked as started as the thread gets busy so that
+                # ``idle`` never counts a thread that has picked up a task
+                task.started = time.time()
+                self.busy += 1
+            try:
+                task._run()
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                # Only signal completion once the thread is free again so a
+                # caller that waited for the task sees the thread as idle
+                task._done.set()
+
+    @property
+    def idle(self):
+        """
+        The number of threads that are free to pick up a queued task.
+        """
+        with self.lock:
+            return self.size - self.busy
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue ``func`` to be called with the given arguments and return a
+        ``PoolTask`` handle for it.
+        """
+        task = PoolTask(func, args, kwargs)
+        self.tasks.put(task)
+        return task
+
+    def map(self, func, items, timeout=None):
+        """
+        Call ``func`` for each element of ``items`` using the pool and wait
+        (up to ``timeout`` seconds overall) for all the calls to complete.
+        Return the list of ``PoolTask`` objects, in the order of ``items``.
+        """
+        tasks = [self.submit(func, item) for item in items]
+        deadline = None if timeout is None else time.time() + timeout
+        for task in tasks:
+            task.wait(None if deadline is None else max(0, deadline - time.time()))
+        return tasks
+
+    def shutdown(self):
+        for t in self.threads:
+            self.tasks.put(None)
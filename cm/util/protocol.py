@@ -0,0 +1,226 @@
+"""
+Codec for the messages exchanged between the master and the workers.
+
+Messages are encoded as a compact JSON envelope::
+
+    {"v": 1, "type": "NODE_READY", "sender": "i-12345678", "seq": 7,
+     "payload": {"instance_id": "i-12345678", "num_cpus": 4}}
+
+Several messages can be combined into a single ``BATCH`` message whose
+payload holds a list of ``{"type": ..., "payload": ...}`` entries.
+
+The legacy, pipe-delimited format (e.g., ``'NODE_READY | i-12345678 | 4'``)
+is still accepted when decoding and can be produced when encoding so that
+a master and workers running different versions (as can happen after an
+automatic update) can still talk to each other. In the legacy format, payload
+fields are positional, in the order they are listed in ``MESSAGE_SCHEMAS``.
+"""
+import json
+import threading
+
+import logging
+log = logging.getLogger('cloudman')
+
+PROTOCOL_VERSION = 1
+LEGACY_VERSION = 0
+LEGACY_SEPARATOR = ' | '
+BATCH = 'BATCH'
+# Workers check for a status change this often (in seconds) and send a
+# NODE_STATUS message if it changed. When there is nothing new to report, a
+# (small) HEARTBEAT message is sent instead; the interval between heartbeats
+# doubles, up to MAX_HEARTBEAT_INTERVAL, for as long as the status does not
+# change and is reset after a NODE_STATUS message. Each HEARTBEAT carries the
+# interval until the worker's next message so the master knows how long a
+# worker can stay quiet before it needs checking on.
+HEARTBEAT_INTERVAL = 10
+MAX_HEARTBEAT_INTERVAL = 60
+
+# Fields of a NODE_STATUS message, in their legacy (positional) order. A
+# worker may send only the fields that changed since its previous message.
+NODE_STATUS_FIELDS = ['nfs_data', 'nfs_tools', 'nfs_indices', 'nfs_sge', 'get_cert',
+                      'sge_started', 'load', 'worker_status', 'nfs_tfs', 'cache']
+
+# Message type -> (required payload fields, optional payload fields)
+MESSAGE_SCHEMAS = {
+    # Worker -> master
+    'ALIVE': (['private_ip', 'public_ip', 'zone', 'type', 'ami'],
+              ['local_hostname', 'protocol_version']),
+    'GET_MOUNTPOINTS': ([], []),
+    'MOUNT_DONE': ([], []),
+    'WORKER_H_CERT': (['host_cert'], []),
+    'NODE_READY': (['instance_id', 'num_cpus'], []),
+    'NODE_STATUS': ([], NODE_STATUS_FIELDS),
+    'HEARTBEAT': ([], ['interval']),
+    'NODE_SHUTTING_DOWN': (['worker_status'], ['instance_id']),
+    # Master -> worker
+    'RESTART': (['master_ip'], []),
+    'MASTER_PUBKEY': (['public_key'], []),
+    'START_SGE': ([], []),
+    'MOUNT': (['mount_points'], []),
+    'STATUS_CHECK': ([], []),
+    'REBOOT': ([], []),
+    'ADDS3FS': (['bucket_name', 'svc_roles'], []),
+    'ALIVE_REQUEST': ([], []),
+    'SYNC_ETC_HOSTS': ([], ['hosts_file']),
+}
+
+# Fields whose legacy representation differs from the one in the payload:
+# (message type, field) -> (legacy string -> value, value -> legacy string)
+LEGACY_CONVERTERS = {
+    ('MOUNT', 'mount_points'): (lambda s: json.loads(s)['mount_points'],
+                                lambda v: json.dumps({'mount_points': v})),
+    ('NODE_STATUS', 'cache'): (json.loads, json.dumps),
+}
+
+
+class MessageError(Exception):
+    pass
+
+
+class Message(object):
+    """
+    A decoded message. ``version`` is the protocol version the message was
+    encoded with (``LEGACY_VERSION`` for pipe-delimited messages).
+    """
+    def __init__(self, msg_type, payload=None, sender=None, seq=None,
+                 version=PROTOCOL_VERSION):
+        self.type = msg_type
+        self.payload = payload or {}
+        self.sender = sender
+        self.seq = seq
+        self.version = version
+
+    def get(self, field, default=None):
+        return self.payload.get(field, default)
+
+    def __str__(self):
+        return "{0} {1}".format(self.type, self.payload)
+
+
+def _to_legacy_string(value):
+    """
+    Return ``value`` as a (byte) string; unicode values are UTF-8 encoded.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _legacy_fields(msg_type):
+    required, optional = MESSAGE_SCHEMAS[msg_type]
+    return required + optional
+
+
+def validate(msg_type, payload):
+    """
+    Check ``payload`` conforms to the schema of ``msg_type``, raising a
+    ``MessageError`` if it does not. Fields not listed in the schema are
+    allowed (e.g., added by a newer version of the sender).
+    """
+    if msg_type not in MESSAGE_SCHEMAS:
+        raise MessageError("Unknown message type '{0}'".format(msg_type))
+    if not isinstance(payload, dict):
+        raise MessageError("Payload of a {0} message is not a dict: {1}"
+                           .format(msg_type, payload))
+    missing = [f for f in MESSAGE_SCHEMAS[msg_type][0] if f not in payload]
+    if missing:
+        raise MessageError("{0} message is missing field(s) {1}".format(
+                           msg_type, ', '.join(missing)))
+
+
+def _decode_legacy(body, sender):
+    parts = [p.strip() for p in body.strip().split(LEGACY_SEPARATOR)]
+    msg_type = parts[0]
+    if msg_type not in MESSAGE_SCHEMAS:
+        raise MessageError("Unknown message type '{0}'".format(msg_type))
+    payload = {}
+    for field, value in zip(_legacy_fields(msg_type), parts[1:]):
+        converter = LEGACY_CONVERTERS.get((msg_type, field))
+        try:
+            payload[field] = converter[0](value) if converter else value
+        except (ValueError, KeyError), e:
+            raise MessageError("Bad value for field {0} of a {1} message: {2}"
+                               .format(field, msg_type, e))
+    validate(msg_type, payload)
+    return [Message(msg_type, payload, sender=sender, version=LEGACY_VERSION)]
+
+
+def decode(body, sender=None):
+    """
+    Decode a message ``body`` (in either the JSON or the legacy format) and
+    return a list of ``Message`` objects (a ``BATCH`` message is expanded
+    into the messages it contains). ``sender`` is used for legacy messages,
+    which do not carry the sender themselves.
+    Raise a ``MessageError`` if the message is malformed.
+    """
+    if not body.lstrip().startswith('{'):
+        return _decode_legacy(body, sender)
+    try:
+        envelope = json.loads(body)
+        version = int(envelope['v'])
+        msg_type = envelope['type']
+        sender = envelope.get('sender', sender)
+        seq = envelope.get('seq')
+        payload = envelope.get('payload', {})
+    except (ValueError, KeyError, TypeError), e:
+        raise MessageError("Malformed message envelope {0}: {1}".format(body, e))
+    if msg_type == BATCH:
+        messages = []
+        for entry in payload.get('messages', []):
+            try:
+                validate(entry['type'], entry.get('payload', {}))
+            except (KeyError, TypeError), e:
+                raise MessageError("Malformed batched message {0}: {1}".format(entry, e))
+            messages.append(Message(entry['type'], entry.get('payload', {}),
+                                    sender=sender, seq=seq, version=version))
+        return messages
+    validate(msg_type, payload)
+    return [Message(msg_type, payload, sender=sender, seq=seq, version=version)]
+
+
+class MessageCodec(object):
+    """
+    Encode messages sent by ``sender``, numbering them sequentially.
+    """
+    def __init__(self, sender):
+        self.sender = sender
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def _next_seq(self):
+        with self.lock:
+            self.seq += 1
+            return self.seq
+
+    def encode(self, msg_type, payload=None, legacy=False):
+        """
+        Encode a message of ``msg_type`` with ``payload`` (a dict) and return
+        the message body string. If ``legacy`` is set, encode the message in
+        the pipe-delimited format understood by older versions of CloudMan.
+        """
+        payload = payload or {}
+        validate(msg_type, payload)
+        if legacy:
+            parts = [msg_type]
+            for field in _legacy_fields(msg_type):
+                if field not in payload:
+                    break
+                converter = LEGACY_CONVERTERS.get((msg_type, field))
+                parts.append(converter[1](payload[field]) if converter
+                             else _to_legacy_string(payload[field]))
+            return LEGACY_SEPARATOR.join(parts)
+        return json.dumps({'v': PROTOCOL_VERSION, 'type': msg_type,
+                           'sender': self.sender, 'seq': self._next_seq(),
+                           'payload': payload}, separators=(',', ':'))
+
+    def encode_batch(self, messages):
+        """
+        Encode a list of ``(msg_type, payload)`` tuples as a single message.
+        """
+        entries = []
+        for msg_type, payload in messages:
+            validate(msg_type, payload or {})
+            entries.append({'type': msg_type, 'payload': payload or {}})
+        return json.dumps({'v': PROTOCOL_VERSION, 'type': BATCH,
+                           'sender': self.sender, 'seq': self._next_seq(),
+                           'payload': {'messages': entries}}, separators=(',', ':'))
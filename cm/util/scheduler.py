@@ -0,0 +1,147 @@
+"""
+A small event-driven scheduler. Events (e.g., an AMQP message arriving,
+a service changing state or a user action from the web UI) are posted onto a
+queue and handled as soon as they arrive while periodic checks run as
+independently timed jobs. Posting an event a job is bound to makes that job
+due right away so the loop reacts without waiting for the job's interval.
+"""
+import Queue
+import time
+
+from cm.util.bunch import Bunch
+
+import logging
+log = logging.getLogger('cloudman')
+
+
+class PeriodicJob(object):
+    """
+    A named function that is run every ``interval`` seconds. ``interval``
+    can be a number or a callable returning the number of seconds, which
+    allows a job to adjust its own frequency. ``min_interval`` limits how
+    often a job can be forced to run by events so a burst of events results
+    in a single run.
+    """
+    def __init__(self, name, func, interval, min_interval=1):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.min_interval = min_interval
+        self.last_run = None
+        self.next_run = time.time()
+
+    def get_interval(self):
+        if callable(self.interval):
+            return self.interval()
+        return self.interval
+
+    def is_due(self, now):
+        return now >= self.next_run
+
+    def run_soon(self):
+        """
+        Mark the job as due, respecting the job's ``min_interval``.
+        """
+        soonest = time.time()
+        if self.last_run is not None:
+            soonest = max(soonest, self.last_run + self.min_interval)
+        self.next_run = min(self.next_run, soonest)
+
+    def run(self):
+        self.last_run = time.time()
+        try:
+            self.func()
+        except Exception, e:
+            log.exception("Error running scheduled job '{0}': {1}".format(self.name, e))
+        finally:
+            self.next_run = time.time() + self.get_interval()
+
+
+class EventScheduler(object):
+    """
+    Run periodic jobs and dispatch events from a single thread.
+    Use ``post`` (from any thread) to queue an event; event handlers and jobs
+    are only ever invoked from the thread calling ``run_pending``.
+    """
+    STOP = '__stop__'
+
+    def __init__(self, max_wait=10):
+        self.events = Queue.Queue()
+        self.jobs = []
+        self.handlers = {}  # event name -> list of handler functions
+        self.job_triggers = {}  # event name -> list of PeriodicJob objects
+        # Upper bound on how long the scheduler blocks waiting for an event
+        self.max_wait = max_wait
+        self.running = True
+
+    def add_job(self, name, func, interval, events=None, min_interval=1):
+        """
+        Register ``func`` to be run every ``interval`` seconds and, in addition,
+        whenever any of the events listed in ``events`` is posted.
+        """
+        job = PeriodicJob(name, func, interval, min_interval)
+        self.jobs.append(job)
+        for event in events or []:
+            self.job_triggers.setdefault(event, []).append(job)
+        return job
+
+    def get_job(self, name):
+        for job in self.jobs:
+            if job.name == name:
+                return job
+        return None
+
+    def add_handler(self, event, func):
+        """
+        Register ``func`` to be called with the event object each time
+        ``event`` is posted.
+        """
+        self.handlers.setdefault(event, []).append(func)
+
+    def post(self, event, **data):
+        """
+        Queue ``event``; any keyword arguments are available to handlers as
+        attributes of the event object. Safe to call from any thread.
+        """
+        self.events.put(Bunch(name=event, data=Bunch(**data)))
+
+    def stop(self):
+        self.running = False
+        self.post(self.STOP)
+
+    def _time_to_next_job(self):
+        if not self.jobs:
+            return self.max_wait
+        wait = min(job.next_run for job in self.jobs) - time.time()
+        return max(0, min(wait, self.max_wait))
+
+    def _dispatch(self, event):
+        if event.name == self.STOP:
+            return
+        for job in self.job_triggers.get(event.name, []):
+            job.run_soon()
+        for handler in self.handlers.get(event.name, []):
+            try:
+                handler(event)
+            except Exception, e:
+                log.exception("Error handling event '{0}': {1}".format(event.name, e))
+
+    def run_pending(self):
+        """
+        Block until an event arrives or a job is due (whichever comes first),
+        dispatch all queued events and run all due jobs.
+        """
+        try:
+            timeout = self._time_to_next_job()
+            if timeout > 0:
+                self._dispatch(self.events.get(timeout=timeout))
+            # Drain any other events that have accumulated
+            while True:
+                self._dispatch(self.events.get_nowait())
+        except Queue.Empty:
+            pass
+        for job in self.jobs:
+            if not self.running:
+                break
+            if job.is_due(time.time()):
+                job.run()
@@ -0,0 +1,119 @@
+"""
+Waiting for cloud resources (e.g., volumes, snapshots) or local conditions to
+reach a desired state.
+
+Instead of polling at a fixed interval, a ``Waiter`` polls often at first and
+then backs off exponentially, up to a maximum interval, so short transitions
+are noticed quickly while long ones do not burn API requests. A random jitter
+is added to each delay so concurrent waiters do not poll in lockstep. A waiter
+has an (optional) deadline that can be handed down to nested waits via
+``child`` so the nested waits do not outlive the overall one.
+"""
+import random
+import time
+
+import logging
+log = logging.getLogger('cloudman')
+
+
+class Waiter(object):
+    """
+    Poll with exponential backoff until a condition is met or ``timeout``
+    seconds (never if ``None``) have passed. ``deadline`` (seconds since the
+    epoch) can be given instead of ``timeout``.
+    """
+    def __init__(self, timeout=None, initial_delay=1, max_delay=30, factor=2,
+                 jitter=0.2, deadline=None):
+        if deadline is None and timeout is not None:
+            deadline = time.time() + timeout
+        self.deadline = deadline
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+        self.sleep = time.sleep
+
+    def remaining(self):
+        """
+        Return the number of seconds left until the deadline (``None`` if
+        there is no deadline).
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.time())
+
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def child(self, timeout=None, **kwargs):
+        """
+        Return a new ``Waiter`` whose deadline is ``timeout`` seconds from now
+        but no later than this waiter's deadline.
+        """
+        deadline = self.deadline
+        if timeout is not None:
+            deadline = min(deadline or float('inf'), time.time() + timeout)
+        return Waiter(deadline=deadline, **kwargs)
+
+    def next_delay(self):
+        """
+        Return the number of seconds to wait before the next poll.
+        """
+        delay = min(self.max_delay, self.initial_delay * (self.factor ** self.attempts))
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        remaining = self.remaining()
+        if remaining is not None:
+            delay = min(delay, remaining)
+        return max(0, delay)
+
+    def pause(self):
+        """
+        Sleep until the next poll is due. Return ``False`` (without sleeping)
+        if the deadline has passed, ``True`` otherwise.
+        """
+        if self.expired():
+            return False
+        self.sleep(self.next_delay())
+        self.attempts += 1
+        return True
+
+    def wait(self, check, description=None):
+        """
+        Call ``check`` until it returns a true value or the deadline passes.
+        Return the last value returned by ``check``.
+        """
+        while True:
+            result = check()
+            if result or not self.pause():
+                if not result and description:
+                    log.debug("Timed out waiting for {0}".format(description))
+                return result
+            if description:
+                log.debug("Waiting for {0} (attempt {1})".format(description, self.attempts))
+
+    def wait_for_many(self, ids, describe, is_done, description=None):
+        """
+        Wait for all the resources with the given ``ids`` to reach a desired
+        state, polling them with a single call per tick: ``describe`` is
+        called with the list of IDs still being waited for and returns the
+        corresponding resource objects (with an ``id`` attribute); ``is_done``
+        is called for each of those objects.
+        Return a dict of ``id -> resource`` for the resources that reached
+        the desired state (all of them unless the deadline has passed).
+        """
+        pending = set(ids)
+        done = {}
+        while pending:
+            for resource in describe(list(pending)):
+                if resource.id in pending and is_done(resource):
+                    done[resource.id] = resource
+                    pending.discard(resource.id)
+            if not pending:
+                break
+            if not self.pause():
+                if description:
+                    log.debug("Timed out waiting for {0} ({1} of {2} done)".format(
+                              description, len(done), len(done) + len(pending)))
+                break
+        return done
@@ -5,6 +5,7 @@ import logging
 import os
 import os.path
 import pwd
+import Queue
 import subprocess
 import threading
 import datetime as dt
@@ -13,8 +14,9 @@ import json
 
 
 from cm.util.bunch import Bunch
-from cm.util import misc, comm, paths
+from cm.util import misc, comm, paths, protocol
 from cm.util.manager import BaseConsoleManager
+from cm.util.worker_cache import WorkerCache
 from cm.services import ServiceRole
 from cm.services.apps.pss import PSSService
 from cm.services.data.filesystem import Filesystem
@@ -99,7 +101,7 @@ class ConsoleManager(BaseConsoleManager):
         # Default to the most comprehensive type
         self.cluster_type = self.app.ud.get('cluster_type', 'Galaxy')
         self.mount_points = []  # A list of current mount points; each list element must have the
-                                # following structure: (label, local_path, type, server_path)
+                                # following structure: (label, local_path, type, server_path, mount_options)
         self.nfs_data = 0
         self.nfs_tools = 0
         self.nfs_indices = 0
@@ -108,9 +110,20 @@ class ConsoleManager(BaseConsoleManager):
         self.get_cert = 0
         self.sge_started = 0
         self.custom_hostname = None
+        # Local read cache for the file systems mounted from the master
+        self.local_cache = WorkerCache(self.app.config.worker_cache,
+                                       self.app.config.worker_cache_dir)
 
         self.load = 0
 
+    @property
+    def cache(self):
+        """
+        Status of the local cache of each file system mounted from the master
+        (reported to the master in NODE_STATUS messages).
+        """
+        return dict(self.local_cache.status)
+
     @property
     def local_hostname(self):
         """
@@ -163,6 +176,7 @@ class ConsoleManager(BaseConsoleManager):
             log.debug("Attempted to mount NFS, but TESTFLAG is set.")
             return
         mount_points = []
+        fs_roles = {}  # file system name -> roles (used to look up its cache config)
         try:
             # Try to load mount points from json dispatch
             try:
@@ -176,6 +190,7 @@ class ConsoleManager(BaseConsoleManager):
                     # updates
                     mount_points.append(
                         (mp['fs_name'], mp['shared_mount_path'], mp['fs_type'], mp['server'], mp.get('mount_options', None)))
+                    fs_roles[mp['fs_name']] = mp.get('roles', [])
             else:
                 raise Exception("Mount point parsing failure.")
         except Exception, e:
@@ -195,7 +210,14 @@ class ConsoleManager(BaseConsoleManager):
             do_mount = self.app.ud.get('mount_%s' % label, True)
             if not do_mount:
                 continue
+            roles = fs_roles.get(label, [])
+            # Only refresh the cache of a file system that was not mounted
+            # with the same definition before (MOUNT gets sent repeatedly)
+            refresh = (label, path, fs_type, server, mount_options) not in self.mount_points
+            mount_options = self.local_cache.get_mount_options(label, roles, fs_type, mount_options)
             ret_code = self.mount_disk(fs_type, server, path, mount_options)
+            if ret_code == 0:
+                self.local_cache.mounted(label, roles, path, mount_options, refresh=refresh)
             status = 1 if ret_code == 0 else -1
             # Provide a mapping between the mount point labels and the local fields
             # Given tools & data file systems have been merged, this mapping does
@@ -209,14 +231,14 @@ class ConsoleManager(BaseConsoleManager):
         # Filter out any differences between new and old mount points and unmount
         # the extra ones
         umount_points = [ump for ump in self.mount_points if ump not in mount_points]
-        for (_, old_path, _) in umount_points:
-            self._umount(old_path)
+        for ump in umount_points:
+            self._umount(ump[1])
         # Update the current list of mount points
         self.mount_points = mount_points
         # If the instance is not ``READY``, it means it's still being configured
         # so send a message to continue the handshake
         if self.worker_status != worker_states.READY:
-            self.console_monitor.conn.send("MOUNT_DONE")
+            self.console_monitor._send_msg('MOUNT_DONE')
 
     def unmount_filesystems(self):
         log.info("Unmounting directories: {0}".format(self.mount_points))
@@ -224,6 +246,7 @@ class ConsoleManager(BaseConsoleManager):
             self._umount(mp[1])
 
     def _umount(self, path):
+        self.local_cache.release(path)
         ret_code = subprocess.call("umount -lf '%s'" % path, shell=True)
         log.debug("Process unmounting '%s' returned code '%s'" % (path, ret_code))
 
@@ -344,6 +367,24 @@ class ConsoleMonitor(object):
         self.running = True
         # Helper for interruptible sleep
         self.sleeper = misc.Sleeper()
+        # Messages pushed to this worker by the AMQP consumer
+        self.inbox = Queue.Queue()
+        # Seconds between checks for a status change (see protocol.HEARTBEAT_INTERVAL)
+        self.status_frequency = protocol.HEARTBEAT_INTERVAL
+        self.last_status_time = None
+        # Only the fields that changed are included in a NODE_STATUS message;
+        # the complete status is (re)sent every full_status_frequency seconds
+        self.full_status_frequency = 300
+        self.last_full_status_time = None
+        self.last_status_sent = {}
+        # When there is nothing new to report, a HEARTBEAT is sent instead; the
+        # interval between heartbeats doubles (up to protocol.MAX_HEARTBEAT_INTERVAL)
+        # for as long as the status does not change
+        self.heartbeat_interval = self.status_frequency
+        self.last_msg_time = None
+        # Version of the message protocol the master speaks; use the legacy
+        # format until we receive a message in the current format from the master
+        self.master_protocol_version = protocol.LEGACY_VERSION
         self.conn = comm.CMWorkerComm(self.app.cloud_interface.get_instance_id(
         ), self.app.ud['master_ip'])
         if self.app.TESTFLAG is True:
@@ -387,72 +428,134 @@ class ConsoleMonitor(object):
                     log.debug("Initiated reboot...")
                 else:
                     log.debug("Problem initiating reboot!?")
-        # Compose the ALIVE message
-        msg = "ALIVE | %s | %s | %s | %s | %s | %s" % (self.app.cloud_interface.get_private_ip(),
-                                                       self.app.cloud_interface.get_public_ip(),
-                                                       self.app.cloud_interface.get_zone(
-                                                       ),
-                                                       self.app.cloud_interface.get_type(
-                                                       ),
-                                                       self.app.cloud_interface.get_ami(),
-                                                       self.app.manager.local_hostname)
-        self.conn.send(msg)
-        log.debug("Sending message '%s'" % msg)
+        # Compose the ALIVE message. This message is always sent in the legacy
+        # format (older masters ignore the trailing protocol version field) so
+        # the master learns which protocol version this worker speaks.
+        msg = {'private_ip': self.app.cloud_interface.get_private_ip(),
+               'public_ip': self.app.cloud_interface.get_public_ip(),
+               'zone': self.app.cloud_interface.get_zone(),
+               'type': self.app.cloud_interface.get_type(),
+               'ami': self.app.cloud_interface.get_ami(),
+               'local_hostname': self.app.manager.local_hostname,
+               'protocol_version': protocol.PROTOCOL_VERSION}
+        self.conn.send_message('ALIVE', msg, legacy=True)
+        log.debug("Sending message 'ALIVE' %s" % msg)
+
+    def _send_msg(self, msg_type, **payload):
+        """
+        Send a message to the master, encoded in the format the master understands.
+        """
+        self.conn.send_message(msg_type, payload,
+            legacy=self.master_protocol_version < protocol.PROTOCOL_VERSION)
 
     def send_worker_hostcert(self):
         host_cert = self.app.manager.get_host_cert()
         if host_cert is not None:
-            m_response = "WORKER_H_CERT | %s " % host_cert
-            log.debug("Composing worker host cert message: '%s'" % m_response)
-            self.conn.send(m_response)
+            log.debug("Composing worker host cert message: '%s'" % host_cert)
+            self._send_msg('WORKER_H_CERT', host_cert=host_cert)
         else:
             log.error("Sending HostCert failed, HC is None.")
 
     def send_node_ready(self):
         num_cpus = commands.getoutput(
             "cat /proc/cpuinfo | grep processor | wc -l")
-        msg_body = "NODE_READY | %s | %s" % (
-            self.app.cloud_interface.get_instance_id(), num_cpus)
-        log.debug("Sending message '%s'" % msg_body)
         log.info("Instance '%s' done configuring itself, sending NODE_READY." %
                  self.app.cloud_interface.get_instance_id())
-        self.conn.send(msg_body)
+        self._send_msg('NODE_READY', instance_id=self.app.cloud_interface.get_instance_id(),
+                       num_cpus=num_cpus)
 
     def send_node_shutting_down(self):
-        msg_body = "NODE_SHUTTING_DOWN | %s | %s" \
-            % (self.app.manager.worker_status, self.app.cloud_interface.get_instance_id())
-        log.debug("Sending message '%s'" % msg_body)
-        self.conn.send(msg_body)
+        log.debug("Sending message 'NODE_SHUTTING_DOWN'")
+        self._send_msg('NODE_SHUTTING_DOWN', worker_status=self.app.manager.worker_status,
+                       instance_id=self.app.cloud_interface.get_instance_id())
 
-    def send_node_status(self):
-        # Gett the system load in the following format:
+    def _load_changed(self, old, new, tolerance=0.1):
+        """
+        Check if the 1-minute load in ``new`` differs from the one in ``old``
+        by more than ``tolerance`` (small fluctuations are not worth reporting).
+        """
+        try:
+            return abs(float(old.split()[0]) - float(new.split()[0])) > tolerance
+        except (AttributeError, IndexError, ValueError):
+            return old != new
+
+    def send_node_status(self, full=False):
+        """
+        Send a NODE_STATUS message to the master, including only the fields
+        that changed since the previous message unless ``full`` is set (the
+        complete status is always sent to a master that speaks the legacy
+        protocol and periodically to all masters). Return ``True`` if a message
+        was sent, ``False`` if there was nothing new to report.
+        """
+        # Get the system load in the following format:
         # "0.00 0.02 0.39" for the past 1, 5, and 15 minutes, respectivley
-        self.app.manager.load = (
-            commands.getoutput("cat /proc/loadavg | cut -d' ' -f1-3")).strip()
-        msg_body = "NODE_STATUS | %s | %s | %s | %s | %s | %s | %s | %s | %s" \
-            % (self.app.manager.nfs_data,
-               self.app.manager.nfs_tools,
-               self.app.manager.nfs_indices,
-               self.app.manager.nfs_sge,
-               self.app.manager.get_cert,
-               self.app.manager.sge_started,
-               self.app.manager.load,
-               self.app.manager.worker_status,
-               self.app.manager.nfs_tfs)
-        # log.debug("Sending message '%s'" % msg_body)
-        self.conn.send(msg_body)
+        self.app.manager.load = misc.get_load_average()
+        status = dict((field, getattr(self.app.manager, field))
+                      for field in protocol.NODE_STATUS_FIELDS)
+        now = dt.datetime.utcnow()
+        if (full or self.master_protocol_version < protocol.PROTOCOL_VERSION or
+                self.last_full_status_time is None or
+                (now - self.last_full_status_time).seconds >= self.full_status_frequency):
+            changed = status
+            self.last_full_status_time = now
+        else:
+            changed = {}
+            for field, value in status.iteritems():
+                if field == 'load':
+                    if self._load_changed(self.last_status_sent.get(field), value):
+                        changed[field] = value
+                elif self.last_status_sent.get(field) != value:
+                    changed[field] = value
+        if not changed:
+            return False
+        self._send_msg('NODE_STATUS', **changed)
+        self.last_status_sent.update(changed)
+        self.last_msg_time = now
+        self.heartbeat_interval = self.status_frequency
+        return True
+
+    def send_heartbeat(self):
+        """
+        Let the master know this worker is alive if nothing has been sent to
+        it for the current heartbeat interval, then back off the interval.
+        The master is told the new interval so it knows when to expect the
+        next message.
+        """
+        now = dt.datetime.utcnow()
+        if (self.last_msg_time is not None and
+                (now - self.last_msg_time).seconds < self.heartbeat_interval):
+            return
+        self.heartbeat_interval = min(self.heartbeat_interval * 2,
+                                      protocol.MAX_HEARTBEAT_INTERVAL)
+        self._send_msg('HEARTBEAT', interval=self.heartbeat_interval)
+        self.last_msg_time = now
 
     def handle_message(self, message):
-        if message.startswith("RESTART"):
-            m_ip = message.split(' | ')[1]
+        """
+        Handle a message received from the master. ``message`` is the message
+        body, in either the current or the legacy format (see ``cm.util.protocol``).
+        """
+        try:
+            messages = protocol.decode(message, sender='master')
+        except protocol.MessageError, e:
+            log.debug("Unknown message '%s' (%s)" % (message, e))
+            return
+        for m in messages:
+            if m.version > self.master_protocol_version:
+                self.master_protocol_version = m.version
+            self._handle_message(m)
+
+    def _handle_message(self, m):
+        if m.type == "RESTART":
+            m_ip = m.get('master_ip')
             log.info("Master at %s requesting RESTART" % m_ip)
             self.app.ud['master_ip'] = m_ip
             self.app.manager.unmount_filesystems()
             self.app.manager.mount_nfs(self.app.ud['master_ip'])
             self.send_alive_message()
 
-        elif message.startswith("MASTER_PUBKEY"):
-            m_key = message.split(' | ')[1]
+        elif m.type == "MASTER_PUBKEY":
+            m_key = m.get('public_key')
             log.info(
                 "Got master public key (%s). Saving root's public key..." % m_key)
             self.app.manager.save_authorized_key(m_key)
@@ -461,7 +564,7 @@ class ConsoleMonitor(object):
                      worker_states.WAIT_FOR_SGE)
             self.app.manager.worker_status = worker_states.WAIT_FOR_SGE
             self.last_state_change_time = dt.datetime.utcnow()
-        elif message.startswith("START_SGE"):
+        elif m.type == "START_SGE":
             ret_code = self.app.manager.start_sge()
             if ret_code == 0:
                 log.info("SGE daemon started successfully.")
@@ -479,24 +582,24 @@ class ConsoleMonitor(object):
                 self.last_state_change_time = dt.datetime.utcnow()
             self.app.manager.start_condor(self.app.ud['master_public_ip'])
             self.app.manager.start_hadoop()
-        elif message.startswith("MOUNT"):
+        elif m.type == "MOUNT":
             # MOUNT everything in json blob.
             self.app.manager.mount_nfs(self.app.ud['master_ip'],
-                mount_json=message.split(' | ')[1])
-        elif message.startswith("STATUS_CHECK"):
-            self.send_node_status()
-        elif message.startswith("REBOOT"):
+                mount_json=json.dumps({'mount_points': m.get('mount_points')}))
+        elif m.type == "STATUS_CHECK":
+            self.send_node_status(full=True)
+        elif m.type == "REBOOT":
             log.info("Received reboot command")
             ret_code = subprocess.call("sudo telinit 6", shell=True)
-        elif message.startswith("ADDS3FS"):
-            bucket_name = message.split(' | ')[1]
-            svc_roles = message.split(' | ')[2]
+        elif m.type == "ADDS3FS":
+            bucket_name = m.get('bucket_name')
+            svc_roles = m.get('svc_roles')
             log.info("Adding s3fs file system from bucket {0}".format(bucket_name))
             fs = Filesystem(self.app, bucket_name, ServiceRole.from_string_array(svc_roles))
             fs.add_bucket(bucket_name)
             fs.add()
             log.debug("Worker done adding FS from bucket {0}".format(bucket_name))
-        # elif message.startswith("ADD_NFS_FS"):
+        # elif m.type == "ADD_NFS_FS":
         #     nfs_server_info = message.split(' | ')[1]
         #     # Try to load NFS server info from JSON message body
         #     try:
@@ -504,13 +607,13 @@ class ConsoleMonitor(object):
         #     except Exception, e:
         #         log.error("NFS server JSON load exception: %s" % e)
         #     self.app.manager.add_nfs_fs(nfs_server_info)
-        elif message.startswith('ALIVE_REQUEST'):
+        elif m.type == "ALIVE_REQUEST":
             self.send_alive_message()
-        elif message.startswith('SYNC_ETC_HOSTS'):
+        elif m.type == "SYNC_ETC_HOSTS":
             # <KWS> syncing etc host using the master one
             self.app.manager.sync_etc_host()
         else:
-            log.debug("Unknown message '%s'" % message)
+            log.debug("Unknown message '%s'" % m)
 
     def __monitor(self):
         self.app.manager.start()
@@ -532,29 +635,59 @@ class ConsoleMonitor(object):
                 #         log.info( "Stuck in state '%s' too long, reseting and trying again..." % self.app.manager.worker_status )
                 #         self.app.manager.worker_status = worker_states.INITIAL_STARTUP
                 #         self.last_state_change_time = dt.datetime.utcnow()
-                try:
-                    m = self.conn.recv()
-                except IOError, e:
-                    if self.app.cloud_type == 'opennebula':
-                        log.debug("Failed connecting to master: %s" % e)
-                        log.debug("Trying to reboot the system")
-                        subprocess.call('sudo telinit 6', shell=True)
-                    else:
-                        log.warning("IO trouble receiving msg: {0}".format(e))
-
-                while m is not None:
-                    self.handle_message(m.body)
-                    m = self.conn.recv()
-                # Regularly send a status update message
-                self.send_node_status()
+                # Have messages from the master pushed to us as they arrive
+                self.conn.start_consumer(self.inbox.put)
+                if not self.conn.is_consuming():
+                    m = None
+                    try:
+                        m = self.conn.recv()
+                    except IOError, e:
+                        if self.app.cloud_type == 'opennebula':
+                            log.debug("Failed connecting to master: %s" % e)
+                            log.debug("Trying to reboot the system")
+                            subprocess.call('sudo telinit 6', shell=True)
+                        else:
+                            log.warning("IO trouble receiving msg: {0}".format(e))
+
+                    while m is not None:
+                        self.handle_message(m.body)
+                        m = self.conn.recv()
+                # Regularly report any status change, or just that we're alive
+                if (self.last_status_time is None or
+                   (dt.datetime.utcnow() - self.last_status_time).seconds >= self.status_frequency):
+                    if not self.send_node_status():
+                        self.send_heartbeat()
+                    self.last_status_time = dt.datetime.utcnow()
             else:
                 self.running = False
                 log.error("Communication queue not available, terminating.")
-            self.sleeper.sleep(10)
+            if self.conn.is_consuming():
+                self.__handle_inbox(self.status_frequency -
+                    (dt.datetime.utcnow() - self.last_status_time).seconds)
+            else:
+                self.sleeper.sleep(self.status_frequency)
+
+    def __handle_inbox(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for a message to be pushed by the master
+        and then handle all the messages that have arrived.
+        """
+        try:
+            m = self.inbox.get(timeout=max(0, timeout))
+            while m is not None:
+                try:
+                    self.handle_message(m.body)
+                finally:
+                    self.conn.ack(m)
+                m = self.inbox.get_nowait()
+        except Queue.Empty:
+            pass
 
     def shutdown(self):
         """Attempts to gracefully shut down the worker thread"""
         log.info("Sending stop signal to worker thread")
         self.running = False
         self.sleeper.wake()
+        self.inbox.put(None)
+        self.conn.shutdown()
         log.info("Console manager stopped")
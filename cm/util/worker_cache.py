@@ -0,0 +1,172 @@
+"""
+A read cache, on a worker's instance-local (ephemeral) storage, for the file
+systems the worker mounts over NFS from the master (e.g., ``galaxyIndices``)
+so that repeated reads do not all go over the network to the master.
+
+The cache is configured per file system role (or name) with one of the
+following modes:
+
+``fscache``
+    The file system is mounted with the ``fsc`` option so the kernel's
+    FS-Cache, backed by ``cachefilesd``, transparently keeps the data read
+    from it on local storage.
+``rsync``
+    Selected directories (``paths``, relative to the file system's mount
+    point) are copied (pre-staged) to local storage once the file system is
+    mounted and the local copies are bind-mounted over the NFS-mounted ones.
+    The copies are not kept in sync with the originals: they only get
+    refreshed when the master sends a new or changed definition of the file
+    system to mount (a repeated MOUNT of an already mounted file system does
+    not restage it). Hence, this mode is only suitable for data that does not
+    change in place, such as reference genome indices.
+"""
+import os
+import threading
+
+from cm.util.misc import run
+
+import logging
+log = logging.getLogger('cloudman')
+
+CACHE_MODES = ['fscache', 'rsync']
+CACHEFILESD_CONF = '/etc/cachefilesd.conf'
+CACHEFILESD_CONF_TEMPLATE = """dir {cache_dir}
+tag cloudman
+brun 10%
+bcull 7%
+bstop 3%
+frun 10%
+fcull 7%
+fstop 3%
+"""
+
+
+class WorkerCache(object):
+    """
+    Keep track of (and report in ``status``) the cache of each of the file
+    systems mounted from the master. ``config`` is a dict of file system role
+    or name -> ``{'mode': <mode>, 'paths': [<dir>, ...]}``.
+    """
+    def __init__(self, config, cache_dir):
+        self.config = config or {}
+        self.cache_dir = cache_dir
+        self.status = {}  # file system name -> cache status
+        self.staged = {}  # mount point -> list of bind-mounted (staged) paths
+        self.staging = set()  # mount points whose directories are being staged
+        self.cachefilesd_started = False
+        self.lock = threading.Lock()
+
+    def get_config(self, fs_name, roles=None):
+        """
+        Return the cache configuration for file system ``fs_name`` with the
+        given ``roles``, or ``None`` if the file system is not to be cached.
+        """
+        for key in (roles or []) + [fs_name]:
+            conf = self.config.get(key)
+            if conf and conf.get('mode') in CACHE_MODES:
+                return conf
+        return None
+
+    def _start_cachefilesd(self):
+        if self.cachefilesd_started:
+            return True
+        fscache_dir = os.path.join(self.cache_dir, 'fscache')
+        try:
+            if not os.path.exists(fscache_dir):
+                os.makedirs(fscache_dir)
+            with open(CACHEFILESD_CONF, 'w') as f:
+                f.write(CACHEFILESD_CONF_TEMPLATE.format(cache_dir=fscache_dir))
+        except (IOError, OSError), e:
+            log.error("Error configuring cachefilesd: {0}".format(e))
+            return False
+        self.cachefilesd_started = bool(run(
+            '/etc/init.d/cachefilesd restart', "Error starting cachefilesd",
+            "Started cachefilesd with cache directory {0}".format(fscache_dir)))
+        return self.cachefilesd_started
+
+    def get_mount_options(self, fs_name, roles, fs_type, mount_options):
+        """
+        Return the options to mount file system ``fs_name`` with, adding the
+        ones needed by its cache (if any) to ``mount_options``.
+        """
+        conf = self.get_config(fs_name, roles)
+        if not conf or conf['mode'] != 'fscache' or fs_type != 'nfs':
+            return mount_options
+        if not self._start_cachefilesd():
+            self.status[fs_name] = 'error'
+            return mount_options
+        options = [o for o in (mount_options or '').split(',') if o]
+        if 'fsc' not in options:
+            options.append('fsc')
+        return ','.join(options)
+
+    def mounted(self, fs_name, roles, path, mount_options, refresh=False):
+        """
+        Note that file system ``fs_name`` is mounted at ``path`` (with
+        ``mount_options``) and, for the ``rsync`` mode, start pre-staging its
+        cached directories in a separate thread. A file system that was
+        already staged is only staged again (refreshing the local copies) if
+        ``refresh`` is set.
+        """
+        conf = self.get_config(fs_name, roles)
+        if not conf:
+            return
+        if conf['mode'] == 'fscache':
+            if 'fsc' in (mount_options or '').split(','):
+                self.status[fs_name] = 'fscache'
+        else:
+            with self.lock:
+                if path in self.staging:
+                    return  # Already being staged
+                if path in self.staged and not refresh:
+                    return  # Already staged
+                self.staging.add(path)
+            self.status[fs_name] = 'staging'
+            threading.Thread(target=self.stage, args=(fs_name, path, conf['paths'])).start()
+
+    def stage(self, fs_name, path, paths):
+        """
+        Copy the directories ``paths`` (relative to ``path``, where file
+        system ``fs_name`` is mounted) to local storage and bind-mount the
+        copies over the original directories. Local copies from a previous
+        staging are unmounted first so they get refreshed from the file system.
+        """
+        self.release(path)
+        staged = []
+        ok = True
+        try:
+            for rel_path in paths:
+                src = os.path.join(path, rel_path)
+                dst = os.path.join(self.cache_dir, fs_name, rel_path)
+                if not os.path.isdir(src):
+                    log.warning("Not caching {0}: it is not a directory".format(src))
+                    continue
+                if not os.path.exists(dst):
+                    os.makedirs(dst)
+                if (run('/usr/bin/rsync -a --delete {0}/ {1}/'.format(src, dst),
+                        "Error pre-staging {0}".format(src), "Pre-staged {0} to {1}".format(src, dst))
+                        and run('/bin/mount --bind {0} {1}'.format(dst, src),
+                                "Error mounting the local copy of {0}".format(src))):
+                    staged.append(src)
+                else:
+                    ok = False
+        except Exception, e:
+            log.error("Error pre-staging {0} for file system {1}: {2}".format(path, fs_name, e))
+            ok = False
+        finally:
+            with self.lock:
+                self.staged[path] = staged
+                self.staging.discard(path)
+        self.status[fs_name] = '{0} ({1}/{2} staged)'.format(
+            'rsync' if ok else 'error', len(staged), len(paths))
+
+    def release(self, path):
+        """
+        Unmount the local copies of the directories staged from the file
+        system mounted at ``path`` (so the file system itself can be
+        unmounted).
+        """
+        with self.lock:
+            staged = self.staged.pop(path, [])
+        for src in reversed(staged):
+            run('/bin/umount -l {0}'.format(src), "Error unmounting the local copy of {0}".format(src))
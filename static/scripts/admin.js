@@ -596,6 +596,11 @@ jQuery.fn.serializeObject = function() {
                     '<td><label for="new_vol_fs_name">File system name: </label></td>' +
                     '<td><input type="text" size="20" name="new_vol_fs_name" id="new_vol_fs_name"> ' +
                     '(no spaces, alphanumeric characters only)</td>' +
+                    '</tr><tr>' +
+                    '<td><label for="new_vol_stripes">Number of volumes: </label></td>' +
+                    '<td><input type="text" size="20" name="new_vol_stripes" id="new_vol_stripes" ' +
+                        'value="1"> (more than 1 stripes the file system over several volumes ' +
+                        'for higher throughput)</td>' +
                 '</tr></table>' +
             // NFS form details
             '</div><div id="add-nfs-form" class="add-fs-details-form-row">' +
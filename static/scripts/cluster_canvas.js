@@ -462,10 +462,14 @@ function refreshTip(){
             i_str += '<p>Min nodes: <a class="editable">' + as_min + '</a>'
             i_str += '<br/>Max nodes: <a class="editable">' + as_max + '</a>'
             i_str += '<br/><span id="adjust_autoscaling_link" style="text-decoration: underline; cursor:pointer;">Adjust limits?</span></p>'
+            i_str += '<p id="autoscaling_metrics"></p>'
         } else {
             i_str = '<br/><br/>Autoscaling is <span style="color: red;">off</span>. Turn <a id="toggle_autoscaling_link" style="text-decoration: underline; cursor: pointer;">on</a>?'
     	}
     	$('#cluster_view_tooltip').html(i_str);
+        if (use_autoscaling == true) {
+            showAutoscalingMetrics();
+        }
 
         start_instance_timer();
     	
@@ -486,6 +490,29 @@ function refreshTip(){
     }
 }
 
+// Show the rolling job statistics autoscaling bases its decisions on
+function showAutoscalingMetrics() {
+    $.getJSON('/cloud/root/autoscaling_metrics_json?window=300', function(metrics) {
+        var stat = function(name, key) {
+            return (metrics[name] && metrics[name][key] != null) ? metrics[name][key] : null;
+        };
+        var queued = stat('queued_jobs', 'p50');
+        var occupancy = stat('slot_occupancy', 'mean');
+        var wait = stat('wait_time', 'p90');
+        if (queued == null) {
+            return;
+        }
+        var m_str = 'Past 5 minutes:<br/>Queued jobs (median): ' + Math.round(queued);
+        if (occupancy != null) {
+            m_str += '<br/>Slots in use: ' + Math.round(occupancy * 100) + '%';
+        }
+        if (wait != null) {
+            m_str += '<br/>Queue wait (90th pct.): ' + Math.round(wait) + 's';
+        }
+        $('#autoscaling_metrics').html(m_str);
+    });
+}
+
 function terminateInstance(instanceid) {
         // root/remove_instance?instance_id=instanceid
         if (confirm("Terminate instance " + instanceid + "?")) {
@@ -115,6 +115,12 @@ vertical-align: top;
             <b>Idle</b>: <span id="status-idle">0</span>
             <b>Available</b>: <span id="status-available">0</span>
             <b>Requested</b>: <span id="status-total">0</span>
+            <b>Standby</b>: <span id="status-standby">0</span>
+        </td></tr>
+        <tr><td><h4>Job slots: </h4></td><td>
+            <b>Free</b>: <span id="slots-free">0</span>
+            <b>Used</b>: <span id="slots-used">0</span>
+            <b>Total</b>: <span id="slots-total">0</span>
         </td></tr>
         <tr><td><h4>Service status: </h4></td><td>
             Applications <div id="app-status" style="width:16px;display:inline-block" class="status_green">&nbsp;</div>
@@ -257,6 +263,22 @@ vertical-align: top;
                 <div class="form-row-input">
                     <input type="text" name="as_max" id="as_max" value="" size="10">
                 </div>
+                <label>Limits are expressed in:</label>
+                <div class="form-row-input">
+                    <select name="units" id="as_units">
+                        <option value="nodes" selected="selected">Nodes</option>
+                        <option value="slots">Job slots (CPUs)</option>
+                    </select>
+                </div>
+                <label>Scaling policy:</label>
+                <div class="form-row-input">
+                    <select name="policy" id="as_policy">
+                        <option value="" selected="selected">Default (as configured for the cluster)</option>
+                        <option value="threshold">Threshold: add a node at a time while jobs turn over slowly</option>
+                        <option value="queue">Queue: add nodes for all the queued job slots</option>
+                        <option value="forecast">Forecast: add nodes for the projected job slot demand</option>
+                    </select>
+                </div>
                 <label>Type of Nodes(s):</label>
                 <div id="instance_type" class="form-row-input">
                     ## Select available instance types based on cloud name
@@ -545,6 +567,10 @@ function update_ui(data){
         $('#status-idle').text( data.instance_status.idle );
         $('#status-available').text( data.instance_status.available );
         $('#status-total').text( data.instance_status.requested );
+        $('#status-standby').text( data.instance_status.standby );
+        $('#slots-free').text( data.slot_status.free );
+        $('#slots-used').text( data.slot_status.used );
+        $('#slots-total').text( data.slot_status.total );
         $('#du-total').text(data.disk_usage.total);
         $('#du-inc').text(data.disk_usage.total.slice(0,-1));
         $('#du-used').text(data.disk_usage.used);
@@ -1001,6 +1027,12 @@ $(document).ready(function() {
     $('#as_max').change(function(){
         autoscaling_min_bound.validations[0].params.maximum = $('#as_max').val();
     });
+    $('#as_units').change(function(){
+        // Limits expressed in job slots can be proportionally larger
+        var limit = $('#as_units').val() == 'slots' ? 999 : 19;
+        autoscaling_min_bound.validations[0].params.maximum = limit;
+        autoscaling_max_bound.validations[0].params.maximum = limit;
+    });
 
     // FIXME: Is there a better way of doing this check than repeating all the code from the preceeding validation?
     var autoscaling_min_bound_adj = new LiveValidation('as_min_adj', { validMessage: "OK", wait: 300 } );
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import mock
+
+from cm.services.autoscale import Autoscale
+from cm.services.autoscale import ForecastPolicy
+from cm.services.autoscale import QueueProportionalPolicy
+from cm.services.autoscale import ThresholdPolicy
+from cm.util.bunch import Bunch
+
+from test_utils import TestApp
+from test_utils import TestManager
+
+
+def _sample(t=0, idle=0, queued_jobs=0, queued_slots=0, running_slots=0,
+            free_slots=0, running_time_mean=0, slots_per_node=2):
+    return Bunch(time=t, idle=idle, queued_jobs=queued_jobs, queued_slots=queued_slots,
+                 running_slots=running_slots, free_slots=free_slots,
+                 running_time_mean=running_time_mean, slots_per_node=slots_per_node)
+
+
+def test_threshold_policy_adds_one_node():
+    policy = ThresholdPolicy()
+    assert policy.get_target_size(3, [_sample(queued_jobs=5, running_time_mean=120)]) == 4
+    assert policy.get_target_size(3, [_sample(idle=1, queued_jobs=5, running_time_mean=120)]) == 3
+    assert policy.get_target_size(3, [_sample(queued_jobs=5, running_time_mean=10)]) == 3
+
+
+def test_queue_policy_scales_to_queued_slots():
+    policy = QueueProportionalPolicy()
+    # 9 queued slots, 2 of them can start right away; 7 slots need 4 nodes
+    assert policy.get_target_size(2, [_sample(queued_slots=9, free_slots=2)]) == 6
+    assert policy.get_target_size(2, [_sample(queued_slots=1, free_slots=2)]) == 2
+
+
+def test_forecast_policy_follows_trend():
+    policy = ForecastPolicy(horizon=60, window=5)
+    # Demand grows by 1 slot every 10 seconds and the cluster is full
+    history = [_sample(t=10 * i, running_slots=4, queued_slots=i) for i in range(5)]
+    # 4 slots queued now; by the time new nodes are up, 10 slots will be
+    assert policy.get_target_size(2, history) == 7
+    # Not enough history yet; size for what is queued now
+    assert policy.get_target_size(2, history[-2:]) == 4
+
+
+def _instance(inst_id, to_boundary=3600, idle_for=0):
+    return Bunch(id=inst_id, idle_since=datetime.utcnow() - timedelta(seconds=idle_for),
+                 get_seconds_to_billing_boundary=lambda period: to_boundary)
+
+
+def _autoscale(ud, workers, idle):
+    app = TestApp(ud=ud)
+    app.manager = TestManager(worker_instances=workers)
+    app.manager.get_idle_instances = lambda: idle
+    return Autoscale(app, as_min=0, as_max=10)
+
+
+def test_hourly_scale_down_ranks_by_billing_boundary():
+    i1, i2, i3 = _instance('i-1', 100), _instance('i-2', 30), _instance('i-3', 1200)
+    autoscale = _autoscale({}, [i1, i2, i3], [i1, i2, i3])
+    assert autoscale.get_removable_instances() == [i2, i1]
+    assert autoscale.get_num_instances_to_remove() == 2
+    assert autoscale.get_removable_instances(all_idle=True) == [i2, i1, i3]
+
+
+def test_per_second_scale_down_after_cooldown():
+    i1, i2, i3 = _instance('i-1', idle_for=400), _instance('i-2', idle_for=10), \
+        _instance('i-3', idle_for=900)
+    autoscale = _autoscale({'billing_mode': 'per_second', 'idle_cooldown': 300},
+                           [i1, i2, i3], [i1, i2, i3])
+    assert autoscale.get_removable_instances() == [i3, i1]
+
+
+def test_slot_limits():
+    # With limits in slots, a 16 slot cluster is over a max of 12 slots...
+    i1, i2, i3 = _instance('i-1', 30), _instance('i-2', 60), _instance('i-3', 90)
+    i1.num_cpus, i2.num_cpus, i3.num_cpus = 8, 4, 4
+    autoscale = _autoscale({'autoscale_units': 'slots'}, [i1, i2, i3], [i1, i2, i3])
+    autoscale.as_max = 12
+    assert autoscale.get_cluster_size() == 16
+    assert autoscale.too_large()
+    # ...and removing the first (8 slot) instance would bring it under the min
+    autoscale.as_min = 10
+    assert autoscale.get_instances_to_remove() == [i2]
+    # Adding capacity is rounded to whole nodes that fit under the max
+    autoscale.as_min, autoscale.as_max = 20, 30
+    autoscale.get_target_size = lambda: 3
+    assert autoscale.get_num_instances_to_add() == 1
+
+
+def test_standby_instances_not_counted():
+    i1, i2 = _instance('i-1'), _instance('i-2')
+    i2.standby = True
+    autoscale = _autoscale({}, [i1, i2], [i1])
+    autoscale.app.manager.get_active_instances = lambda: [i for i in [i1, i2]
+                                                           if not getattr(i, 'standby', False)]
+    assert autoscale.get_cluster_size() == 1
+
+
+def test_sample_counts_only_schedulable_jobs():
+    i1 = _instance('i-1')
+    i1.num_cpus = 4
+    autoscale = _autoscale({}, [i1], [])
+    now = datetime.utcnow()
+    jobs = [Bunch(id=str(n), state=state, slots=2, time=now)
+            for n, state in enumerate(['r', 'qw', 'hqw', 'Eqw', 'hRwq'])]
+    hosts = [Bunch(state='', slots_total=4, slots_used=2)]
+    sge = mock.Mock(get_queue_snapshot=lambda: Bunch(jobs=jobs, hosts=hosts))
+    autoscale.app.manager.get_services = lambda svc_role=None: [sge]
+    sample = autoscale.record_sample()
+    # Held and error-state jobs will not run on new nodes
+    assert sample.queued_jobs == 1 and sample.queued_slots == 2
+    assert sample.running_jobs == 1 and sample.running_slots == 2
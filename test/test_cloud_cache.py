@@ -0,0 +1,61 @@
+import mock
+
+from cm.clouds import ResponseCache
+from cm.clouds.eucalyptus import EucaInterface
+
+from test_utils import TestApp
+
+
+def test_response_cache():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    cache = ResponseCache({'volumes': 60, 'snapshots': 0})
+    # Requests with the same arguments (regardless of dict order) share a response
+    assert cache.get('volumes', (None, {'a': 1, 'b': 2}), fetch) == 1
+    assert cache.get('volumes', (None, {'b': 2, 'a': 1}), fetch) == 1
+    assert cache.get('volumes', (['vol-1'], None), fetch) == 2
+    # A fresh response can be forced
+    assert cache.get('volumes', (['vol-1'], None), fetch, max_age=0) == 3
+    assert cache.get('volumes', (['vol-1'], None), fetch) == 3
+    # Caching can be turned off per resource type
+    assert cache.get('snapshots', None, fetch) == 4
+    assert cache.get('snapshots', None, fetch) == 5
+    cache.invalidate('volumes')
+    assert cache.get('volumes', (['vol-1'], None), fetch) == 6
+    stats = cache.stats()
+    assert stats['volumes'] == {'hits': 2, 'misses': 4, 'entries': 1}
+    assert stats['snapshots']['misses'] == 2
+
+
+def test_response_cache_prunes_expired_entries():
+    cache = ResponseCache({'volumes': 60, 'instances': 30})
+    with mock.patch('cm.clouds.time.time', return_value=1000):
+        cache.get('volumes', ['vol-1'], lambda: 1)
+        cache.get('instances', ['i-1'], lambda: 1)
+    with mock.patch('cm.clouds.time.time', return_value=1045):
+        cache.get('volumes', ['vol-2'], lambda: 2)
+    # The expired instances response was dropped on the next request
+    assert cache.stats()['instances']['entries'] == 0
+    assert cache.stats()['volumes']['entries'] == 2
+
+
+def test_euca_invalidate_cache():
+    with mock.patch.object(EucaInterface, 'set_configuration'):
+        euca = EucaInterface()
+    euca._instances, euca._volumes = {'': []}, {'': []}
+    euca.invalidate_cache('volumes')
+    assert euca._instances and not euca._volumes
+    euca.invalidate_cache()
+    assert not euca._instances
+
+
+def test_cloud_cache_ttls_config():
+    app = TestApp(ud={'cloud_cache_ttls': {'volumes': '20'}})
+    assert app.config.cloud_cache_ttls == {'volumes': 20}
+    # An empty setting in the user data leaves the defaults in place
+    app = TestApp(ud={'cloud_cache_ttls': None})
+    assert app.config.cloud_cache_ttls == {}
@@ -0,0 +1,115 @@
+import mock
+
+from cm.util import comm
+from cm.util.comm import AMQPConsumer
+
+
+def _consumer(callback=None, ack_batch_size=2):
+    consumer = AMQPConsumer('localhost:5672', 'guest', 'guest', 'comm', 'master',
+                            'master', callback or (lambda m: None),
+                            ack_batch_size=ack_batch_size)
+    consumer.conn = mock.Mock()
+    consumer.conn.transport._read_buffer = ''
+    consumer.conn.method_reader.queue.empty.return_value = True
+    consumer.channel = mock.Mock()
+    consumer.channel.method_queue = []
+    return consumer
+
+
+def _message(channel, tag):
+    msg = mock.Mock()
+    msg.delivery_info = {'channel': channel}
+    msg.delivery_tag = tag
+    return msg
+
+
+@mock.patch('cm.util.comm.amqp.Connection')
+def test_queue_not_auto_deleted(connection):
+    consumer = AMQPConsumer('localhost:5672', 'guest', 'guest', 'comm', 'master',
+                            'master', lambda m: None)
+    consumer._connect()
+    channel = connection.return_value.channel.return_value
+    kwargs = channel.queue_declare.call_args[1]
+    assert kwargs['auto_delete'] is False
+    assert kwargs['arguments'] == {'x-expires': comm.QUEUE_EXPIRES}
+    # The socket is left blocking (see test_wait_uses_select)
+    assert not connection.return_value.transport.sock.settimeout.called
+
+
+def test_redeclare_legacy_queue():
+    # A queue declared by an older version (with different arguments) exists
+    channel = mock.Mock()
+    channel.queue_declare.side_effect = comm.amqp.AMQPChannelException(
+        406, 'PRECONDITION_FAILED - inequivalent arg', (50, 10))
+    new_channel = channel.connection.channel.return_value
+    assert comm.declare_queue(channel, 'comm', 'master', 'master') is new_channel
+    new_channel.queue_declare.assert_called_once_with(
+        queue='master', durable=False, exclusive=False, auto_delete=True)
+    new_channel.queue_bind.assert_called_once_with(
+        exchange='comm', queue='master', routing_key='master')
+    # Other errors are not handled
+    channel.queue_declare.side_effect = comm.amqp.AMQPChannelException(
+        403, 'ACCESS_REFUSED', (50, 10))
+    try:
+        comm.declare_queue(channel, 'comm', 'master', 'master')
+        assert False, "Expected the error to be raised"
+    except comm.amqp.AMQPChannelException:
+        pass
+
+
+def test_ack_once_handled():
+    received = []
+    consumer = _consumer(received.append)
+    channel = consumer.channel
+    for tag in (1, 2, 3):
+        consumer._on_message(_message(channel, tag))
+    assert len(received) == 3
+    # Nothing is acknowledged until the messages have been handled
+    consumer._flush_acks(force=True)
+    assert not channel.basic_ack.called
+    consumer.ack(received[0])
+    consumer._flush_acks()
+    assert not channel.basic_ack.called  # Less than a batch
+    consumer.ack(received[1])
+    consumer._flush_acks()
+    channel.basic_ack.assert_called_once_with(2, multiple=True)
+    consumer.ack(received[2])
+    consumer._flush_acks(force=True)
+    channel.basic_ack.assert_called_with(3, multiple=True)
+
+
+def test_stale_acks_ignored():
+    consumer = _consumer()
+    old_channel = consumer.channel
+    msg = _message(old_channel, 7)
+    # The connection was re-established before the message was handled
+    consumer.channel = mock.Mock()
+    consumer.ack(msg)
+    consumer._flush_acks(force=True)
+    assert not consumer.channel.basic_ack.called
+    assert not old_channel.basic_ack.called
+
+
+def test_failed_callback_acked():
+    def callback(msg):
+        raise ValueError()
+    consumer = _consumer(callback, ack_batch_size=1)
+    consumer._on_message(_message(consumer.channel, 1))
+    consumer._flush_acks()
+    consumer.channel.basic_ack.assert_called_once_with(1, multiple=True)
+
+
+@mock.patch('cm.util.comm.select.select')
+def test_wait_uses_select(select):
+    consumer = _consumer()
+    select.return_value = ([], [], [])
+    assert consumer._wait(1) is False
+    assert not consumer.channel.wait.called
+    select.return_value = ([consumer.conn.transport.sock], [], [])
+    assert consumer._wait(1) is True
+    assert consumer.channel.wait.called
+    # Data amqplib has already read is dispatched without waiting on the socket
+    select.reset_mock()
+    consumer.conn.transport._read_buffer = '\x01'
+    assert consumer._wait(1) is True
+    assert not select.called
@@ -0,0 +1,89 @@
+import threading
+
+import mock
+
+from cm.clouds.ec2 import EC2Interface
+from cm.clouds.eucalyptus import EucaInterface
+from cm.util.bunch import Bunch
+
+
+class FleetTestInterface(EC2Interface):
+    """ EC2 interface whose launches are simulated: each instance type can
+    start at most ``capacity[type]`` instances."""
+
+    def __init__(self, capacity):
+        self.app = Bunch(TESTFLAG=False)
+        self.capacity = capacity
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def _compose_worker_user_data(self):
+        return {}
+
+    def get_zone(self):
+        return 'us-east-1a'
+
+    def _run_ondemand_instances(self, num, instance_type, spot_price, worker_ud, min_num=1,
+                                zone=None):
+        with self.lock:
+            self.requests.append((instance_type, num, zone))
+            started = min(num, self.capacity.get(instance_type, 0))
+            self.capacity[instance_type] = self.capacity.get(instance_type, 0) - started
+        return [Bunch(instance_type=instance_type)] * started
+
+
+def test_fleet_falls_back_to_other_types():
+    ci = FleetTestInterface({'c3.2xlarge': 0, 'm3.xlarge': 10})
+    started = ci.run_fleet(16, [('c3.2xlarge', 8), ('m3.xlarge', 4)])
+    assert started == 16
+    # Both types were requested in parallel in the first wave; the shortfall
+    # of the (unavailable) preferred type was then made up with the other type
+    assert sorted(ci.requests[:2]) == [('c3.2xlarge', 1, 'us-east-1a'),
+                                       ('m3.xlarge', 2, 'us-east-1a')]
+    assert ci.requests[2:] == [('m3.xlarge', 2, 'us-east-1a')]
+    assert ci.capacity['m3.xlarge'] == 6
+
+
+def test_fleet_gives_up_when_out_of_capacity():
+    ci = FleetTestInterface({'m3.xlarge': 1})
+    assert ci.run_fleet(16, [('c3.2xlarge', 8), ('m3.xlarge', 4)]) == 4
+
+
+class EucaFleetTestInterface(FleetTestInterface, EucaInterface):
+    """ Simulates Eucalyptus, which only ever starts ``min_num`` instances."""
+
+    def _run_ondemand_instances(self, num, instance_type, spot_price, worker_ud, min_num=1,
+                                zone=None):
+        return super(EucaFleetTestInterface, self)._run_ondemand_instances(
+            min_num, instance_type, spot_price, worker_ud, min_num=min_num, zone=zone)
+
+
+def test_euca_fleet_requests_all_instances():
+    ci = EucaFleetTestInterface({'m1.large': 10})
+    assert ci.run_fleet(16, [('m1.large', 4)]) == 16
+    assert ci.requests == [('m1.large', 4, 'us-east-1a')]
+
+
+def test_terminate_instances_batch():
+    ci = FleetTestInterface({})
+    conn = mock.Mock()
+    conn.get_all_instances.return_value = [
+        Bunch(instances=[Bunch(id='i-1', state='shutting-down'),
+                         Bunch(id='i-2', state='running')])]
+    ci.get_ec2_connection = lambda: conn
+    with mock.patch('cm.clouds.ec2.time.sleep'):
+        terminated = ci.terminate_instances_batch(
+            [('i-1', None), ('i-2', 'sir-2'), ('i-3', None)])
+    # A single request terminated all the instances; an instance that is no
+    # longer found is considered terminated
+    conn.terminate_instances.assert_called_once_with(['i-1', 'i-2', 'i-3'])
+    conn.cancel_spot_instance_requests.assert_called_once_with(['sir-2'])
+    assert terminated == {'i-1': True, 'i-2': False, 'i-3': True}
+
+
+def test_prime_metadata_with_testflag():
+    ci = FleetTestInterface({})
+    ci.app.TESTFLAG = True
+    ci.get_metadata = mock.Mock()
+    ci.prime_metadata()
+    assert not ci.get_metadata.called
@@ -0,0 +1,165 @@
+import mock
+
+from cm.services import ServiceRole
+from cm.services.data import volume_status
+from cm.services.data.filesystem import Filesystem
+from cm.services.data.volume import Volume
+from cm.util.bunch import Bunch
+
+from test_utils import TestApp
+
+
+def test_online_snapshot():
+    app = TestApp(cloud_type='ec2')
+    fs = Filesystem(app, 'galaxyTools', svc_roles=[ServiceRole.GALAXY_TOOLS],
+                    mount_point='/mnt/galaxyTools')
+    events = []
+
+    def volume(snap_id):
+        vol = mock.Mock(snapshot_status=None, from_snapshot_id=None, static=False)
+
+        def start_snapshot(description):
+            events.append('snapshot ' + snap_id)
+            return Bunch(id=snap_id, status='pending', progress='0%')
+        vol.start_snapshot = start_snapshot
+        return vol
+    fs.volumes = [volume('snap-1'), volume('snap-2')]
+
+    def run(cmd, *args):
+        events.append(cmd)
+        return True
+    with mock.patch('cm.services.data.filesystem.run', run):
+        snapshots = fs.start_snapshot('test')
+    assert [snap.id for _, snap in snapshots] == ['snap-1', 'snap-2']
+    assert events[:2] == ['/bin/sync', '/usr/sbin/xfs_freeze -f /mnt/galaxyTools']
+    assert sorted(events[2:4]) == ['snapshot snap-1', 'snapshot snap-2']
+    assert events[4:] == ['/usr/sbin/xfs_freeze -u /mnt/galaxyTools']
+    assert [vol.snapshot_status for vol in fs.volumes] == ['pending', 'pending']
+
+    fs.use_snapshots(['snap-1', 'snap-2'])
+    assert [vol.from_snapshot_id for vol in fs.volumes] == ['snap-1', 'snap-2']
+    assert fs.kind == 'snapshot'
+
+
+def test_striped():
+    app = TestApp()
+    fs = Filesystem(app, 'galaxyData', mount_point='/mnt/galaxyData')
+    fs.add_striped(size=100, num_volumes=4)
+    assert fs.kind == 'striped'
+    assert [vol.size for vol in fs.volumes] == [25] * 4
+    for vol, letter in zip(fs.volumes, 'fghi'):
+        vol.device = '/dev/xvd' + letter
+    fs.add_nfs_share = lambda mount_point: True
+    commands = []
+
+    def run(cmd, *args, **kwargs):
+        commands.append(cmd)
+        return not cmd.startswith('/sbin/pvs')  # No volume is part of a group yet
+    with mock.patch('cm.services.data.striped.run', run):
+        with mock.patch('os.path.exists', lambda path: True):
+            assert fs.striped.start()
+    devices = '/dev/xvdf /dev/xvdg /dev/xvdh /dev/xvdi'
+    assert commands[4:] == [
+        '/sbin/pvcreate ' + devices,
+        '/sbin/vgcreate cm_galaxyData ' + devices,
+        '/sbin/lvcreate -i 4 -I 256 -l 100%FREE -n data cm_galaxyData',
+        '/sbin/mkfs.xfs /dev/cm_galaxyData/data',
+        '/bin/mount /dev/cm_galaxyData/data /mnt/galaxyData']
+
+    # Volumes that are already part of the striped device get reassembled
+    commands[:] = []
+    with mock.patch('cm.services.data.striped.run', lambda cmd, *a, **kw: commands.append(cmd) or True):
+        with mock.patch('os.path.exists', lambda path: True):
+            assert fs.striped.start()
+    assert '/sbin/vgchange -ay cm_galaxyData' in commands
+    assert not [cmd for cmd in commands if 'create' in cmd or 'mkfs' in cmd]
+
+
+def test_expand_falls_back_to_offline():
+    app = TestApp()
+    app.cloud_interface = mock.Mock(supports_volume_resize=True)
+    fs = Filesystem(app, 'galaxyData', svc_roles=[ServiceRole.GALAXY_DATA],
+                    mount_point='/mnt/galaxyData')
+    vol = mock.Mock(size=10, volume_id='vol-1', status=volume_status.ATTACHED)
+    vol.resize.return_value = False  # e.g., the volume was modified recently
+    vol.create_snapshot.return_value = 'snap-1'
+    fs.volumes = [vol]
+    fs.grow = {'new_size': 20, 'snap_description': 'grow', 'delete_snap': False}
+    # The caller is told to expand the file system offline
+    assert fs.expand(online=True) is None
+    assert fs.grow is not None
+    fs._Filesystem__remove = mock.Mock()
+    fs.add = mock.Mock()
+    with mock.patch('cm.services.data.filesystem.run', return_value=True):
+        assert fs.expand()
+    # The volume got recreated, bigger, from a snapshot
+    assert vol.from_snapshot_id == 'snap-1' and vol.size == 20
+    fs.add.assert_called_once_with()
+
+
+def test_striped_snapshots():
+    app = TestApp()
+    fs = Filesystem(app, 'galaxyData', mount_point='/mnt/galaxyData')
+    with mock.patch.object(Volume, 'update'):
+        fs.add_striped(vol_ids=['vol-1', 'vol-2'], snap_ids=['snap-1', 'snap-2'], method='md')
+    assert [vol.from_snapshot_id for vol in fs.volumes] == ['snap-1', 'snap-2']
+    fs.use_snapshots(['snap-3', 'snap-4'])
+    assert [vol.from_snapshot_id for vol in fs.volumes] == ['snap-3', 'snap-4']
+    assert fs.kind == 'striped' and fs.striped.method == 'md'
+    # A file system recreated from the snapshots is striped the same way
+    fs = Filesystem(app, 'galaxyData', mount_point='/mnt/galaxyData')
+    with mock.patch.object(Volume, 'create'):
+        fs.add_striped(snap_ids=['snap-3', 'snap-4'], method='md')
+    assert [vol.from_snapshot_id for vol in fs.volumes] == ['snap-3', 'snap-4']
+    assert fs.kind == 'striped' and fs.striped.method == 'md'
+
+
+def test_striped_remove_without_detaching():
+    app = TestApp()
+    app.manager.services = []
+    fs = Filesystem(app, 'galaxyData', mount_point='/mnt/galaxyData')
+    fs.add_striped(size=100, num_volumes=2)
+    fs.volumes = [mock.Mock(), mock.Mock()]
+    fs.remove_nfs_share = lambda mount_point: True
+    commands = []
+    with mock.patch('cm.services.data.striped.run', lambda cmd, *a, **kw: commands.append(cmd) or True):
+        with mock.patch('os.path.ismount', lambda path: True):
+            fs._Filesystem__remove(remove_from_master=False, detach=False)
+    # The file system is unmounted but the striped device stays active
+    assert commands == ['/bin/umount /mnt/galaxyData']
+    for vol in fs.volumes:
+        vol.remove.assert_called_once_with('/mnt/galaxyData', delete_vols=False, detach=False)
+
+
+def test_expand_striped_with_new_stripes():
+    app = TestApp()
+    app.cloud_interface = mock.Mock(supports_volume_resize=False)
+    fs = Filesystem(app, 'galaxyData', svc_roles=[ServiceRole.GALAXY_DATA],
+                    mount_point='/mnt/galaxyData')
+    fs.add_striped(size=100, num_volumes=2)
+    for vol, letter in zip(fs.volumes, 'fg'):
+        vol.device = '/dev/xvd' + letter
+    fs.grow = {'new_size': 160, 'snap_description': 'grow', 'delete_snap': False}
+    fs.status = lambda: None
+
+    def add_volumes(vols):
+        for vol, letter in zip(vols, 'hi'):
+            vol.device = '/dev/xvd' + letter
+    fs._add_volumes = add_volumes
+    commands = []
+
+    def run(cmd, *args, **kwargs):
+        commands.append(cmd)
+        return True
+    with mock.patch.object(Volume, 'status', volume_status.ATTACHED):
+        with mock.patch('cm.services.data.striped.run', run):
+            with mock.patch('cm.services.data.filesystem.run', run):
+                assert fs.expand(online=True)
+    # Two 30GB stripes were added to the (still mounted) striped device
+    assert [vol.size for vol in fs.volumes] == [50, 50, 30, 30]
+    assert commands == [
+        '/sbin/pvcreate /dev/xvdh /dev/xvdi',
+        '/sbin/vgextend cm_galaxyData /dev/xvdh /dev/xvdi',
+        '/sbin/lvextend -i 2 -I 256 -l +100%FREE /dev/cm_galaxyData/data',
+        '/usr/sbin/xfs_growfs /mnt/galaxyData']
+    assert fs.grow is None
@@ -0,0 +1,317 @@
+import mock
+from boto.exception import EC2ResponseError
+
+from cm.services import ServiceRole, service_states
+from cm.util import instance_states, monitor_events, spot_states
+from cm.util.bunch import Bunch
+from cm.util.master import ConsoleManager, Instance, SpotRequestTracker
+
+from test_utils import TestApp, MockBotoInstance, instrument_time
+
+
+def _manager(ud={}):
+    """ Build a master ``ConsoleManager`` without touching the cloud."""
+    app = TestApp(ud=ud, cloud_type='dummy')
+    app.TESTFLAG = True  # Do not connect to AMQP
+    with mock.patch.object(ConsoleManager, '_load_snapshot_data', return_value=[]):
+        app.manager = ConsoleManager(app)
+    app.TESTFLAG = False
+    return app.manager
+
+
+def _instance(manager, inst_id, ip):
+    inst = Instance(manager.app, inst=MockBotoInstance(id=inst_id))
+    inst.private_ip = ip
+    manager.worker_instances.append(inst)
+    return inst
+
+
+def _sge(manager):
+    sge = mock.Mock(svc_roles=[ServiceRole.SGE], state=service_states.RUNNING)
+    sge.name = 'SGE'
+    manager.services.append(sge)
+    return sge
+
+
+def _warm_pool_manager(pool_size=2):
+    manager = _manager({'warm_pool_size': pool_size})
+    manager.app.cloud_interface = mock.Mock()
+    manager.toggle_master_as_exec_host = mock.Mock()
+    manager.console_monitor.post_event = mock.Mock()
+    return manager
+
+
+def test_remove_instances_batch():
+    manager = _manager()
+    sge = _sge(manager)
+    manager.app.cloud_interface = mock.Mock()
+    manager.app.cloud_interface.terminate_instances_batch.return_value = {
+        'i-1': True, 'i-2': False}
+    i1 = _instance(manager, 'i-1', '10.0.0.1')
+    i2 = _instance(manager, 'i-2', '10.0.0.2')
+    with mock.patch('cm.util.master.misc.remove_from_etc_hosts') as remove_from_etc_hosts:
+        manager.remove_instances_batch([i1, i2]).join()
+    # One job manager call, one /etc/hosts rewrite and one cloud request for
+    # all of the instances
+    sge.remove_sge_hosts.assert_called_once_with([('i-1', '10.0.0.1'), ('i-2', '10.0.0.2')])
+    remove_from_etc_hosts.assert_called_once_with(['10.0.0.1', '10.0.0.2'])
+    manager.app.cloud_interface.terminate_instances_batch.assert_called_once_with(
+        [('i-1', None), ('i-2', None)])
+    # Only the instance that got terminated is no longer tracked
+    assert list(manager.worker_instances) == [i2]
+    assert i2.worker_status == 'Stopping' and i2.terminate_attempt_count == 1
+
+
+def test_activate_standby_instances():
+    manager = _warm_pool_manager()
+    sge = _sge(manager)
+    booting = _instance(manager, 'i-1', None)
+    ready = _instance(manager, 'i-2', '10.0.0.2')
+    for inst in (booting, ready):
+        inst.standby = True
+    ready.node_ready = True
+    # Configured instances are put to use first
+    assert manager.activate_standby_instances(1) == [ready]
+    sge.set_hosts_enabled.assert_called_once_with(['10.0.0.2'])
+    assert manager.get_standby_instances() == [booting]
+    # The master stops running jobs once (activated) workers are available
+    manager.toggle_master_as_exec_host.assert_called_once_with()
+    manager.console_monitor.post_event.assert_called_once_with(monitor_events.WORKERS_CHANGED)
+
+
+def test_maintain_warm_pool():
+    manager = _warm_pool_manager(pool_size=2)
+    _sge(manager)
+
+    def run_instances(num, **kwargs):
+        return [_instance(manager, 'i-{0}'.format(n), None).inst for n in range(num)]
+    manager.app.cloud_interface.run_instances.side_effect = run_instances
+    manager.maintain_warm_pool()
+    assert len(manager.get_standby_instances()) == 2
+    assert manager.get_active_instances() == []
+    # Standby instances do not run jobs so the master remains an exec host
+    assert not manager.toggle_master_as_exec_host.called
+    manager.console_monitor.post_event.assert_called_once_with(monitor_events.WORKERS_CHANGED)
+
+
+def test_maintain_warm_pool_backs_off():
+    manager = _warm_pool_manager(pool_size=1)
+    _sge(manager)
+    run_instances = manager.app.cloud_interface.run_instances
+    run_instances.return_value = []
+    with instrument_time() as time:
+        manager.maintain_warm_pool()
+        # A failed launch does not wake the monitor (which would retry it)...
+        assert not manager.console_monitor.post_event.called
+        # ...and it is not retried until the backoff elapsed
+        manager.maintain_warm_pool()
+        assert run_instances.call_count == 1
+        time.set_offset(seconds=61)
+        manager.maintain_warm_pool()
+        assert run_instances.call_count == 2
+        # The wait doubles with each failed launch
+        time.set_offset(seconds=61 + 119)
+        manager.maintain_warm_pool()
+        assert run_instances.call_count == 2
+
+
+def test_add_capacity_uses_warm_pool_first():
+    manager = _warm_pool_manager()
+    _sge(manager)
+    standby = _instance(manager, 'i-1', '10.0.0.1')
+    standby.standby, standby.num_cpus = True, 4
+    with mock.patch('cm.util.master.threading.Thread') as thread:
+        manager.add_capacity(6, [('m3.xlarge', 4)])
+    assert manager.get_standby_instances() == []
+    # Only the slots the warm pool could not provide are launched
+    assert thread.call_args[1]['args'] == (2, [('m3.xlarge', 4)])
+    assert thread.call_args[1]['target'] == manager.app.cloud_interface.run_fleet
+
+
+def _cloud_instance(inst_id, state):
+    inst = MockBotoInstance(id=inst_id)
+    inst.state = state
+    return inst
+
+
+def _ec2_instance(manager, inst_id, ip):
+    inst = _instance(manager, inst_id, ip)
+    inst.public_ip = ip  # As reported by the instance (ALIVE message)
+    return inst
+
+
+def _ec2_manager():
+    manager = _manager()
+    manager.app.cloud_type = 'ec2'
+    manager.app.cloud_interface = mock.Mock()
+    return manager
+
+
+def test_refresh_worker_states():
+    manager = _ec2_manager()
+    i1 = _ec2_instance(manager, 'i-1', '10.0.0.1')
+    i2 = _ec2_instance(manager, 'i-2', '10.0.0.2')
+    gone = _ec2_instance(manager, 'i-3', '10.0.0.3')
+    get_all_instances = manager.app.cloud_interface.get_all_instances
+    get_all_instances.return_value = [
+        Bunch(instances=[_cloud_instance('i-1', instance_states.RUNNING)]),
+        Bunch(instances=[_cloud_instance('i-2', instance_states.PENDING)])]
+    manager.refresh_worker_states()
+    # A single request for all of the instances
+    get_all_instances.assert_called_once_with(instance_ids=['i-1', 'i-2', 'i-3'])
+    assert i1.m_state == instance_states.RUNNING
+    assert i2.m_state == instance_states.PENDING
+    assert i1.inst.id == 'i-1' and i2.inst.id == 'i-2'
+    # An instance missing from the response is gone
+    assert gone.m_state == instance_states.TERMINATED and gone.inst is None
+
+
+def test_refresh_worker_states_skips_unfilled_spot():
+    manager = _ec2_manager()
+    i1 = _ec2_instance(manager, 'i-1', '10.0.0.1')
+    spot = Instance(manager.app, spot_request_id='sir-1')
+    manager.worker_instances.append(spot)
+    get_all_instances = manager.app.cloud_interface.get_all_instances
+    get_all_instances.return_value = [
+        Bunch(instances=[_cloud_instance('i-1', instance_states.RUNNING)])]
+    manager.refresh_worker_states()
+    get_all_instances.assert_called_once_with(instance_ids=['i-1'])
+    assert i1.m_state == instance_states.RUNNING
+    # The spot request has no instance yet so it was not marked terminated
+    assert spot.m_state is None
+    # Nothing to request if no instance has an ID
+    get_all_instances.reset_mock()
+    manager.refresh_worker_states([spot])
+    assert not get_all_instances.called
+
+
+def test_refresh_worker_states_falls_back_to_single_requests():
+    manager = _ec2_manager()
+    i1 = _ec2_instance(manager, 'i-1', '10.0.0.1')
+    i2 = _ec2_instance(manager, 'i-2', '10.0.0.2')
+    get_all_instances = manager.app.cloud_interface.get_all_instances
+
+    def get_instances(instance_id=None, instance_ids=None, **kwargs):
+        if instance_ids:
+            # One of the IDs is no longer known to the cloud
+            raise EC2ResponseError(400, 'Bad Request')
+        if instance_id == 'i-1':
+            return [Bunch(instances=[_cloud_instance('i-1', instance_states.RUNNING)])]
+        return []
+    get_all_instances.side_effect = get_instances
+    manager.refresh_worker_states()
+    assert get_all_instances.call_count == 3
+    assert i1.m_state == instance_states.RUNNING
+    assert i2.m_state == instance_states.TERMINATED
+
+
+def test_refresh_worker_states_one_at_a_time():
+    # Clouds without support for requesting multiple instances at once
+    for cloud_type in ('opennebula', 'dummy'):
+        manager = _ec2_manager()
+        manager.app.cloud_type = cloud_type
+        insts = [_ec2_instance(manager, 'i-1', '10.0.0.1'), _ec2_instance(manager, 'i-2', '10.0.0.2')]
+        with mock.patch.object(Instance, 'get_m_state') as get_m_state:
+            manager.refresh_worker_states()
+        assert get_m_state.call_count == len(insts)
+        assert not manager.app.cloud_interface.get_all_instances.called
+
+
+def test_maintain_uses_refreshed_state():
+    manager = _ec2_manager()
+    inst = _ec2_instance(manager, 'i-1', '10.0.0.1')
+    inst.set_cloud_instance_object(None)
+    manager.app.cloud_interface.reset_mock()
+    inst.maintain(refresh=False)
+    # The terminated instance was removed without asking the cloud again
+    assert not manager.app.cloud_interface.get_all_instances.called
+    assert inst not in manager.worker_instances
+
+
+def _spot_manager():
+    manager = _ec2_manager()
+    manager.app.ud['cluster_name'] = 'test'
+    manager.master_exec_host = True
+    return manager
+
+
+def _spot_instance(manager, request_id):
+    inst = Instance(manager.app, spot_request_id=request_id)
+    manager.worker_instances.append(inst)
+    return inst
+
+
+def _spot_request(request_id, state, instance_id=None):
+    return Bunch(id=request_id, state=state, instance_id=instance_id)
+
+
+def test_spot_tracker_bulk_update():
+    manager = _spot_manager()
+    filled = _spot_instance(manager, 'sir-1')
+    canceled = _spot_instance(manager, 'sir-2')
+    pending = _spot_instance(manager, 'sir-3')
+    active = _spot_instance(manager, 'sir-4')
+    active.spot_state = spot_states.ACTIVE
+    ec2_conn = manager.app.cloud_interface.get_ec2_connection.return_value
+    ec2_conn.get_all_spot_instance_requests.return_value = [
+        _spot_request('sir-3', spot_states.OPEN),
+        _spot_request('sir-1', spot_states.ACTIVE, 'i-1'),
+        _spot_request('sir-2', spot_states.CANCELLED)]
+    manager.app.cloud_interface.get_all_instances.return_value = [
+        Bunch(instances=[_cloud_instance('i-1', instance_states.PENDING)])]
+    tracker = SpotRequestTracker(manager.app)
+    assert tracker.update() == 3
+    # A single request for all the outstanding (i.e., not yet filled) requests
+    assert ec2_conn.get_all_spot_instance_requests.call_count == 1
+    request_ids = ec2_conn.get_all_spot_instance_requests.call_args[1]['request_ids']
+    assert sorted(request_ids) == ['sir-1', 'sir-2', 'sir-3']
+    # Each state transition was applied to the respective instance
+    assert filled.spot_state == spot_states.ACTIVE and filled.id == 'i-1'
+    assert manager.worker_instances.get_by_id('i-1') is filled
+    assert manager.app.cloud_interface.add_tag.call_args[0][0].id == 'i-1'
+    assert canceled not in manager.worker_instances
+    assert pending.spot_state == spot_states.OPEN and pending.id is None
+    assert tracker.get_outstanding() == [pending]
+
+
+def test_spot_tracker_poll_interval():
+    manager = _spot_manager()
+    _spot_instance(manager, 'sir-1')
+    ec2_conn = manager.app.cloud_interface.get_ec2_connection.return_value
+    ec2_conn.get_all_spot_instance_requests.return_value = [
+        _spot_request('sir-1', spot_states.OPEN)]
+    tracker = SpotRequestTracker(manager.app, poll_interval=10)
+    with mock.patch('cm.util.master.time.time', return_value=1000):
+        assert tracker.update() == 1
+        # Not polled again within the poll interval...
+        assert tracker.update() == 0
+        # ...unless forced
+        assert tracker.update(force=True) == 1
+    with mock.patch('cm.util.master.time.time', return_value=1010):
+        assert tracker.update() == 1
+    assert ec2_conn.get_all_spot_instance_requests.call_count == 3
+
+
+def test_spot_tracker_lock():
+    manager = _spot_manager()
+    _spot_instance(manager, 'sir-1')
+    tracker = SpotRequestTracker(manager.app)
+    # Another thread is polling: do not wait for it
+    tracker.lock.acquire()
+    assert tracker.update(force=True) == 0
+    assert not manager.app.cloud_interface.get_ec2_connection.called
+    tracker.lock.release()
+
+
+def test_spot_tracker_error():
+    manager = _spot_manager()
+    inst = _spot_instance(manager, 'sir-1')
+    ec2_conn = manager.app.cloud_interface.get_ec2_connection.return_value
+    ec2_conn.get_all_spot_instance_requests.side_effect = EC2ResponseError(400, 'Bad Request')
+    tracker = SpotRequestTracker(manager.app)
+    assert tracker.update() == 0
+    assert inst.spot_state == spot_states.OPEN and inst in manager.worker_instances
+    # The lock was released
+    ec2_conn.get_all_spot_instance_requests.side_effect = None
+    ec2_conn.get_all_spot_instance_requests.return_value = []
+    assert tracker.update(force=True) == 1
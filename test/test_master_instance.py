@@ -1,8 +1,14 @@
 from unittest import TestCase
 
+import mock
+
 from cm.util.master import Instance
 from cm.util.master import TIME_IN_PAST
+from cm.util.master import WorkerInstanceList
 from cm.util import instance_states
+from cm.util import monitor_events
+from cm.util import protocol
+from cm.util.protocol import MessageCodec
 
 from test_utils import TestApp
 from test_utils import MockBotoInstance
@@ -40,6 +46,45 @@ class MasterInstanceTestCase(TestCase):
         assert self.instance.get_m_state() == instance_states.RUNNING
         assert self.instance.m_state == instance_states.RUNNING
 
+    def test_worker_instance_index(self):
+        instances = WorkerInstanceList()
+        instances.append(self.instance)
+        assert instances.get_by_id(DEFAULT_MOCK_BOTO_INSTANCE_ID) is self.instance
+        assert instances.get_by_ip('10.0.0.1') is None
+        # Attributes learned after the instance was added get indexed too
+        self.instance.private_ip = '10.0.0.1'
+        self.instance.local_hostname = 'ip-10-0-0-1.ec2.internal'
+        instances.reindex(self.instance)
+        assert instances.get_by_ip('10.0.0.1') is self.instance
+        assert instances.get_by_hostname('ip-10-0-0-1') is self.instance
+        assert instances.get_by_hostname('IP-10-0-0-1.ec2.internal') is self.instance
+        instances.remove(self.instance)
+        assert instances.get_by_id(DEFAULT_MOCK_BOTO_INSTANCE_ID) is None
+        assert instances.get_by_ip('10.0.0.1') is None
+
+    def test_sge_host_added_posts_event(self):
+        # Called from the SGE batching thread: nothing gets sent to the worker
+        # from there, the outcome is handed over to the monitor thread
+        monitor = mock.Mock()
+        self.app.manager.console_monitor = monitor
+        self.instance._queue_sge_host_added(True)
+        monitor.post_event.assert_called_once_with(
+            monitor_events.SGE_HOST_ADDED, instance=self.instance, success=True)
+        assert not monitor.conn.method_calls
+
+    def test_heartbeat_interval(self):
+        self.app.manager.console_monitor = mock.Mock()
+        codec = MessageCodec(self.instance.id)
+        assert self.instance.heartbeat_interval == protocol.HEARTBEAT_INTERVAL
+        self.instance.handle_message(codec.encode('HEARTBEAT', {'interval': 40}))
+        assert self.instance.heartbeat_interval == 40
+        # Bogus intervals are capped
+        self.instance.handle_message(codec.encode('HEARTBEAT', {'interval': 3600}))
+        assert self.instance.heartbeat_interval == protocol.MAX_HEARTBEAT_INTERVAL
+        # A status change resets the interval
+        self.instance.handle_message(codec.encode('NODE_STATUS', {'load': '1.00 0.50 0.20'}))
+        assert self.instance.heartbeat_interval == protocol.HEARTBEAT_INTERVAL
+
     def test_reboot(self):
         """
         Check reboot was called on boto instance, time_rebooted is
@@ -0,0 +1,64 @@
+from os.path import join
+from StringIO import StringIO
+
+from mock import patch
+
+from cm.clouds.metadata import InstanceMetadata
+from cm.clouds.metadata import METADATA_URL
+
+from test_utils import temp_dir
+
+
+class MockMetadataService(object):
+
+    def __init__(self, values):
+        self.values = values
+        self.requests = []
+
+    def urlopen(self, url):
+        key = url[len(METADATA_URL):]
+        self.requests.append(key)
+        response = StringIO(self.values.get(key, ''))
+        response.getcode = lambda: 200 if key in self.values else 404
+        return response
+
+
+def _load(cache_file, values):
+    service = MockMetadataService(values)
+    with patch('urllib.urlopen', service.urlopen):
+        metadata = InstanceMetadata(cache_file)
+        metadata.load()
+        return metadata, service
+
+
+def test_immutable_values_persisted():
+    values = {'instance-id': 'i-1', 'instance-type': 'm1.large',
+              'public-hostname': 'ec2-1.compute.amazonaws.com'}
+    with temp_dir() as d:
+        cache_file = join(d, 'metadata.json')
+        metadata, service = _load(cache_file, values)
+        assert metadata.get('instance-type') == 'm1.large'
+        assert 'instance-type' in service.requests
+        # A restart only validates the cache file and fetches mutable entries
+        metadata, service = _load(cache_file, values)
+        assert metadata.get('instance-type') == 'm1.large'
+        assert 'instance-type' not in service.requests
+        assert 'public-hostname' in service.requests
+        # A cache file left behind by another instance is ignored
+        values = dict(values, **{'instance-id': 'i-2', 'instance-type': 'c3.large'})
+        metadata, service = _load(cache_file, values)
+        assert metadata.get('instance-type') == 'c3.large'
+
+
+def test_private_address_not_persisted():
+    values = {'instance-id': 'i-1', 'local-ipv4': '10.0.0.1',
+              'local-hostname': 'ip-10-0-0-1.ec2.internal'}
+    with temp_dir() as d:
+        cache_file = join(d, 'metadata.json')
+        _load(cache_file, values)
+        # The instance was stopped and started again, keeping its ID
+        values = dict(values, **{'local-ipv4': '10.0.0.2',
+                                 'local-hostname': 'ip-10-0-0-2.ec2.internal'})
+        metadata, service = _load(cache_file, values)
+        assert metadata.get('local-ipv4') == '10.0.0.2'
+        assert metadata.get('local-hostname') == 'ip-10-0-0-2.ec2.internal'
@@ -0,0 +1,21 @@
+from cm.util.metrics import MetricsStore
+from cm.util.metrics import percentile
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([1, 2, 3, 4], 100) == 4
+
+
+def test_metrics_window():
+    store = MetricsStore(size=10)
+    for t in range(20):
+        store.record(timestamp=1000 + t, queued_jobs=t, wait_time=None)
+    assert store.names() == ['queued_jobs']
+    assert store.values('queued_jobs') == range(10, 20)
+    assert store.values('queued_jobs', window=2, now=1019) == [17, 18, 19]
+    assert store.percentile('queued_jobs', 50, window=2, now=1019) == 18
+    assert store.latest('queued_jobs') == 19
+    assert store.summary()['queued_jobs']['samples'] == 10
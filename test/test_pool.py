@@ -0,0 +1,101 @@
+import threading
+import time
+
+import mock
+
+from cm.services import ServiceRole
+from cm.util.master import ConsoleMonitor
+from cm.util.pool import ThreadPool
+
+from test_utils import TestApp
+
+
+def test_map():
+    pool = ThreadPool(2)
+    tasks = pool.map(lambda x: x * 2, [1, 2, 3])
+    assert [t.result for t in tasks] == [2, 4, 6]
+    assert all(t.started >= t.submitted for t in tasks)
+    assert pool.idle == 2
+    pool.shutdown()
+
+
+def test_idle():
+    pool = ThreadPool(1)
+    release = threading.Event()
+    first = pool.submit(release.wait)
+    second = pool.submit(lambda: None)
+    assert not first.wait(0.05)
+    # The only thread is busy so the second task stays queued
+    assert pool.idle == 0
+    assert first.started is not None and second.started is None
+    release.set()
+    assert second.wait(1)
+    pool.shutdown()
+
+
+def _service(name, status, svc_roles=[]):
+    svc = mock.Mock()
+    svc.name = name
+    svc.svc_roles = svc_roles
+    svc.get_full_name.return_value = name
+    svc.status.side_effect = status
+    return svc
+
+
+def _monitor(ud={}):
+    app = TestApp(ud=ud)
+    app.TESTFLAG = True
+    app.manager.get_services = lambda **kwargs: []
+    app.manager.services = []
+    return ConsoleMonitor(app)
+
+
+def test_check_services_timeouts():
+    monitor = _monitor({'service_status_workers': 1, 'service_status_timeout': 0.2,
+                        'service_status_timeouts': {'Slow': 0}})
+    release = threading.Event()
+    fast = _service('Fast', lambda: time.sleep(0.05))
+    slow = _service('Slow', release.wait)
+    # The slow check (submitted first) hogs the only thread; it times out at
+    # once, which frees the monitor from waiting on the fast check queued
+    # behind it
+    monitor.app.manager.services = [slow, fast]
+    start = time.time()
+    monitor._ConsoleMonitor__check_services()
+    assert time.time() - start < 0.2
+    assert monitor.status_checks[fast].started is None
+    # Once the thread is free, the fast check gets its own full timeout
+    # even though it was queued
+    release.set()
+    monitor.status_checks[slow].wait(1)
+    monitor._ConsoleMonitor__check_services()
+    assert monitor.status_checks[fast].done
+    monitor.shutdown()
+
+
+def test_check_services_skips_services_being_added():
+    monitor = _monitor()
+    svc = _service('Galaxy', lambda: None)
+    monitor.app.manager.services = [svc]
+    monitor.adding_services.add(svc)
+    monitor._ConsoleMonitor__check_services()
+    assert svc not in monitor.status_checks
+    monitor.shutdown()
+
+
+def test_check_services_autoscale_inline():
+    monitor = _monitor()
+    threads = {}
+
+    def status(name):
+        return lambda: threads.setdefault(name, threading.current_thread())
+    galaxy = _service('Galaxy', status('Galaxy'))
+    autoscale = _service('Autoscale', status('Autoscale'), [ServiceRole.AUTOSCALE])
+    monitor.app.manager.services = [autoscale, galaxy]
+    monitor._ConsoleMonitor__check_services()
+    # The autoscaler changes the cluster so it is checked on the monitor thread
+    assert threads['Autoscale'] is threading.current_thread()
+    assert autoscale not in monitor.status_checks
+    assert monitor.status_checks[galaxy].done
+    assert threads['Galaxy'] is not threading.current_thread()
+    monitor.shutdown()
@@ -0,0 +1,81 @@
+from cm.util import protocol
+from cm.util.protocol import MessageCodec, MessageError
+
+
+def test_roundtrip():
+    codec = MessageCodec('i-123')
+    body = codec.encode('NODE_READY', {'instance_id': 'i-123', 'num_cpus': 4})
+    [m] = protocol.decode(body)
+    assert m.type == 'NODE_READY'
+    assert m.sender == 'i-123'
+    assert m.seq == 1
+    assert m.version == protocol.PROTOCOL_VERSION
+    assert m.get('num_cpus') == 4
+
+
+def test_decode_legacy():
+    [m] = protocol.decode("ALIVE | 10.0.0.1 | 1.2.3.4 | us-east-1a | m1.large | ami-1",
+                          sender='i-123')
+    assert m.version == protocol.LEGACY_VERSION
+    assert m.sender == 'i-123'
+    assert m.get('private_ip') == '10.0.0.1'
+    assert m.get('ami') == 'ami-1'
+    assert m.get('local_hostname') is None
+
+
+def test_encode_legacy():
+    codec = MessageCodec('master')
+    mount_points = [{'fs_name': 'galaxy', 'server': '10.0.0.1'}]
+    body = codec.encode('MOUNT', {'mount_points': mount_points}, legacy=True)
+    assert body.startswith('MOUNT | {')
+    [m] = protocol.decode(body)
+    assert m.get('mount_points') == mount_points
+
+
+def test_batch():
+    codec = MessageCodec('master')
+    body = codec.encode_batch([('START_SGE', {}),
+                               ('ADDS3FS', {'bucket_name': 'b', 'svc_roles': 'galaxyData'})])
+    messages = protocol.decode(body)
+    assert [m.type for m in messages] == ['START_SGE', 'ADDS3FS']
+    assert messages[1].get('bucket_name') == 'b'
+
+
+def test_schema_checked():
+    for body in ['NO_SUCH_TYPE | 1',
+                 'NODE_READY | i-123',
+                 '{"v": 1, "type": "NODE_READY", "payload": {"num_cpus": 1}}',
+                 '{"v": 1, "type": "NODE_READY", "payload": ["i-123", 1]}',
+                 '{not json']:
+        try:
+            protocol.decode(body)
+            assert False, "Expected %s to be rejected" % body
+        except MessageError:
+            pass
+
+
+def test_partial_node_status():
+    codec = MessageCodec('i-123')
+    [m] = protocol.decode(codec.encode('NODE_STATUS', {'load': '0.50 0.20 0.10'}))
+    assert m.payload == {'load': '0.50 0.20 0.10'}
+    [m] = protocol.decode(codec.encode('HEARTBEAT'))
+    assert m.type == 'HEARTBEAT'
+    [m] = protocol.decode(codec.encode('HEARTBEAT', {'interval': 40}))
+    assert m.get('interval') == 40
+
+
+def test_legacy_node_status_cache():
+    codec = MessageCodec('i-123')
+    status = dict((field, '1') for field in protocol.NODE_STATUS_FIELDS)
+    status['cache'] = {'galaxyIndices': 'fscache'}
+    body = codec.encode('NODE_STATUS', status, legacy=True)
+    [m] = protocol.decode(body)
+    assert m.payload == status
+
+
+def test_encode_legacy_unicode():
+    codec = MessageCodec('i-123')
+    body = codec.encode('WORKER_H_CERT', {'host_cert': u'h\xf6st'}, legacy=True)
+    assert body == 'WORKER_H_CERT | h\xc3\xb6st'
+    [m] = protocol.decode(body)
+    assert m.get('host_cert').decode('utf-8') == u'h\xf6st'
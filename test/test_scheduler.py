@@ -0,0 +1,38 @@
+from cm.util.scheduler import EventScheduler
+
+
+def test_event_triggers_bound_job():
+    runs = []
+    scheduler = EventScheduler(max_wait=0)
+    job = scheduler.add_job('job', lambda: runs.append(1), 600, events=['poke'], min_interval=0)
+    scheduler.run_pending()
+    assert len(runs) == 1
+    # Not due again for a long time...
+    scheduler.run_pending()
+    assert len(runs) == 1
+    # ...unless an event it is bound to arrives; a burst results in one run
+    scheduler.post('poke')
+    scheduler.post('poke')
+    scheduler.run_pending()
+    assert len(runs) == 2
+    assert job.next_run > job.last_run
+
+
+def test_handlers_receive_event_data():
+    received = []
+    scheduler = EventScheduler(max_wait=0)
+    scheduler.add_handler('msg', lambda event: received.append(event.data.body))
+    scheduler.post('msg', body='hello')
+    scheduler.post('other', body='ignored')
+    scheduler.run_pending()
+    assert received == ['hello']
+
+
+def test_failing_job_is_rescheduled():
+    def fail():
+        raise Exception("boom")
+    scheduler = EventScheduler(max_wait=0)
+    job = scheduler.add_job('failing', fail, 600)
+    scheduler.run_pending()
+    assert job.last_run is not None
+    assert not job.is_due(job.last_run + 1)
@@ -0,0 +1,143 @@
+import threading
+
+import mock
+
+from cm.services.apps.sge import SGEService, parse_qstat_xml
+from test_utils import TestApp
+
+QSTAT_XML = """<?xml version='1.0'?>
+<job_info  xmlns:xsd="http://gridengine.sunsource.net/source/browse/*checkout*/gridengine/source/dist/util/resources/schemas/qstat/qstat.xsd?revision=1.11">
+  <queue_info>
+    <Queue-List>
+      <name>all.q@ip-10-0-0-1.ec2.internal</name>
+      <qtype>BIP</qtype>
+      <slots_used>1</slots_used>
+      <slots_resv>0</slots_resv>
+      <slots_total>2</slots_total>
+      <load_avg>0.50000</load_avg>
+      <arch>lx24-amd64</arch>
+      <job_list state="running">
+        <JB_job_number>12</JB_job_number>
+        <JAT_prio>0.55500</JAT_prio>
+        <JB_name>g12_bowtie</JB_name>
+        <JB_owner>galaxy</JB_owner>
+        <state>r</state>
+        <JAT_start_time>2013-05-09T13:55:11</JAT_start_time>
+        <slots>1</slots>
+      </job_list>
+    </Queue-List>
+    <Queue-List>
+      <name>all.q@ip-10-0-0-2.ec2.internal</name>
+      <qtype>BIP</qtype>
+      <slots_used>0</slots_used>
+      <slots_resv>0</slots_resv>
+      <slots_total>2</slots_total>
+      <load_avg>0.01000</load_avg>
+      <arch>lx24-amd64</arch>
+      <state>d</state>
+    </Queue-List>
+  </queue_info>
+  <job_info>
+    <job_list state="pending">
+      <JB_job_number>13</JB_job_number>
+      <JAT_prio>0.00000</JAT_prio>
+      <JB_name>g13_bwa</JB_name>
+      <JB_owner>galaxy</JB_owner>
+      <state>qw</state>
+      <JB_submission_time>2013-05-09T13:56:02</JB_submission_time>
+      <slots>4</slots>
+    </job_list>
+  </job_info>
+</job_info>
+"""
+
+
+def test_parse_qstat_xml():
+    state = parse_qstat_xml(QSTAT_XML)
+    assert [h.hostname for h in state.hosts] == ['ip-10-0-0-1.ec2.internal',
+                                                 'ip-10-0-0-2.ec2.internal']
+    assert state.hosts[0].queue == 'all.q'
+    assert state.hosts[0].slots_used == 1
+    assert state.hosts[1].slots_total == 2
+    assert state.hosts[1].state == 'd'
+    running, pending = state.jobs
+    assert running.state == 'r'
+    assert running.hostname == 'ip-10-0-0-1.ec2.internal'
+    assert running.time.minute == 55
+    assert pending.state == 'qw'
+    assert pending.slots == 4
+    assert pending.hostname is None
+
+
+def test_queue_host_addition():
+    sge = SGEService(TestApp())
+    sge.host_batch_window = 0.01
+    batches = []
+    sge.add_sge_hosts = lambda hosts: batches.append(hosts) or dict((ip, True) for _, ip in hosts)
+    results = {}
+    done = threading.Event()
+
+    def callback(inst_id):
+        def cb(success):
+            results[inst_id] = success
+            if len(results) == 2:
+                done.set()
+        return cb
+    sge.queue_host_addition('i-1', '10.0.0.1', callback('i-1'))
+    sge.queue_host_addition('i-2', '10.0.0.2', callback('i-2'))
+    done.wait(5)
+    # Both hosts were added in a single batch, once the batching window elapsed
+    assert batches == [[('i-1', '10.0.0.1'), ('i-2', '10.0.0.2')]]
+    assert results == {'i-1': True, 'i-2': True}
+    assert sge.pending_hosts == [] and sge.pending_hosts_timer is None
+
+
+def test_add_exec_hosts_matches_whole_names():
+    sge = SGEService(TestApp())
+    sge.write_allhosts_file = mock.Mock()
+    exec_hosts = ['10.0.0.12\n', '10.0.0.12\n10.0.0.1\n']
+    sge._get_exec_hosts = lambda: exec_hosts.pop(0)
+    with mock.patch('cm.services.apps.sge.subprocess.Popen') as popen, \
+            mock.patch('cm.services.apps.sge.misc.run', return_value=True), \
+            mock.patch('cm.services.apps.sge.os.chown'), \
+            mock.patch('cm.services.apps.sge.os.path.exists', return_value=True), \
+            mock.patch('cm.services.apps.sge.pwd.getpwnam', return_value=[0, 0, 0]), \
+            mock.patch('cm.services.apps.sge.grp.getgrnam', return_value=[0, 0, 0]), \
+            mock.patch('__builtin__.open', mock.mock_open(), create=True):
+        popen.return_value.communicate.return_value = ('hostlist 10.0.0.12', '')
+        popen.return_value.returncode = 0
+        added = sge.add_sge_hosts([('i-1', '10.0.0.1')])
+    assert added == {'10.0.0.1': True}
+    # 10.0.0.1 was added even though 10.0.0.12 already was an execution host...
+    assert '-Ae' in popen.call_args_list[1][0][0]
+    # ...and to @allhosts
+    sge.write_allhosts_file.assert_called_once_with(filename=mock.ANY, to_add=['10.0.0.1'])
+
+
+def test_get_idle_hosts():
+    sge = SGEService(TestApp())
+    hosts = [mock.Mock(hostname='ip-10-0-0-1', queue='all.q', slots_used=0),
+             mock.Mock(hostname='ip-10-0-0-1', queue='galaxy.q', slots_used=1),
+             mock.Mock(hostname='ip-10-0-0-2', queue='all.q', slots_used=0),
+             mock.Mock(hostname='ip-10-0-0-2', queue='galaxy.q', slots_used=0)]
+    sge.get_queue_snapshot = lambda: mock.Mock(hosts=hosts)
+    # A host busy in any of its queues is not idle; idle hosts are listed once
+    assert sge.get_idle_hosts() == ['ip-10-0-0-2']
+
+
+def test_remove_sge_hosts():
+    sge = SGEService(TestApp())
+    sge.write_allhosts_file = mock.Mock()
+    # 10.0.0.1 is no longer an execution host even though 10.0.0.12 still is
+    sge._get_exec_hosts = lambda: '10.0.0.12\n10.0.0.2\n'
+    with mock.patch('cm.services.apps.sge.subprocess.Popen') as popen, \
+            mock.patch('cm.services.apps.sge.misc.run', return_value=True) as run:
+        popen.return_value.communicate.return_value = ('', '')
+        removed = sge.remove_sge_hosts([('i-1', '10.0.0.1'), ('i-2', '10.0.0.2')])
+    assert removed == {'10.0.0.1': True, '10.0.0.2': False}
+    # The hosts were drained, removed from @allhosts and via qconf in one go
+    assert run.call_count == 1
+    sge.write_allhosts_file.assert_called_once_with(
+        filename=mock.ANY, to_remove=['10.0.0.1', '10.0.0.2'])
+    assert popen.call_count == 1
+    assert '-de 10.0.0.1,10.0.0.2' in popen.call_args[0][0]
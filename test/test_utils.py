@@ -14,6 +14,7 @@ from mock import patch
 TEST_INDICES_DIR = "/mnt/indicesTest"
 TEST_DATA_DIR = "/mnt/dataTest"
 TEST_TOOLS_DIR = "/mnt/toolsTest"
+TEST_SGE_ROOT = "/opt/sgeTest"
 
 
 class TestApp(object):
@@ -41,7 +42,7 @@ class TestCloudInterface(object):
     def set_mock_instances(self, instances=[]):
         self.instances = instances
 
-    def get_all_instances(self, id):
+    def get_all_instances(self, id, **kwargs):
         return [Bunch(instances=self.instances)]
 
     def expect_terminatation(self, instance_id, spot_request_id=None, success=True):
@@ -74,6 +75,7 @@ class TestPathResolver(object):
         self.galaxy_data = TEST_DATA_DIR
         self.galaxy_tools = TEST_TOOLS_DIR
         self.galaxy_indices = TEST_INDICES_DIR
+        self.sge_root = TEST_SGE_ROOT
 
     @property
     def galaxy_home(self):
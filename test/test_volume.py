@@ -0,0 +1,58 @@
+import mock
+
+from cm.services.data import volume_status
+from cm.services.data.volume import Volume
+
+
+def _volume(attempts):
+    fs = mock.Mock()
+    fs.app.ud = {'cloud_type': 'ec2'}
+    vol = Volume(fs)
+    vol._get_device_list = lambda: frozenset(['/dev/xvda', '/dev/xvdb'])
+
+    def do_attach(device):
+        attempts.append(device)
+        return False
+    vol._do_attach = do_attach
+    return vol
+
+
+@mock.patch.object(Volume, 'status', new_callable=mock.PropertyMock,
+                   return_value=volume_status.AVAILABLE)
+def test_concurrent_attach_devices(status):
+    attempts = []
+    first, second = _volume(attempts), _volume(attempts)
+    first_attach = first._do_attach
+
+    def do_attach(device):
+        # The second volume is attached while the first one holds its device
+        second.attach()
+        return first_attach(device)
+    first._do_attach = do_attach
+    first.attach()
+    assert attempts == ['/dev/sdg', '/dev/sdf']
+    # Reservations are released once the attachments are over
+    attempts[:] = []
+    second.attach()
+    assert attempts == ['/dev/sdf']
+
+
+def test_resize():
+    attempts = []
+    vol = _volume(attempts)
+    vol.size = 10
+    vol.volume = mock.Mock(id='vol-1')
+    vol.device = '/dev/xvdf'
+    cloud = vol.app.cloud_interface
+    cloud.supports_volume_resize = True
+    cloud.resize_volume.return_value = True
+    sizes = iter([10 * 1024 ** 3, 20 * 1024 ** 3])
+    vol._get_device_size = lambda: next(sizes)
+    with mock.patch('cm.util.waiter.time.sleep'):
+        assert vol.resize(20)
+    cloud.resize_volume.assert_called_once_with('vol-1', 20)
+    assert vol.size == 20
+    # Shrinking is not possible
+    assert not vol.resize(15)
+    cloud.supports_volume_resize = False
+    assert not vol.resize(30)
@@ -0,0 +1,45 @@
+import time
+
+from cm.util.bunch import Bunch
+from cm.util.waiter import Waiter
+
+
+def _waiter(**kwargs):
+    waiter = Waiter(jitter=0, **kwargs)
+    waiter.delays = []
+    waiter.sleep = waiter.delays.append
+    return waiter
+
+
+def test_backoff():
+    waiter = _waiter(initial_delay=1, max_delay=5)
+    checks = iter([False] * 5 + [True])
+    assert waiter.wait(lambda: next(checks))
+    assert waiter.delays == [1, 2, 4, 5, 5]
+
+
+def test_deadline():
+    waiter = _waiter(timeout=0)
+    assert waiter.wait(lambda: False) is False
+    assert waiter.delays == []
+    parent = Waiter(timeout=10)
+    assert parent.child(60).deadline == parent.deadline
+    assert parent.child(1).deadline < parent.deadline
+    assert Waiter().child().deadline is None
+    assert 0 < _waiter(deadline=time.time() + 0.5).next_delay() <= 0.5
+
+
+def test_wait_for_many():
+    waiter = _waiter(initial_delay=1)
+    progress = {'snap-1': 2, 'snap-2': 1, 'snap-3': 3}
+    requests = []
+
+    def describe(ids):
+        requests.append(sorted(ids))
+        for snap_id in ids:
+            progress[snap_id] -= 1
+        return [Bunch(id=snap_id, done=progress[snap_id] <= 0) for snap_id in ids]
+    done = waiter.wait_for_many(progress.keys(), describe, lambda s: s.done)
+    assert sorted(done.keys()) == ['snap-1', 'snap-2', 'snap-3']
+    assert requests == [['snap-1', 'snap-2', 'snap-3'], ['snap-1', 'snap-3'], ['snap-3']]
+    assert waiter.delays == [1, 2]
@@ -0,0 +1,45 @@
+import datetime as dt
+
+import mock
+
+from cm.util import protocol
+from cm.util.worker import ConsoleMonitor
+
+from test_utils import TestApp
+
+
+def _monitor():
+    app = TestApp(ud={'master_ip': '10.0.0.1'})
+    app.TESTFLAG = True  # Do not connect to AMQP
+    app.cloud_interface.get_instance_id = lambda: 'i-123'
+    monitor = ConsoleMonitor(app)
+    monitor.conn = mock.Mock()
+    monitor.master_protocol_version = protocol.PROTOCOL_VERSION
+    return monitor
+
+
+def _sent(monitor):
+    return [(c[0][0], c[0][1]) for c in monitor.conn.send_message.call_args_list]
+
+
+def test_heartbeat_backoff():
+    monitor = _monitor()
+    monitor.send_heartbeat()
+    # Nothing is sent before the announced interval has passed
+    monitor.send_heartbeat()
+    assert _sent(monitor) == [('HEARTBEAT', {'interval': 20})]
+    for _ in range(4):
+        monitor.last_msg_time -= dt.timedelta(seconds=monitor.heartbeat_interval)
+        monitor.send_heartbeat()
+    assert [p['interval'] for (_, p) in _sent(monitor)] == [20, 40, 60, 60, 60]
+
+
+@mock.patch('cm.util.misc.get_load_average', return_value='1.00 0.50 0.20')
+def test_status_change_resets_heartbeat(load):
+    monitor = _monitor()
+    monitor.app.manager = mock.Mock(**dict((f, 0) for f in protocol.NODE_STATUS_FIELDS))
+    monitor.heartbeat_interval = protocol.MAX_HEARTBEAT_INTERVAL
+    assert monitor.send_node_status()
+    assert monitor.heartbeat_interval == protocol.HEARTBEAT_INTERVAL
+    # Nothing changed since
+    assert not monitor.send_node_status()
@@ -0,0 +1,82 @@
+import mock
+
+from cm.util.worker_cache import WorkerCache
+
+
+def _cache():
+    config = {'galaxyIndices': {'mode': 'fscache', 'paths': []},
+              'galaxy': {'mode': 'rsync', 'paths': ['tool-data']}}
+    cache = WorkerCache(config, '/mnt/cache')
+    cache._start_cachefilesd = lambda: True
+    return cache
+
+
+def test_fscache_mount_options():
+    cache = _cache()
+    assert cache.get_config('galaxyIndices', ['galaxyIndices'])['mode'] == 'fscache'
+    assert cache.get_config('transient_nfs', ['TransientNFS']) is None
+    options = cache.get_mount_options('galaxyIndices', ['galaxyIndices'], 'nfs', 'vers=3')
+    assert options == 'vers=3,fsc'
+    assert cache.get_mount_options('galaxyIndices', ['galaxyIndices'], 'glusterfs', None) is None
+    assert cache.get_mount_options('transient_nfs', [], 'nfs', 'vers=3') == 'vers=3'
+    cache.mounted('galaxyIndices', ['galaxyIndices'], '/mnt/galaxyIndices', options)
+    assert cache.status == {'galaxyIndices': 'fscache'}
+
+
+@mock.patch('cm.util.worker_cache.run', return_value=True)
+@mock.patch('os.path.isdir', return_value=True)
+@mock.patch('os.path.exists', return_value=True)
+def test_rsync_stage(exists, isdir, run):
+    cache = _cache()
+    cache.stage('galaxy', '/mnt/galaxy', ['tool-data'])
+    assert cache.status == {'galaxy': 'rsync (1/1 staged)'}
+    assert cache.staged == {'/mnt/galaxy': ['/mnt/galaxy/tool-data']}
+    run.reset_mock()
+    cache.release('/mnt/galaxy')
+    assert run.call_args[0][0] == '/bin/umount -l /mnt/galaxy/tool-data'
+    assert cache.staged == {}
+
+
+@mock.patch('cm.util.worker_cache.run', return_value=True)
+@mock.patch('os.path.isdir', return_value=True)
+@mock.patch('os.path.exists', return_value=False)
+@mock.patch('os.makedirs', side_effect=OSError('No space left on device'))
+def test_rsync_stage_error(makedirs, exists, isdir, run):
+    cache = _cache()
+    cache.staging.add('/mnt/galaxy')
+    cache.stage('galaxy', '/mnt/galaxy', ['tool-data'])
+    assert cache.status == {'galaxy': 'error (0/1 staged)'}
+    assert cache.staged == {'/mnt/galaxy': []} and not cache.staging
+
+
+@mock.patch('cm.util.worker_cache.run', return_value=True)
+@mock.patch('os.path.isdir', return_value=True)
+@mock.patch('os.path.exists', return_value=True)
+def test_rsync_restage(exists, isdir, run):
+    cache = _cache()
+    cache.stage('galaxy', '/mnt/galaxy', ['tool-data'])
+    run.reset_mock()
+    # Staging again (i.e., on a new MOUNT message) refreshes the local copy
+    cache.stage('galaxy', '/mnt/galaxy', ['tool-data'])
+    assert [c[0][0] for c in run.call_args_list] == [
+        '/bin/umount -l /mnt/galaxy/tool-data',
+        '/usr/bin/rsync -a --delete /mnt/galaxy/tool-data/ /mnt/cache/galaxy/tool-data/',
+        '/bin/mount --bind /mnt/cache/galaxy/tool-data /mnt/galaxy/tool-data']
+    assert cache.staged == {'/mnt/galaxy': ['/mnt/galaxy/tool-data']}
+
+
+@mock.patch('cm.util.worker_cache.run', return_value=True)
+@mock.patch('os.path.isdir', return_value=True)
+@mock.patch('os.path.exists', return_value=True)
+def test_rsync_repeated_mount(exists, isdir, run):
+    cache = _cache()
+    cache.stage('galaxy', '/mnt/galaxy', ['tool-data'])
+    run.reset_mock()
+    with mock.patch('threading.Thread') as thread:
+        # A repeated MOUNT of an already mounted (and staged) path does not restage it
+        cache.mounted('galaxy', [], '/mnt/galaxy', None)
+        assert not thread.called
+        # ... unless the file system changed
+        cache.mounted('galaxy', [], '/mnt/galaxy', None, refresh=True)
+        assert thread.call_args[1]['target'] == cache.stage
+    assert not run.called